@@ -1,20 +1,225 @@
+import math
+import os
+import random
+import re
 import sqlite3
+import time
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 import logging
+import instrumentation
+from db_metadata import DIMENSION_TABLE_SCRIPT, dimension_options, read_dimensions, rebuild_dimensions
+from memory_snapshot import ANALYSIS_TABLES, get_snapshot, record_table_change
+from query_log import QueryLog, format_plan
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='data_loader.log', filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+EARTH_RADIUS_MILES = 3958.8
+# julianday() of 1970-01-01
+JULIAN_UNIX_EPOCH = 2440587.5
+
+# Filters that select individual listings rather than dropdown segments
+LISTING_FILTERS = ['bounding_box', 'center', 'radius_miles', 'search']
+
+SEARCH_COLUMNS = ['short_address', 'public_remarks', 'legal_desc']
+
+# SQLite virtual machine instructions between checks of a read's cancel event
+CANCEL_CHECK_STEPS = 1000
+
+# Entries are stored under their listing_details rowid, so a listing's entry is replaced by rowid
+SEARCH_INDEX_SCRIPT = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS listing_search USING fts5(
+    listing_number UNINDEXED, short_address, public_remarks, legal_desc,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4'
+);
+'''
+
+# R*Tree over location coordinates, keyed by location.rowid and kept in sync by triggers
+SPATIAL_INDEX_SCRIPT = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS location_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+CREATE TRIGGER IF NOT EXISTS location_rtree_insert AFTER INSERT ON location
+WHEN NEW.geo_lat IS NOT NULL AND NEW.geo_lon IS NOT NULL
+BEGIN
+    INSERT INTO location_rtree VALUES (NEW.rowid, NEW.geo_lat, NEW.geo_lat, NEW.geo_lon, NEW.geo_lon);
+END;
+CREATE TRIGGER IF NOT EXISTS location_rtree_update AFTER UPDATE OF geo_lat, geo_lon ON location
+BEGIN
+    DELETE FROM location_rtree WHERE id = OLD.rowid;
+    INSERT INTO location_rtree SELECT NEW.rowid, NEW.geo_lat, NEW.geo_lat, NEW.geo_lon, NEW.geo_lon
+    WHERE NEW.geo_lat IS NOT NULL AND NEW.geo_lon IS NOT NULL;
+END;
+CREATE TRIGGER IF NOT EXISTS location_rtree_delete AFTER DELETE ON location
+BEGIN
+    DELETE FROM location_rtree WHERE id = OLD.rowid;
+END;
+'''
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles between two points given in degrees."""
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+def db_span(operation, sql=None, **args):
+    """Span for one database call, with its SQL collapsed onto one line."""
+    if not instrumentation.is_enabled():
+        return instrumentation.span(operation)
+    if sql is not None:
+        args['sql'] = ' '.join(sql.split())
+    return instrumentation.span(operation, category='sql', **args)
+
+def sql_rows(df):
+    """Rows of `df` as Python values for executemany, with dates as SQLite text and missing values as None."""
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+    values = df.astype(object)
+    values = values.where(values.notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+def sql_day(value):
+    """A date filter value (string, date or Timestamp) as the 'YYYY-MM-DD' text SQLite compares with."""
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+def sweep_snapshot_counts(changes, group_columns, as_of_dates):
+    """
+    Turn per-day count changes (`group_columns`, julian `day`, `active`, `pending`) into the
+    running counts at each of `as_of_dates`, one row per date and group with a non-zero count.
+    """
+    as_of_dates = sorted(set(as_of_dates))
+    as_of_days = pd.to_datetime(pd.Series(as_of_dates)).to_numpy().astype('datetime64[D]').astype(np.int64)
+    num_dates = len(as_of_dates)
+    empty = pd.DataFrame({'as_of': as_of_dates, 'active_inventory': 0, 'pending_listings': 0})
+    for column in group_columns:
+        empty[column] = None
+    changes = changes[changes['day'].notna()] if len(changes) else changes
+    if not len(changes):
+        return empty
+
+    # A change applies from the first snapshot date on or after its day
+    days = (changes['day'].to_numpy(dtype=np.float64) - JULIAN_UNIX_EPOCH).astype(np.int64)
+    bucket = np.searchsorted(as_of_days, days, side='left')
+    if group_columns:
+        group = changes.groupby(group_columns, dropna=False, sort=False).ngroup().to_numpy()
+    else:
+        group = np.zeros(len(changes), dtype=np.int64)
+    in_range = bucket < num_dates
+    group, bucket = group[in_range], bucket[in_range]
+    deltas = changes[['active', 'pending']].to_numpy(dtype=np.int64)[in_range]
+    if not len(group):
+        return empty
+
+    # Per group, the snapshot buckets from its first change to its last, or to the last date if
+    # its counts never return to zero, laid end to end and summed within each group
+    key = group * (num_dates + 1) + bucket
+    keys, inverse = np.unique(key, return_inverse=True)
+    summed = np.zeros((len(keys), 2), dtype=np.int64)
+    np.add.at(summed, inverse, deltas)
+    key_group, key_bucket = keys // (num_dates + 1), keys % (num_dates + 1)
+    group_ids, first = np.unique(key_group, return_index=True)
+    last = np.r_[first[1:], len(keys)] - 1
+    totals = np.add.reduceat(summed, first, axis=0)
+    end = np.where(totals.any(axis=1), num_dates - 1, key_bucket[last] - 1)
+    lengths = np.maximum(end - key_bucket[first] + 1, 0)
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+
+    cells = np.zeros((int(lengths.sum()), 2), dtype=np.int64)
+    group_position = np.searchsorted(group_ids, key_group)
+    inside = key_bucket <= end[group_position]
+    cells[(offsets[group_position] + key_bucket - key_bucket[first][group_position])[inside]] = summed[inside]
+    running = np.cumsum(cells, axis=0)
+    before = np.vstack([np.zeros((1, 2), dtype=np.int64), running])[offsets]
+    counts = running - np.repeat(before, lengths, axis=0)
+    cell_group = np.repeat(group_ids, lengths)
+    cell_bucket = np.repeat(key_bucket[first], lengths) + np.arange(len(counts)) - np.repeat(offsets, lengths)
+
+    counted = counts.any(axis=1)
+    result = pd.DataFrame({
+        'as_of': pd.Series(as_of_dates).iloc[cell_bucket[counted]].to_numpy(),
+        'active_inventory': counts[counted, 0],
+        'pending_listings': counts[counted, 1]
+    })
+    if group_columns:
+        first_rows = np.unique(group, return_index=True)
+        labels = changes.loc[in_range, group_columns].iloc[first_rows[1]].reset_index(drop=True)
+        labels.index = first_rows[0]
+        labels = labels.loc[cell_group[counted]].reset_index(drop=True)
+        for column in group_columns:
+            result[column] = labels[column]
+    missing = empty[~empty['as_of'].isin(set(result['as_of']))]
+    if not len(missing):
+        return result
+    return pd.concat([result, missing.astype({column: result[column].dtype for column in group_columns})],
+                     ignore_index=True)
+
+def record_rows(operation, rows):
+    instrumentation.increment('sql_rows_total', rows, operation=operation)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection remembering how long it took to open, charged to its first tracked statement."""
+    connect_seconds = 0.0
+
+class QueryTracker:
+    __slots__ = ('rows',)
+
+    def __init__(self, rows=None):
+        self.rows = rows
+
+def build_search_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match and the last word may be a prefix.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    words = re.findall(r"\w+", str(text).lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+def radius_bounding_box(lat, lon, radius_miles):
+    """Return (min_lat, min_lon, max_lat, max_lon) enclosing a circle on the sphere."""
+    angle = radius_miles / EARTH_RADIUS_MILES
+    min_lat = lat - math.degrees(angle)
+    max_lat = lat + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90 or angle >= math.pi / 2:
+        # The circle contains a pole, so every longitude is within range
+        return max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0
+    delta_lon = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    return min_lat, lon - delta_lon, max_lat, lon + delta_lon
 
 class DataLoader:
-    def __init__(self, db_file):
+    def __init__(self, db_file, query_log=None, in_memory=False, columnar=False):
+        """
+        With `in_memory`, reads are served from a MemorySnapshot shared by the process's loaders:
+        True copies the whole database, 'analysis' the ANALYSIS_TABLES, and a dict maps the
+        tables to copy to their columns (None for all). It is loaded on the first read.
+
+        With `columnar`, fetch_filtered_data reads the database's ColumnarSnapshot when it is
+        current, returning dates as datetimes; see export_columnar_snapshot.
+        """
         self.db_file = db_file
+        self.query_log = query_log if query_log is not None else QueryLog()
+        self.in_memory = in_memory
+        self.snapshot = None
+        self.columnar = columnar
+        self.columnar_snapshot = None
+        self.search_index_keyed = False
         logging.info("DataLoader initialized with database file: %s", db_file)
 
-    def create_connection(self):
-        """Create and return a database connection."""
+    def create_connection(self, snapshot=None):
+        """Create and return a database connection, to `snapshot` instead of the file if given."""
         try:
-            conn = sqlite3.connect(self.db_file)
+            started = time.perf_counter()
+            if snapshot is not None:
+                conn = snapshot.connect(factory=TimedConnection)
+            else:
+                conn = sqlite3.connect(self.db_file, factory=TimedConnection)
+            conn.connect_seconds = time.perf_counter() - started
+            conn.create_function("haversine_miles", 4, haversine_miles, deterministic=True)
             logging.info("Database connection successfully created.")
             return conn
         except Exception as e:
@@ -30,6 +235,164 @@ class DataLoader:
         except Exception as e:
             logging.error("Failed to close database connection: %s", e)
 
+    @contextmanager
+    def track_query(self, conn, operation, sql, params=None, rows=None, **args):
+        """
+        Time one statement on `conn` for the instrumentation span and the query log.
+
+        Set `rows` on the yielded tracker when the count is only known afterwards. The time spent
+        opening `conn` is reported as the connection wait of its first tracked statement, and slow
+        reads get their query plan captured on the same connection.
+        """
+        tracker = QueryTracker(rows)
+        num_params = len(params or [])
+        wait_seconds = conn.connect_seconds
+        conn.connect_seconds = 0.0
+        error = None
+        started = time.perf_counter()
+        try:
+            with db_span(operation, sql, params=num_params, **args) as span:
+                yield tracker
+                span.set(rows=tracker.rows)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            plan = None
+            if error is None and self.query_log.is_slow(seconds):
+                plan = self.explain_query_plan(conn, sql, params)
+            self.query_log.record(operation, sql, num_params, tracker.rows, seconds, wait_seconds, plan, error)
+            if error is None and tracker.rows is not None:
+                record_rows(operation, tracker.rows)
+
+    def explain_query_plan(self, conn, sql, params=None):
+        """Return the EXPLAIN QUERY PLAN tree of a SELECT statement, or None."""
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        try:
+            return format_plan(conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or []).fetchall())
+        except Exception as e:
+            logging.error(f"Failed to explain slow query: {e}")
+            return None
+
+    def dump_query_log(self, path=None):
+        """Return the query registry (per-fingerprint stats, recent and slow statements), optionally saving it as JSON."""
+        return self.query_log.dump(path)
+
+    def get_data_version(self):
+        """
+        Return the database's data version, or None if it cannot be read.
+
+        The version is kept in SQLite's `user_version` header field and is incremented by every
+        write made through DataLoader, so caches can tell when their results are stale. With an
+        in-memory snapshot it is the version the snapshot holds, so results match their version.
+        """
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            snapshot.refresh_if_stale()
+            return snapshot.data_version
+        conn = self.create_connection()
+        if conn is None:
+            return None
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        except Exception as e:
+            logging.error(f"Failed to read the data version: {e}")
+            return None
+        finally:
+            self.close_connection(conn)
+
+    def get_database_id(self):
+        """
+        Return '<resolved path>#<creation nonce>' identifying this database file, or None.
+
+        The nonce is set by create_database in SQLite's `application_id` header field; databases
+        created before it was set report 0.
+        """
+        conn = self.create_connection()
+        if conn is None:
+            return None
+        try:
+            return f"{os.path.realpath(self.db_file)}#{conn.execute('PRAGMA application_id').fetchone()[0]}"
+        except Exception as e:
+            logging.error(f"Failed to read the database id: {e}")
+            return None
+        finally:
+            self.close_connection(conn)
+
+    def bump_data_version(self, conn, table=None, appended=False):
+        """
+        Increment the data version as part of the write on `conn`.
+
+        The written `table`, and whether rows were only `appended` to it, are recorded so
+        in-memory snapshots can copy just what changed; None means any table may have changed.
+        """
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.execute(f"PRAGMA user_version = {version + 1}")
+        record_table_change(conn, version + 1, table, appended)
+
+    def get_snapshot(self):
+        """Return the in-memory snapshot serving this loader's reads, loading it on first use, or None."""
+        if self.snapshot is None and self.in_memory:
+            tables = None if self.in_memory is True else ANALYSIS_TABLES if self.in_memory == 'analysis' else self.in_memory
+            self.snapshot = get_snapshot(self.db_file, tables)
+        return self.snapshot
+
+    def get_columnar_snapshot(self):
+        """Return the database's columnar snapshot if it is at the current data version, or None."""
+        if self.columnar_snapshot is None:
+            from columnar_snapshot import ColumnarSnapshot
+            self.columnar_snapshot = ColumnarSnapshot(self.db_file)
+        data_version = self.get_data_version()
+        if self.columnar_snapshot.data_version != data_version:
+            # Another process may have updated it since the manifest was read
+            self.columnar_snapshot.load_manifest()
+        if self.columnar_snapshot.data_version is None or self.columnar_snapshot.data_version != data_version:
+            return None
+        return self.columnar_snapshot
+
+    def export_columnar_snapshot(self):
+        """Build the columnar snapshot of the joined listing view next to the database; returns its manifest or None."""
+        from columnar_snapshot import ColumnarSnapshot
+        self.columnar_snapshot = ColumnarSnapshot(self.db_file)
+        return self.columnar_snapshot.build(self)
+
+    def update_columnar_snapshot(self):
+        """After an ingest, bring the columnar snapshot up to date if the database has one; returns its manifest or None."""
+        try:
+            from columnar_snapshot import ColumnarSnapshot, snapshot_exists
+        except ImportError:
+            # Without pyarrow there is no snapshot to maintain
+            return None
+        if not snapshot_exists(self.db_file):
+            return None
+        if self.columnar_snapshot is None:
+            self.columnar_snapshot = ColumnarSnapshot(self.db_file)
+        return self.columnar_snapshot.update(self)
+
+    def get_snapshot_stats(self):
+        """Memory footprint, load and refresh times of the in-memory snapshot, or None until it is loaded."""
+        return self.snapshot.get_stats() if self.snapshot is not None else None
+
+    def sync_spatial_index(self, conn):
+        """
+        Create the location R*Tree and its triggers on `conn`, rebuilding the index if needed.
+
+        Replacing the location table drops its triggers, so a missing trigger means the index
+        may be stale and it is repopulated from the table.
+        """
+        has_triggers = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'location_rtree_%'").fetchone()[0] == 3
+        if not has_triggers:
+            conn.executescript(SPATIAL_INDEX_SCRIPT)
+            conn.execute("DELETE FROM location_rtree")
+            conn.execute('''
+            INSERT INTO location_rtree
+            SELECT rowid, geo_lat, geo_lat, geo_lon, geo_lon FROM location
+            WHERE geo_lat IS NOT NULL AND geo_lon IS NOT NULL''')
+            logging.info("Location spatial index rebuilt.")
+
     def create_database(self):
         """Create the database and initialize tables with predefined schemas."""
         conn = self.create_connection()
@@ -111,6 +474,14 @@ class DataLoader:
                     ttl_units_in_complex INTEGER
                 );
                 ''')
+                conn.executescript(SEARCH_INDEX_SCRIPT)
+                conn.executescript(DIMENSION_TABLE_SCRIPT)
+                self.sync_spatial_index(conn)
+                if not conn.execute("PRAGMA application_id").fetchone()[0]:
+                    # A creation nonce, so a database recreated at the same path and data version is
+                    # told apart from the one it replaced
+                    conn.execute(f"PRAGMA application_id = {random.randint(1, 2 ** 31 - 1)}")
+                conn.commit()
                 logging.info("Database and tables created successfully.")
             except Exception as e:
                 logging.error(f"An error occurred creating the database: {e}")
@@ -123,11 +494,14 @@ class DataLoader:
         if conn is not None:
             try:
                 cursor = conn.cursor()
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
+                with self.track_query(conn, 'execute', query, params) as tracker:
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    tracker.rows = cursor.rowcount
                 if commit:
+                    self.bump_data_version(conn)
                     conn.commit()
                     logging.info("Query executed and changes committed.")
                 return cursor
@@ -138,17 +512,68 @@ class DataLoader:
                 self.close_connection(conn)
 
     def insert_data(self, df, table_name):
-        """Insert cleaned data into the specified table."""
+        """Insert cleaned data into the specified table; returns the number of rows written, or None on failure."""
         conn = self.create_connection()
         if conn is not None:
             try:
-                df.to_sql(table_name, conn, if_exists='append', index=False)
+                with self.track_query(conn, 'insert', f"INSERT INTO {table_name}", rows=len(df), table=table_name):
+                    df.to_sql(table_name, conn, if_exists='append', index=False)
+                    if table_name == 'location':
+                        self.sync_spatial_index(conn)
+                    self.bump_data_version(conn, table_name, appended=True)
+                    conn.commit()
                 logging.info(f"Data inserted successfully into {table_name}.")
+                return len(df)
             except Exception as e:
                 logging.error(f"An error occurred inserting data into {table_name}: {e}")
             finally:
                 self.close_connection(conn)
 
+    def insert_listings(self, frames, search_df=None):
+        """
+        Insert `frames` ({table: DataFrame}) and index the listings of `search_df` in one transaction.
+
+        Listings already in a table are updated in place, so re-ingesting an overlapping export
+        keeps one row per listing. Returns the rows written per table, 'listing_search' included,
+        and of those the rows that updated an existing listing. On any error nothing is written
+        and the error is raised.
+        """
+        conn = self.create_connection()
+        if conn is None:
+            raise sqlite3.OperationalError(f"Could not connect to {self.db_file}")
+        try:
+            # Both may run a script, which commits, so they come before the first insert
+            if 'location' in frames:
+                self.sync_spatial_index(conn)
+            if search_df is not None:
+                conn.executescript(SEARCH_INDEX_SCRIPT)
+            written, updated = {}, {}
+            for table_name, df in frames.items():
+                # pandas' to_sql commits, so rows are inserted directly to keep one transaction
+                columns = list(df.columns)
+                assignments = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'listing_number')
+                sql = (f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                       f"ON CONFLICT (listing_number) DO {f'UPDATE SET {assignments}' if assignments else 'NOTHING'}")
+                # Updates keep their rowid, so the rows beyond the last rowid are the inserted ones
+                last_rowid = conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+                with self.track_query(conn, 'insert', sql, rows=len(df), table=table_name):
+                    written[table_name] = conn.executemany(sql, sql_rows(df)).rowcount
+                inserted = conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {table_name}").fetchone()[0] - last_rowid
+                updated[table_name] = written[table_name] - inserted
+                self.bump_data_version(conn, table_name, appended=not updated[table_name])
+            if search_df is not None:
+                written['listing_search'], updated['listing_search'] = self.write_search_index(conn, search_df)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.close_connection(conn)
+        if search_df is not None:
+            self.search_index_keyed = True
+        logging.info(f"Listings written: {written}; updates of existing listings: {updated}.")
+        return written, updated
+
     def update_data(self, df, table_name, condition):
         """Update data in the specified table based on a condition."""
         conn = self.create_connection()
@@ -156,8 +581,10 @@ class DataLoader:
             try:
                 set_clause = ', '.join([f"{col} = ?" for col in df.columns])
                 sql = f"UPDATE {table_name} SET {set_clause} WHERE {condition}"
-                for _, row in df.iterrows():
-                    conn.execute(sql, tuple(row))
+                with self.track_query(conn, 'update', sql, list(df.columns), rows=len(df), table=table_name):
+                    for _, row in df.iterrows():
+                        conn.execute(sql, tuple(row))
+                self.bump_data_version(conn, table_name)
                 conn.commit()
                 logging.info(f"Data updated successfully in {table_name}.")
             except Exception as e:
@@ -216,24 +643,56 @@ class DataLoader:
         conn = self.create_connection()
         if conn is not None:
             try:
-                df[columns].to_sql(table_name, conn, if_exists='replace', index=False)
+                with self.track_query(conn, 'replace', f"REPLACE TABLE {table_name}", rows=len(df), table=table_name):
+                    df[columns].to_sql(table_name, conn, if_exists='replace', index=False)
+                    if table_name == 'location':
+                        self.sync_spatial_index(conn)
+                    self.bump_data_version(conn, table_name)
+                    conn.commit()
                 logging.info(f"Data exported to {table_name} successfully.")
             except Exception as e:
                 logging.error(f"An error occurred exporting data to {table_name}: {e}")
             finally:
                 self.close_connection(conn)
 
-    def execute_read_query(self, query, params=None):
-        """Execute a SQL read query and return the results as a DataFrame."""
-        conn = self.create_connection()
+    def execute_read_query(self, query, params=None, cancel_event=None):
+        """
+        Execute a SQL read query and return the results as a DataFrame.
+
+        Setting `cancel_event` (a threading.Event) from another thread interrupts the query,
+        which then returns an empty DataFrame. With an in-memory snapshot the query runs there,
+        falling back to the file if the snapshot lacks a table or column it reads.
+        """
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            snapshot.refresh_if_stale()
+            with snapshot.reading():
+                df = self.run_read_query(self.create_connection(snapshot), query, params, cancel_event, snapshot=True)
+            if df is not None:
+                return df
+            logging.info("Snapshot lacks a table or column the query reads; reading the database file.")
+        return self.run_read_query(self.create_connection(), query, params, cancel_event)
+
+    def run_read_query(self, conn, query, params=None, cancel_event=None, snapshot=False):
+        """Run a read on `conn` and close it; returns None for a snapshot missing a table or column."""
         if conn is None:
             logging.error("Failed to establish connection for query execution.")
             return pd.DataFrame()
+        if cancel_event is not None:
+            # A non-zero return aborts the running statement with "interrupted"
+            conn.set_progress_handler(cancel_event.is_set, CANCEL_CHECK_STEPS)
         try:
-            df = pd.read_sql_query(query, conn, params=params)
+            with self.track_query(conn, 'read', query, params, snapshot=snapshot) as tracker:
+                df = pd.read_sql_query(query, conn, params=params)
+                tracker.rows = len(df)
             return df
         except Exception as e:
-            logging.error(f"An error occurred during query execution: {e}")
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info("Read query cancelled.")
+            elif snapshot and ('no such table' in str(e) or 'no such column' in str(e)):
+                return None
+            else:
+                logging.error(f"An error occurred during query execution: {e}")
             return pd.DataFrame()
         finally:
             self.close_connection(conn)
@@ -247,8 +706,12 @@ class DataLoader:
         """Fetch data based on a SQL query and parameters."""
         return self.execute_read_query(query, params)
 
-    def fetch_filtered_data(self, params):
-        """Fetch filtered data based on user selections including date range."""
+    def fetch_filtered_data(self, params, columns=None, cancel_event=None):
+        """
+        Fetch filtered data based on user selections including date range, optionally limited to `columns`.
+
+        See execute_read_query for `cancel_event`.
+        """
         field_map = {
             "New Listings": [("listing_details", "listing_date")],
             "Closed Listings": [("listing_details", "sold_date")],
@@ -261,6 +724,31 @@ class DataLoader:
             "Month Supply of Inventory": [("listing_details", "listing_date"), ("listing_details", "sold_date")],
             "% of Cash Sales": [("listing_details", "sold_date"), ("listing_details", "terms_of_sale")]
         }
+        if self.columnar and not any(params.get(name) for name in LISTING_FILTERS):
+            snapshot = self.get_columnar_snapshot()
+            if snapshot is not None:
+                with instrumentation.span('columnar_read', category='snapshot') as span:
+                    df = snapshot.read(params, columns, cancel_event)
+                    span.set(rows=None if df is None else len(df))
+                if df is not None:
+                    record_rows('columnar_read', len(df))
+                    return df
+
+        where_clause, values = self.build_filter_clause(params)
+        select_list = ", ".join(columns) if columns else "*"
+
+        query = f"""
+        SELECT {select_list}
+        FROM listing_details
+        JOIN properties ON listing_details.listing_number = properties.listing_number
+        JOIN location ON listing_details.listing_number = location.listing_number
+        WHERE {where_clause}
+        """
+
+        return self.execute_read_query(query, values, cancel_event)
+
+    def build_filter_clause(self, params):
+        """Build the WHERE clause and values shared by the filtered listing queries."""
         conditions = []
         values = []
 
@@ -278,24 +766,299 @@ class DataLoader:
 
         if params.get('start_date'):
             conditions.append("listing_date >= ?")
-            values.append(params['start_date'])
+            values.append(sql_day(params['start_date']))
 
         if params.get('end_date'):
-            conditions.append("listing_date <= ?")
-            values.append(params['end_date'])
+            conditions.append("listing_date < date(?, '+1 day')")
+            values.append(sql_day(params['end_date']))
+
+        search_query = build_search_query(params['search']) if params.get('search') else None
+        if search_query:
+            conditions.append("listing_details.listing_number IN (SELECT listing_number FROM listing_search WHERE listing_search MATCH ?)")
+            values.append(search_query)
+
+        spatial_conditions, spatial_values = self.build_spatial_filter(params)
+        conditions.extend(spatial_conditions)
+        values.extend(spatial_values)
 
         where_clause = " AND ".join(conditions) if conditions else "1=1"
+        return where_clause, values
+
+    def build_spatial_filter(self, params):
+        """
+        Build conditions for the `bounding_box` and `center`/`radius_miles` filters.
+
+        `bounding_box` is (min_lat, min_lon, max_lat, max_lon) and `center` is (lat, lon). The
+        location R*Tree prefilters candidates by box, then coordinates are checked exactly.
+        """
+        conditions = []
+        values = []
+        boxes = []
+
+        if params.get('bounding_box'):
+            min_lat, min_lon, max_lat, max_lon = map(float, params['bounding_box'])
+            boxes.append((min_lat, min_lon, max_lat, max_lon))
+            conditions.append("geo_lat BETWEEN ? AND ? AND geo_lon BETWEEN ? AND ?")
+            values.extend([min_lat, max_lat, min_lon, max_lon])
+
+        if params.get('center') and params.get('radius_miles') is not None:
+            lat, lon = map(float, params['center'])
+            radius_miles = float(params['radius_miles'])
+            boxes.append(radius_bounding_box(lat, lon, radius_miles))
+            conditions.append("haversine_miles(geo_lat, geo_lon, ?, ?) <= ?")
+            values.extend([lat, lon, radius_miles])
+
+        # The R*Tree stores float32 boxes rounded outward, so it only narrows the candidates
+        prefilters = []
+        prefilter_values = []
+        for min_lat, min_lon, max_lat, max_lon in boxes:
+            prefilters.append('''location.rowid IN (
+                SELECT id FROM location_rtree
+                WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?)''')
+            prefilter_values.extend([min_lat, max_lat, min_lon, max_lon])
+
+        return prefilters + conditions, prefilter_values + values
+
+    def update_search_index(self, df):
+        """
+        Index the address, remarks and legal description of the listings in `df` for full-text search.
+
+        Listings already in the index are replaced, so re-ingesting a file keeps one entry per listing.
+        """
+        conn = self.create_connection()
+        if conn is not None:
+            try:
+                conn.executescript(SEARCH_INDEX_SCRIPT)
+                rows, _ = self.write_search_index(conn, df)
+                conn.commit()
+                self.search_index_keyed = True
+                logging.info(f"Search index updated for {rows} listings.")
+            except Exception as e:
+                logging.error(f"An error occurred updating the search index: {e}")
+            finally:
+                self.close_connection(conn)
+
+    def write_search_index(self, conn, df):
+        """
+        Replace the search entries of the listings in `df` on `conn` without committing.
+
+        Returns the entries written and, of those, the ones that replaced an entry.
+        """
+        columns = [column for column in SEARCH_COLUMNS if column in df.columns]
+        if 'listing_number' not in df.columns or not columns:
+            return 0, 0
+        text = df[['listing_number'] + columns].drop_duplicates('listing_number', keep='last')
+        text = text.reindex(columns=['listing_number'] + SEARCH_COLUMNS)
+        text[SEARCH_COLUMNS] = text[SEARCH_COLUMNS].astype(object).where(text[SEARCH_COLUMNS].notna(), None)
+        text[SEARCH_COLUMNS] = text[SEARCH_COLUMNS].replace({'nan': None, 'None': None})
+        rows = list(text.itertuples(index=False, name=None))
+
+        with self.track_query(conn, 'insert', "INSERT INTO listing_search", rows=len(rows), table='listing_search') as tracker:
+            if not self.search_index_keyed:
+                self.key_search_index(conn)
+            # listing_number is unindexed, so entries are replaced by rowid rather than scanned for
+            conn.execute("CREATE TEMP TABLE search_update (listing_number TEXT PRIMARY KEY, short_address, "
+                         "public_remarks, legal_desc)")
+            conn.executemany("INSERT OR REPLACE INTO search_update VALUES (?, ?, ?, ?)", rows)
+            replaced = conn.execute("""
+            DELETE FROM listing_search WHERE rowid IN (
+                SELECT listing_details.rowid FROM search_update JOIN listing_details USING (listing_number))
+            """).rowcount
+            written = conn.execute("""
+            INSERT INTO listing_search (rowid, listing_number, short_address, public_remarks, legal_desc)
+            SELECT listing_details.rowid, listing_number, short_address, public_remarks, legal_desc
+            FROM search_update JOIN listing_details USING (listing_number)
+            """).rowcount
+            conn.execute("DROP TABLE search_update")
+            tracker.rows = written
+        self.bump_data_version(conn, 'listing_search')
+        return written, replaced
+
+    def key_search_index(self, conn):
+        """
+        Move search entries not stored under their listing's rowid, as indexes built before entries
+        were keyed by rowid are, to that rowid. Entries of listings no longer in listing_details are
+        dropped; of duplicates the latest entry is kept. The caller commits.
+        """
+        misplaced = conn.execute("""
+        SELECT EXISTS (SELECT 1 FROM listing_search LEFT JOIN listing_details ON listing_details.rowid = listing_search.rowid
+                       WHERE listing_details.listing_number IS NOT listing_search.listing_number)
+        """).fetchone()[0]
+        if misplaced:
+            conn.execute("""
+            CREATE TEMP TABLE search_entries AS
+            SELECT listing_details.rowid AS id, listing_search.listing_number, short_address, public_remarks, legal_desc,
+                MAX(listing_search.rowid) AS latest
+            FROM listing_search JOIN listing_details ON listing_details.listing_number = listing_search.listing_number
+            GROUP BY listing_details.rowid
+            """)
+            conn.execute("DELETE FROM listing_search")
+            conn.execute("INSERT INTO listing_search (rowid, listing_number, short_address, public_remarks, legal_desc) "
+                         "SELECT id, listing_number, short_address, public_remarks, legal_desc FROM search_entries")
+            conn.execute("DROP TABLE search_entries")
+            logging.info("Search index entries re-keyed by listing rowid.")
+
+    def search_listings(self, text, params=None, limit=100):
+        """
+        Return listing numbers matching `text`, best match first, restricted by the usual filters.
+
+        The result has `listing_number` and `rank` (FTS5 bm25, lower is better) columns.
+        """
+        search_query = build_search_query(text)
+        if search_query is None:
+            return pd.DataFrame(columns=['listing_number', 'rank'])
+        where_clause, values = self.build_filter_clause(dict(params or {}, search=None))
 
         query = f"""
-        SELECT *
+        SELECT listing_search.listing_number, bm25(listing_search) AS rank
+        FROM listing_search
+        JOIN listing_details ON listing_search.listing_number = listing_details.listing_number
+        JOIN properties ON listing_details.listing_number = properties.listing_number
+        JOIN location ON listing_details.listing_number = location.listing_number
+        WHERE listing_search MATCH ?
+            AND {where_clause}
+        ORDER BY rank
+        LIMIT ?
+        """
+
+        return self.execute_read_query(query, [search_query] + values + [limit])
+
+    def fetch_monthly_aggregates(self, params, date_column, measures, lower_date=None, upper_date=None, group_by=None):
+        """
+        Aggregate the filtered listings inside SQLite, one row per calendar month of `date_column`.
+
+        `measures` maps output column names to SQL aggregate expressions and `group_by` optionally
+        maps extra output columns to grouping expressions. Only rows whose `date_column` falls
+        between `lower_date` and `upper_date` (inclusive, 'YYYY-MM-DD') are aggregated.
+        """
+        where_clause, values = self.build_filter_clause(params)
+        group_by = group_by or {}
+        select_groups = "".join(f"{expression} AS {name},\n            " for name, expression in group_by.items())
+        select_measures = ",\n            ".join(f"{expression} AS {name}" for name, expression in measures.items())
+        group_clause = ", ".join(list(group_by) + ["period"])
+
+        bounds = [f"{date_column} IS NOT NULL"]
+        if lower_date is not None:
+            bounds.append(f"{date_column} >= ?")
+            values.append(lower_date)
+        if upper_date is not None:
+            bounds.append(f"{date_column} < date(?, '+1 day')")
+            values.append(upper_date)
+        bounds_clause = " AND ".join(bounds)
+
+        query = f"""
+        SELECT {select_groups}strftime('%Y-%m', {date_column}) AS period,
+            {select_measures}
         FROM listing_details
         JOIN properties ON listing_details.listing_number = properties.listing_number
         JOIN location ON listing_details.listing_number = location.listing_number
         WHERE {where_clause}
+            AND {bounds_clause}
+        GROUP BY {group_clause}
+        ORDER BY {group_clause}
+        """
+
+        return self.execute_read_query(query, values)
+
+    def fetch_inventory_snapshots(self, params, as_of_dates, group_by=None):
+        """
+        Count active and pending listings at the end of each date in `as_of_dates` ('YYYY-MM-DD').
+
+        A listing is counted on the days after its listing date up to the day before its end of
+        listing, and is pending from its under contract date on. SQLite returns the days those
+        counts change, summed per day (and `group_by` group), and they are swept into running
+        counts per snapshot date, so the cost is linear in listings plus snapshot dates. Groups
+        without a counted listing are left out; a date without any gets one row of zero counts.
+        """
+        group_by = group_by or {}
+        columns = ['as_of'] + list(group_by) + ['active_inventory', 'pending_listings']
+        if not as_of_dates:
+            return pd.DataFrame(columns=columns)
+
+        where_clause, values = self.build_filter_clause(params)
+        filtered_groups = "".join(f"{expression} AS {name}, " for name, expression in group_by.items())
+        select_groups = "".join(f"{name}, " for name in group_by)
+        # Days as julian day numbers; a count changes on the first day it applies and the day after the last
+        query = f"""
+        WITH filtered AS MATERIALIZED (
+            SELECT {filtered_groups}
+                julianday(date(listing_date)) + 1 AS active_start,
+                MIN(julianday(date(end_of_listing_date)), COALESCE(julianday(date(under_contract_date)), 1e9)) AS active_end,
+                MAX(julianday(date(listing_date)) + 1, julianday(date(under_contract_date))) AS pending_start,
+                julianday(date(end_of_listing_date)) AS pending_end
+            FROM listing_details
+            JOIN properties ON listing_details.listing_number = properties.listing_number
+            JOIN location ON listing_details.listing_number = location.listing_number
+            WHERE {where_clause}
+                AND listing_date IS NOT NULL AND end_of_listing_date IS NOT NULL
+        ),
+        changes({select_groups}day, active, pending) AS (
+            SELECT {select_groups}active_start, 1, 0 FROM filtered WHERE active_end > active_start
+            UNION ALL SELECT {select_groups}active_end, -1, 0 FROM filtered WHERE active_end > active_start
+            UNION ALL SELECT {select_groups}pending_start, 0, 1 FROM filtered WHERE pending_end > pending_start
+            UNION ALL SELECT {select_groups}pending_end, 0, -1 FROM filtered WHERE pending_end > pending_start
+        )
+        SELECT {select_groups}day, SUM(active) AS active, SUM(pending) AS pending
+        FROM changes
+        GROUP BY {select_groups}day
+        """
+        changes = self.execute_read_query(query, values)
+        return sweep_snapshot_counts(changes, list(group_by), as_of_dates)[columns]
+
+    def fetch_sold_listing_features(self):
+        """Fetch the coordinates, sale and property features of every geocoded sold listing."""
+        query = """
+        SELECT listing_details.listing_number, sold_date, sold_price, geo_lat, geo_lon, city, subdivision, type,
+            short_address, sqft_living, total_bedrooms, baths_full, baths_half, private_pool, waterfront
+        FROM listing_details
+        JOIN properties ON listing_details.listing_number = properties.listing_number
+        JOIN location ON listing_details.listing_number = location.listing_number
+        LEFT JOIN property_features ON listing_details.listing_number = property_features.listing_number
+        WHERE sold_date IS NOT NULL AND geo_lat IS NOT NULL AND geo_lon IS NOT NULL
         """
+        return self.execute_read_query(query)
 
+    def fetch_parcel_sales(self, after_rowid=None):
+        """
+        Fetch every priced sale with its parcel and listing_details rowid as `sale_id`, optionally
+        only the sales of listings inserted after `after_rowid`.
+        """
+        query = """
+        SELECT listing_details.rowid AS sale_id, properties.parcel_id, sold_date, sold_price, city, subdivision
+        FROM listing_details
+        JOIN properties ON listing_details.listing_number = properties.listing_number
+        JOIN location ON listing_details.listing_number = location.listing_number
+        WHERE sold_date IS NOT NULL AND sold_price > 0 AND properties.parcel_id IS NOT NULL
+        """
+        values = []
+        if after_rowid is not None:
+            query += " AND listing_details.rowid > ?"
+            values.append(after_rowid)
+        # In insertion order, so sales of a parcel on the same day pair the same way every time
+        query += " ORDER BY listing_details.rowid"
         return self.execute_read_query(query, values)
 
+    def fetch_table_versions(self):
+        """
+        Return {table: (changed_version, rewritten_version)} as recorded by bump_data_version.
+
+        '*' stands for writes that may have touched any table. Databases without the bookkeeping
+        table return an empty dict.
+        """
+        conn = self.create_connection()
+        if conn is None:
+            return {}
+        try:
+            if not conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'table_versions'").fetchone()[0]:
+                return {}
+            return {name: (changed, rewritten) for name, changed, rewritten in
+                    conn.execute("SELECT name, changed_version, rewritten_version FROM table_versions")}
+        except Exception as e:
+            logging.error(f"Failed to read the table versions: {e}")
+            return {}
+        finally:
+            self.close_connection(conn)
+
     def get_min_max_dates(self, table_name):
         """Fetch the earliest and latest dates from the specified table."""
         query = f"SELECT MIN(listing_date) AS min_date, MAX(listing_date) AS max_date FROM {table_name}"
@@ -307,11 +1070,16 @@ class DataLoader:
         if conn is not None:
             try:
                 cursor = conn.cursor()
-                for start in range(0, len(df), batch_size):
-                    end = start + batch_size
-                    batch_data = df.iloc[start:end]
-                    batch_data.to_sql(table_name, conn, if_exists='append', index=False)
-                conn.commit()
+                with self.track_query(conn, 'insert', f"INSERT INTO {table_name}", rows=len(df),
+                                      table=table_name, batch_size=batch_size):
+                    for start in range(0, len(df), batch_size):
+                        end = start + batch_size
+                        batch_data = df.iloc[start:end]
+                        batch_data.to_sql(table_name, conn, if_exists='append', index=False)
+                    if table_name == 'location':
+                        self.sync_spatial_index(conn)
+                    self.bump_data_version(conn, table_name, appended=True)
+                    conn.commit()
                 logging.info(f"Batch data inserted successfully into {table_name}.")
             except Exception as e:
                 logging.error(f"An error occurred during batch data insertion into {table_name}: {e}")
@@ -324,9 +1092,11 @@ class DataLoader:
         if conn is not None:
             try:
                 cursor = conn.cursor()
-                for update in updates:
-                    sql, params = update
-                    cursor.execute(sql, params)
+                with self.track_query(conn, 'update', f"UPDATE {table_name} (batch)", rows=len(updates), table=table_name):
+                    for update in updates:
+                        sql, params = update
+                        cursor.execute(sql, params)
+                self.bump_data_version(conn, table_name)
                 conn.commit()
                 logging.info(f"Multiple records updated successfully in {table_name}.")
             except Exception as e:
@@ -340,7 +1110,9 @@ class DataLoader:
         if conn is not None:
             try:
                 sql = f"DELETE FROM {table_name} WHERE {condition}"
-                conn.execute(sql, params)
+                with self.track_query(conn, 'delete', sql, params, table=table_name) as tracker:
+                    tracker.rows = conn.execute(sql, params).rowcount
+                self.bump_data_version(conn, table_name)
                 conn.commit()
                 logging.info(f"Data deleted successfully from {table_name} based on condition: {condition}.")
             except Exception as e:
@@ -352,8 +1124,45 @@ class DataLoader:
         """Fetch unique building types for UI dropdown."""
         return self.fetch_unique_values('properties', 'type')
 
+    def update_dimension_dictionary(self):
+        """Recount the listings per city, subdivision and building type after an ingest."""
+        conn = self.create_connection()
+        if conn is not None:
+            try:
+                with self.track_query(conn, 'insert', "INSERT INTO dimension_dictionary", table='dimension_dictionary') as tracker:
+                    tracker.rows = len(rebuild_dimensions(conn))
+                    conn.commit()
+                logging.info(f"Dimension dictionary rebuilt with {tracker.rows} combinations.")
+            except Exception as e:
+                logging.error(f"An error occurred rebuilding the dimension dictionary: {e}")
+            finally:
+                self.close_connection(conn)
+
+    def get_dimension_dictionary(self):
+        """
+        Return the dimension dictionary as [city, subdivision, type, listings] rows, or [] on error.
+
+        Reading never writes: a dictionary older than the data version is returned until
+        finish_ingest rebuilds it. It is kept in memory per database while it is current.
+        """
+        conn = self.create_connection()
+        if conn is None:
+            return []
+        try:
+            return read_dimensions(conn)
+        except Exception as e:
+            logging.error(f"An error occurred reading the dimension dictionary: {e}")
+            return []
+        finally:
+            self.close_connection(conn)
+
+    def get_dimension_options(self, city=None, subdivision=None):
+        """Dropdown choices with listing counts, subdivisions narrowed by `city` and building types by both; see dimension_options."""
+        return dimension_options(self.get_dimension_dictionary(), city, subdivision)
+
 # Example usage
 if __name__ == "__main__":
+    instrumentation.configure_logging('data_loader.log', logging.DEBUG)
     db_path = 'path_to_your_database.db'
     data_loader = DataLoader(db_path)
 
@@ -1,14 +1,27 @@
 
+import time
+STARTED = time.perf_counter()
 import os
 import sys
 import logging
+import argparse
+import instrumentation
 from PyQt5.QtWidgets import (QApplication, QCheckBox, QMainWindow, QPushButton, QLineEdit,
                              QLabel, QFileDialog, QMessageBox, QVBoxLayout, QWidget,
-                             QRadioButton, QGridLayout, QComboBox, QDateEdit)
-from PyQt5.QtCore import QDate
-from Data_Loader import DataLoader
-from Clean_And_Process2 import process_and_load_data
-from data_analysis import analyze_real_estate_data
+                             QRadioButton, QGridLayout, QComboBox, QDateEdit, QProgressBar, QPlainTextEdit)
+from PyQt5.QtCore import QDate, QEvent, QObject, QThreadPool, QTimer
+# Data_Loader, analysis_cache and everything built on pandas are imported on first use so the
+# window can be shown before they load; ui_workers only imports them inside its workers
+from db_metadata import dimension_options
+from ui_workers import AnalysisWorker, IngestWorker, MetadataWorker, SeriesWorker
+from ui_chart import TimeSeriesChart
+
+# Quiet period after the last filter change before results are recomputed
+RECOMPUTE_DELAY_MS = 250
+# Per-period chart values kept in memory; twenty years of months for every statistic fit easily
+SERIES_CACHE_ENTRIES = 100000
+# Resolution of the ingest progress bar, which shows the fraction of the whole run done
+INGEST_PROGRESS_STEPS = 1000
 
 class DateRangePicker(QWidget):
     def __init__(self):
@@ -56,20 +69,44 @@ class RealEstateAnalysisUI(QMainWindow):
         "List to Sold Ratio": "list_price_to_sold_price_ratio",
         "Active Inventory": "active_inventory",
         "Month Supply of Inventory": "msi",
-        "% of Cash Sales": "percent_cash_sales"
+        "% of Cash Sales": "percent_cash_sales",
+        "Median Sold Price": "median_sold_price",
+        "Price Per Ft Percentiles": "sold_price_per_foot_percentiles",
+        "Days on Market Percentiles": "days_on_market_percentiles"
     }
 
-    def __init__(self):
+    def __init__(self, in_memory=False):
         super().__init__()
         self.title = "Real Estate Analysis Tool"
+        # Passed to the DataLoaders behind the analyses; see DataLoader
+        self.in_memory = in_memory
         self.left = 100
         self.top = 100
         self.width = 640
         self.height = 480
-        self.data_loader = DataLoader('path_to_database.db')
+        self.analysis_cache = None
+        self.thread_pool = QThreadPool.globalInstance()
+        self.analysis_worker = None
+        self.ingest_worker = None
+        self.metadata_worker = None
+        self.metadata_loaded_at = None
+        self.pending_analysis = None
+        self.recompute_timer = QTimer(self)
+        self.recompute_timer.setSingleShot(True)
+        self.recompute_timer.setInterval(RECOMPUTE_DELAY_MS)
+        self.recompute_timer.timeout.connect(self.recompute)
+        self.series_cache = None
+        self.series_worker = None
+        self.pending_series = None
+        self.series_frame = None
+        self.series_timer = QTimer(self)
+        self.series_timer.setSingleShot(True)
+        self.series_timer.setInterval(RECOMPUTE_DELAY_MS)
+        self.series_timer.timeout.connect(self.recompute_series_view)
         self.init_ui()
         self.init_dropdowns()
         self.setup_layout()
+        self.connect_live_updates()
 
     def init_ui(self):
         self.setWindowTitle(self.title)
@@ -79,10 +116,13 @@ class RealEstateAnalysisUI(QMainWindow):
         self.city_menu = QComboBox()
         self.subdivision_menu = QComboBox()
         self.type_menu = QComboBox()
-        self.city_menu.addItem("All")
-        self.subdivision_menu.addItem("All")
-        self.type_menu.addItem("All")
-        self.update_dropdowns()
+        for menu in (self.city_menu, self.subdivision_menu, self.type_menu):
+            menu.addItem("All", None)
+        # [city, subdivision, type, listings] rows of the database's dimension dictionary
+        self.dimensions = []
+        # Connected before the live updates, so the narrowed menus are in place when a recompute reads them
+        self.city_menu.currentIndexChanged.connect(self.update_dependent_dropdowns)
+        self.subdivision_menu.currentIndexChanged.connect(self.update_dependent_dropdowns)
 
     def setup_layout(self):
         main_layout = QVBoxLayout()
@@ -93,6 +133,8 @@ class RealEstateAnalysisUI(QMainWindow):
         self.setup_date_picker(main_layout)
         self.setup_statistic_checkboxes(main_layout)
         self.setup_analyze_button(main_layout)
+        self.setup_chart(main_layout)
+        self.setup_progress(main_layout)
         container = QWidget()
         container.setLayout(main_layout)
         self.setCentralWidget(container)
@@ -124,7 +166,7 @@ class RealEstateAnalysisUI(QMainWindow):
         layout.addWidget(self.csv_line_edit)
         layout.addWidget(self.select_csv_button)
 
-   def setup_process_button(self, layout):
+    def setup_process_button(self, layout):
         self.process_button = QPushButton("Process")
         self.process_button.clicked.connect(self.process_data)
         layout.addWidget(self.process_button)
@@ -137,201 +179,407 @@ class RealEstateAnalysisUI(QMainWindow):
         layout.addWidget(QLabel("Select Building Type:"))
         layout.addWidget(self.type_menu)
 
-   def setup_date_picker(self, layout):
-        result = self.data_loader.get_min_max_dates('listing_details')
-        if result is not None and not result.empty:
-            min_date = result.iloc[0]['min_date']
-            max_date = result.iloc[0]['max_date']
-            self.dateRangePicker = DateRangePicker()
-            self.dateRangePicker.set_dates(min_date, max_date)
-            layout.addWidget(self.dateRangePicker)
-        else:
-            logging.error("Failed to fetch date ranges or no data available.")
+    def setup_date_picker(self, layout):
+        self.dateRangePicker = DateRangePicker()
+        layout.addWidget(self.dateRangePicker)
 
+    def setup_statistic_checkboxes(self, layout):
+        grid = QGridLayout()
+        self.checkboxes = {}
+        for index, (stat_name, function_key) in enumerate(self.statistic_functions.items()):
+            checkbox = QCheckBox(stat_name)
+            self.checkboxes[function_key] = checkbox
+            grid.addWidget(checkbox, index // 2, index % 2)
+        layout.addLayout(grid)
 
     def setup_analyze_button(self, layout):
+        self.live_update_checkbox = QCheckBox("Update results as filters change")
+        self.live_update_checkbox.setChecked(True)
         self.analyze_button = QPushButton("Analyze")
         self.analyze_button.clicked.connect(self.perform_analysis)
+        self.results_view = QPlainTextEdit()
+        self.results_view.setReadOnly(True)
+        layout.addWidget(self.live_update_checkbox)
         layout.addWidget(self.analyze_button)
-
-    def display_results(self, results):
+        layout.addWidget(self.results_view)
+
+    def setup_chart(self, layout):
+        self.chart_series_menu = QComboBox()
+        self.chart_series_menu.currentIndexChanged.connect(self.show_chart_series)
+        self.chart = TimeSeriesChart()
+        self.chart.view_changed.connect(lambda start, end: self.series_timer.start())
+        layout.addWidget(QLabel("Chart (scroll to zoom, drag to pan):"))
+        layout.addWidget(self.chart_series_menu)
+        layout.addWidget(self.chart)
+
+    def setup_progress(self, layout):
+        self.status_label = QLabel("")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_workers)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.cancel_button)
+
+    def display_results(self, results, interactive=True):
         result_text = "\n".join([f"{key}: {value}" for key, value in results.items()])
-        QMessageBox.information(self, "Analysis Results", result_text)
+        self.results_view.setPlainText(result_text)
+        if interactive:
+            QMessageBox.information(self, "Analysis Results", result_text)
+
+    def gather_statistics_to_calculate(self):
+        stats_to_calculate = []
+        for stat_name, function_key in self.statistic_functions.items():
+            checkbox = self.checkboxes.get(function_key)
+            if checkbox and checkbox.isChecked():
+                stats_to_calculate.append(function_key)
+        return stats_to_calculate
 
- def fetch_and_prepare_data(self):
+    def build_analysis_params(self):
         if not self.db_line_edit.text():
             QMessageBox.warning(self, "Error", "Database path is not set.")
             return None
 
-        params = {
-            'city': self.city_menu.currentText() if self.city_menu.currentText() != "All" else None,
-            'subdivision': self.subdivision_menu.currentText() if self.subdivision_menu.currentText() != "All" else None,
-            'building_type': self.type_menu.currentText() if self.type_menu.currentText() != "All" else None,
+        range_type = self.dateRangePicker.rangeType.currentText()
+        return {
+            'city': self.city_menu.currentData(),
+            'subdivision': self.subdivision_menu.currentData(),
+            'building_type': self.type_menu.currentData(),
             'start_date': self.dateRangePicker.startDate.date().toString("yyyy-MM-dd"),
-            'end_date': self.dateRangePicker.endDate.date().toString("yyyy-MM-dd")
+            'end_date': self.dateRangePicker.endDate.date().toString("yyyy-MM-dd"),
+            # A custom range is broken down by month
+            'timeframe': 'monthly' if range_type == "Custom" else range_type.lower(),
+            'stats_to_calculate': self.gather_statistics_to_calculate()
         }
 
-        # Fetching the filtered data from the data loader
-        filtered_data = self.data_loader.fetch_filtered_data(params)
-
-        if filtered_data.empty:
-            QMessageBox.information(self,
-    def select_database(self):
-        db_filename, _ = QFileDialog.getOpenFileName(self, "Select Database File", "", "Database files (*.db)")
-        if db_filename:
-            self.db_line_edit.setText(db_filename)
-            self.data_loader = DataLoader(db_filename)
-            self.update_dropdowns()
-
-    def select_csv(self):
-        csv_file, _ = QFileDialog.getOpenFileName(self, "Open CSV File", "", "CSV files (*.csv)")
-        if csv_file:
-            self.csv_line_edit.setText(csv_file)
-
-    def update_dropdowns(self):
-        if self.db_line_edit.text():
-            self.data_loader = DataLoader(self.db_line_edit.text())
-            self.city_menu.addItems(['All'] + self.data_loader.fetch_unique_values('location', 'city'))
-            self.subdivision_menu.addItems(['All'] + self.data_loader.fetch_unique_values('location', 'subdivision'))
-            self.type_menu.addItems(['All'] + self.data_loader.fetch_unique_values('properties', 'type'))
-
-    def process_data(self):
-        db_filename = self.db_line_edit.text()
-        csv_filename = self.csv_line_edit.text()
-        if not db_filename or not csv_filename:
-            QMessageBox.warning(self, "Error", "Please select both database and CSV files.")
-            return
-
-        try:
-            # Assuming process_and_load_data takes a list of CSV files, database filename, and a boolean to create a new database
-            process_and_load_data([csv_filename], db_filename, self.create_db_radio.isChecked())
-            
-            # Update the date range picker after processing data
-            result = self.data_loader.get_min_max_dates('listing_details')
-            if result is not None and not result.empty:
-                min_date = result.iloc[0]['min_date']
-                max_date = result.iloc[0]['max_date']
-                self.dateRangePicker.set_dates(min_date, max_date)
-            QMessageBox.information(self, "Success", "Data cleaned and loaded into the database.")
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"Processing failed: {str(e)}")
-
     def perform_analysis(self):
-        filtered_data = self.fetch_and_prepare_data()
-        if filtered_data is None:
+        params = self.build_analysis_params()
+        if params is None:
+            return
+        if not params['stats_to_calculate']:
+            QMessageBox.information(self, "No Statistics", "Select at least one statistic to calculate.")
+            return
+        self.recompute_timer.stop()
+        self.start_analysis(params, interactive=True)
+        self.refresh_chart(params)
+
+    def connect_live_updates(self):
+        for menu in (self.city_menu, self.subdivision_menu, self.type_menu, self.dateRangePicker.rangeType):
+            menu.currentIndexChanged.connect(self.schedule_recompute)
+        for date_edit in (self.dateRangePicker.startDate, self.dateRangePicker.endDate):
+            date_edit.dateChanged.connect(self.schedule_recompute)
+        for checkbox in self.checkboxes.values():
+            checkbox.stateChanged.connect(self.schedule_recompute)
+
+    def schedule_recompute(self, *args):
+        """
+        Restart the debounce timer, so a burst of filter changes triggers one recompute. An
+        analysis still running is outdated now and is cancelled straight away.
+        """
+        if self.live_update_checkbox.isChecked() and self.db_line_edit.text():
+            for worker in (self.analysis_worker, self.series_worker):
+                if worker is not None:
+                    worker.cancel()
+            self.recompute_timer.start()
+
+    def recompute(self):
+        params = self.build_analysis_params()
+        if params is not None and params['stats_to_calculate']:
+            self.start_analysis(params, interactive=False)
+            self.refresh_chart(params)
+
+    def start_analysis(self, params, interactive):
+        # Only one analysis runs at a time. A newer request cancels the running one, which
+        # interrupts its query, and waits for it to finish; a request superseded meanwhile is dropped
+        if self.analysis_worker is not None:
+            self.pending_analysis = (params, interactive)
+            self.analysis_worker.cancel()
             return
 
-        stats_to_calculate = self.gather_statistics_to_calculate()
-
-        results = analyze_real_estate_data(filtered_data, {
-            'timeframe': self.dateRangePicker.rangeType.currentText().lower(),
-            'start_date': self.dateRangePicker.startDate.date().toString("yyyy-MM-dd"),
-            'end_date': self.dateRangePicker.endDate.date().toString("yyyy-MM-dd"),
-            'stats_to_calculate': stats_to_calculate
-        })
-
-        self.display_results(results)
-
-
-
-    def fetch_and_prepare_data(self):
-        if not self.db_line_edit.text():
-            QMessageBox.warning(self, "Error", "Database path is not set.")
-            return None
-
-        params = {
-            'city': self.city_menu.currentText() if self.city_menu.currentText() != "All" else,
-            'subdivision': self.subdivision_menu.currentText() if self.subdivision_menu.currentText() != "All" else None,
-            'building_type': self.type_menu.currentText() if self.type_menu.currentText() != "All" else None,
-            'start_date': self.dateRangePicker.startDate.date().toString("yyyy-MM-dd"),
-            'end_date': self.dateRangePicker.endDate.date().toString("yyyy-MM-dd")
-        }
-
-        # Fetching the filtered data from the data loader
-        filtered_data = self.data_loader.fetch_filtered_data(params)
-
-        if filtered_data.empty:
-            QMessageBox.information(self, "No Data", "No data matches the selected criteria.")
-            return None
-
-        return filtered_data
-
-
-       def gather_statistics_to_calculate(self):
-        stats_to_calculate = []
-        for stat_name, function_key in self.statistic_functions.items():
-            checkbox = self.checkboxes.get(function_key)
-            if checkbox and checkbox.isChecked():
-                stats_to_calculate.append(function_key)
-        return stats_to_calculate
-
-    def perform_analysis(self):
-        filtered_data = self.fetch_and_prepare_data()
-        if filtered_data is None:
+        worker = AnalysisWorker(self.get_analysis_cache(), params, interactive)
+        worker.signals.progress.connect(self.show_analysis_progress)
+        worker.signals.result.connect(lambda results: self.analysis_finished(results, interactive))
+        worker.signals.error.connect(lambda message: QMessageBox.warning(self, "Error", f"Analysis failed: {message}"))
+        worker.signals.cancelled.connect(lambda: self.status_label.setText("Analysis cancelled."))
+        worker.signals.finished.connect(self.analysis_worker_finished)
+        self.analysis_worker = worker
+        self.start_progress("Fetching listings...", len(params['stats_to_calculate']))
+        self.thread_pool.start(worker)
+
+    def show_analysis_progress(self, progress):
+        if progress['stage'] == 'fetch':
+            self.status_label.setText("Fetching listings...")
+        else:
+            self.status_label.setText(f"Statistics done: {progress['done']} of {progress['total']}")
+        self.progress_bar.setValue(progress['done'])
+
+    def analysis_finished(self, results, interactive=True):
+        if results is None:
+            self.status_label.setText("")
+            self.results_view.setPlainText("No data matches the selected criteria.")
+            if interactive:
+                QMessageBox.information(self, "No Data", "No data matches the selected criteria.")
+            return
+        self.status_label.setText("Analysis complete.")
+        self.display_results(results, interactive)
+
+    def analysis_worker_finished(self):
+        self.analysis_worker = None
+        if self.pending_analysis is not None:
+            params, interactive = self.pending_analysis
+            self.pending_analysis = None
+            self.start_analysis(params, interactive)
             return
+        self.stop_progress()
 
-        stats_to_calculate = self.gather_statistics_to_calculate()
+    def refresh_chart(self, params):
+        """Chart the selected range, replacing any zoom or pan."""
+        self.series_timer.stop()
+        self.chart.set_view(self.dateRangePicker.startDate.date(), self.dateRangePicker.endDate.date())
+        self.start_series(params, params['start_date'], params['end_date'])
 
-        params = {
-            'timeframe': self.dateRangePicker.rangeType.currentText().lower(),
-            'start_date': self.dateRangePicker.startDate.date().toString("yyyy-MM-dd"),
-            'end_date': self.dateRangePicker.endDate.date().toString("yyyy-MM-dd"),
-            'stats_to_calculate': stats_to_calculate
-        }
+    def recompute_series_view(self):
+        """Compute the series for the range the chart was zoomed or panned to."""
+        if not self.db_line_edit.text() or not self.gather_statistics_to_calculate():
+            return
+        start, end = self.chart.visible_range()
+        self.start_series(self.build_analysis_params(), start.toString("yyyy-MM-dd"), end.toString("yyyy-MM-dd"))
+
+    def start_series(self, params, start_date, end_date):
+        # As with analyses, one series computation runs at a time and only the newest waits
+        if self.series_worker is not None:
+            self.pending_series = (params, start_date, end_date)
+            self.series_worker.cancel()
+            return
 
-        results = analyze_real_estate_data(filtered_data, params)
+        worker = SeriesWorker(self.get_series_cache(), params, start_date, end_date)
+        worker.signals.result.connect(self.series_finished)
+        worker.signals.error.connect(lambda message: self.status_label.setText(f"Chart failed: {message}"))
+        worker.signals.finished.connect(self.series_worker_finished)
+        self.series_worker = worker
+        self.thread_pool.start(worker)
+
+    def series_finished(self, frame):
+        self.series_frame = frame
+        current = self.chart_series_menu.currentText()
+        self.chart_series_menu.blockSignals(True)
+        self.chart_series_menu.clear()
+        self.chart_series_menu.addItems(list(frame.columns))
+        if current in frame.columns:
+            self.chart_series_menu.setCurrentText(current)
+        self.chart_series_menu.blockSignals(False)
+        self.show_chart_series()
+
+    def show_chart_series(self, *args):
+        name = self.chart_series_menu.currentText()
+        if self.series_frame is None or name not in self.series_frame.columns:
+            return
+        days = self.series_frame.index.to_numpy().astype('datetime64[D]').astype('int64')
+        self.chart.set_series(days, self.series_frame[name].to_numpy())
 
-        self.display_results(results)
+    def series_worker_finished(self):
+        self.series_worker = None
+        if self.pending_series is not None:
+            pending = self.pending_series
+            self.pending_series = None
+            self.start_series(*pending)
 
     def process_data(self):
+        if self.ingest_worker is not None:
+            return
         db_filename = self.db_line_edit.text()
         csv_filename = self.csv_line_edit.text()
         if not db_filename or not csv_filename:
             QMessageBox.warning(self, "Error", "Please select both database and CSV files.")
             return
 
-        try:
-            process_and_load_data([csv_filename], db_filename, self.create_db_radio.isChecked())
-            
-            # Update the date range picker after processing data
-            result = self.data_loader.get_min_max_dates('listing_details')
-            if result is not None and not result.empty:
-                min_date = result.iloc[0]['min_date']
-                max_date = result.iloc[0]['max_date']
-                self.dateRangePicker.set_dates(min_date, max_date)
-            QMessageBox.information(self, "Success", "Data cleaned and loaded into the database.")
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"Processing failed: {str(e)}")
+        worker = IngestWorker([csv_filename], db_filename, self.create_db_radio.isChecked())
+        worker.signals.progress.connect(self.show_ingest_progress)
+        worker.signals.result.connect(self.ingest_finished)
+        worker.signals.error.connect(lambda message: QMessageBox.warning(self, "Error", f"Processing failed: {message}"))
+        worker.signals.cancelled.connect(lambda: self.status_label.setText("Processing cancelled."))
+        worker.signals.finished.connect(self.ingest_worker_finished)
+        self.ingest_worker = worker
+        self.process_button.setEnabled(False)
+        self.start_progress("Reading CSV...", 0)
+        self.thread_pool.start(worker)
+
+    def show_ingest_progress(self, progress):
+        from Clean_And_Process2 import format_progress
+        self.status_label.setText(format_progress(progress))
+        self.progress_bar.setRange(0, INGEST_PROGRESS_STEPS)
+        self.progress_bar.setValue(int(progress['fraction'] * INGEST_PROGRESS_STEPS))
+
+    def ingest_finished(self, summary):
+        self.load_metadata()
+        self.status_label.setText(f"Rows written: {summary['rows_written']:,}")
+        QMessageBox.information(self, "Success", "Data cleaned and loaded into the database.")
+
+    def ingest_worker_finished(self):
+        self.ingest_worker = None
+        self.process_button.setEnabled(True)
+        self.stop_progress()
+
+    def start_progress(self, text, maximum):
+        self.status_label.setText(text)
+        self.progress_bar.setRange(0, maximum)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.cancel_button.setEnabled(True)
+
+    def stop_progress(self):
+        if self.analysis_worker is None and self.ingest_worker is None:
+            self.progress_bar.setVisible(False)
+            self.cancel_button.setEnabled(False)
+
+    def cancel_workers(self):
+        self.recompute_timer.stop()
+        self.series_timer.stop()
+        self.pending_analysis = None
+        self.pending_series = None
+        for worker in (self.analysis_worker, self.ingest_worker, self.series_worker):
+            if worker is not None:
+                worker.cancel()
+        self.status_label.setText("Cancelling...")
+
+    def closeEvent(self, event):
+        self.cancel_workers()
+        self.thread_pool.waitForDone()
+        super().closeEvent(event)
 
     def select_database(self):
         db_filename, _ = QFileDialog.getOpenFileName(self, "Select Database File", "", "Database files (*.db)")
         if db_filename:
             self.db_line_edit.setText(db_filename)
-            self.data_loader = DataLoader(db_filename)
-            self.update_dropdowns()
+            self.load_metadata()
 
     def select_csv(self):
         csv_file, _ = QFileDialog.getOpenFileName(self, "Open CSV File", "", "CSV files (*.csv)")
         if csv_file:
             self.csv_line_edit.setText(csv_file)
 
-    def update_dropdowns(self):
-        self.city_menu.clear()
-        self.subdivision_menu.clear()
-        self.type_menu.clear()
-        
-        self.city_menu.addItem("All")
-        self.subdivision_menu.addItem("All")
-        self.type_menu.addItem("All")
-        
-        if self.db_line_edit.text():
-            self.data_loader = DataLoader(self.db_line_edit.text())
-            self.city_menu.addItems(['All'] + self.data_loader.fetch_unique_values('location', 'city'))
-            self.subdivision_menu.addItems(['All'] + self.data_loader.fetch_unique_values('location', 'subdivision'))
-            self.type_menu.addItems(['All'] + self.data_loader.fetch_unique_values('properties', 'type'))
+    def get_analysis_cache(self):
+        """Return the analysis cache for the selected database, creating it on first use."""
+        db_filename = self.db_line_edit.text()
+        if self.analysis_cache is None or self.analysis_cache.data_loader.db_file != db_filename:
+            from Data_Loader import DataLoader
+            from analysis_cache import AnalysisCache
+            self.analysis_cache = AnalysisCache(DataLoader(db_filename, in_memory=self.in_memory))
+        return self.analysis_cache
+
+    def get_series_cache(self):
+        """Return the per-period cache behind the chart; it is separate so the chart and an analysis can run together."""
+        db_filename = self.db_line_edit.text()
+        if self.series_cache is None or self.series_cache.data_loader.db_file != db_filename:
+            from Data_Loader import DataLoader
+            from analysis_cache import AnalysisCache
+            self.series_cache = AnalysisCache(DataLoader(db_filename, in_memory=self.in_memory),
+                                              max_entries=SERIES_CACHE_ENTRIES)
+        return self.series_cache
+
+    def load_metadata(self):
+        """Fill the dropdowns and date range from the database's metadata file in the background."""
+        db_filename = self.db_line_edit.text()
+        if not db_filename:
+            return
+        worker = MetadataWorker(db_filename)
+        worker.signals.result.connect(lambda metadata: self.apply_metadata(db_filename, metadata))
+        worker.signals.finished.connect(lambda: setattr(self, 'metadata_worker', None))
+        self.metadata_worker = worker
+        self.thread_pool.start(worker)
+
+    def apply_metadata(self, db_filename, metadata):
+        # A later selection supersedes metadata still loading for an earlier database
+        if db_filename != self.db_line_edit.text():
+            return
+        self.metadata_loaded_at = time.perf_counter()
+        if metadata is None:
+            logging.error("Failed to fetch dropdown values and date ranges or no data available.")
+            return
+        self.update_dropdowns(metadata)
+        if metadata['min_date'] and metadata['max_date']:
+            self.dateRangePicker.set_dates(metadata['min_date'][:10], metadata['max_date'][:10])
+
+    def update_dropdowns(self, metadata):
+        self.dimensions = metadata['dimensions']
+        options = dimension_options(self.dimensions)
+        self.fill_dropdown(self.city_menu, options['cities'])
+        self.update_dependent_dropdowns()
+
+    def update_dependent_dropdowns(self, *args):
+        """Narrow the subdivisions to the selected city and the building types to both, from memory."""
+        options = dimension_options(self.dimensions, self.city_menu.currentData())
+        self.fill_dropdown(self.subdivision_menu, options['subdivisions'])
+        options = dimension_options(self.dimensions, self.city_menu.currentData(), self.subdivision_menu.currentData())
+        self.fill_dropdown(self.type_menu, options['building_types'])
+
+    def fill_dropdown(self, menu, choices):
+        """
+        Replace a menu's items with "All" and `choices` of (value, listings), keeping the selected
+        value if it is still offered. No change signals are emitted.
+        """
+        selected = menu.currentData()
+        menu.blockSignals(True)
+        menu.clear()
+        menu.addItem("All", None)
+        for value, listings in choices:
+            menu.addItem(f"{value} ({listings:,})", value)
+        menu.setCurrentIndex(max(menu.findData(selected), 0) if selected is not None else 0)
+        menu.blockSignals(False)
+
+class FirstPaintTimer(QObject):
+    """
+    Measures startup: time to the window's first paint, and to its metadata when a database is
+    given, both from the start of this module's import. Quits the application once reported.
+    """
+
+    def __init__(self, window, app):
+        super().__init__()
+        self.window = window
+        self.app = app
+        self.first_paint_at = None
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and self.first_paint_at is None:
+            self.first_paint_at = time.perf_counter()
+            self.pandas_loaded = 'pandas' in sys.modules
+            QTimer.singleShot(0, self.report_when_ready)
+        return False
+
+    def report_when_ready(self):
+        if self.window.metadata_worker is not None:
+            QTimer.singleShot(10, self.report_when_ready)
+            return
+        report = {
+            'first_paint_ms': (self.first_paint_at - STARTED) * 1000,
+            'pandas_loaded_at_first_paint': self.pandas_loaded,
+        }
+        if self.window.metadata_loaded_at is not None:
+            report['metadata_ms'] = (self.window.metadata_loaded_at - STARTED) * 1000
+        print(" ".join(f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                       for key, value in report.items()))
+        logging.info(f"Startup: {report}")
+        self.app.quit()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    ex = RealEstateAnalysisUI()
+    parser = argparse.ArgumentParser(description="Real estate analysis UI.")
+    parser.add_argument("--database", help="Open this database at startup")
+    parser.add_argument("--startup_time", action='store_true',
+                        help="Print the time to first paint (and to loaded metadata) and exit")
+    parser.add_argument("--in_memory", choices=['all', 'analysis'],
+                        help="Serve analysis reads from an in-memory copy of the whole database or of the analysis tables")
+    args, qt_args = parser.parse_known_args()
+
+    instrumentation.configure_logging('real_estate_ui.log')
+    app = QApplication(sys.argv[:1] + qt_args)
+    ex = RealEstateAnalysisUI({None: False, 'all': True}.get(args.in_memory, args.in_memory))
+    if args.startup_time:
+        timer = FirstPaintTimer(ex, app)
     ex.show()
+    if args.database:
+        ex.db_line_edit.setText(args.database)
+        ex.load_metadata()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,215 @@
+import json
+import logging
+import math
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+from Data_Loader import LISTING_FILTERS
+from data_analysis import analyze_real_estate_data
+
+KEY_FIELDS = ['city', 'subdivision', 'building_type', 'start_date', 'end_date', 'timeframe']
+# Backends whose results only estimate the exact statistics; they are cached apart from the exact ones
+APPROXIMATE_BACKENDS = ['sketch']
+# Backends that read the database or a prebuilt structure, never the filtered listings frame
+FRAMELESS_BACKENDS = ['sql', 'cube', 'sketch']
+
+def normalize_filter_value(value):
+    return None if not value or value == "All" else str(value)
+
+def result_kind(params):
+    """'exact' for backends that agree with the pandas path, else the approximate backend's name."""
+    backend = params.get('backend')
+    return backend if backend in APPROXIMATE_BACKENDS else 'exact'
+
+def encode_value(value):
+    """Convert a statistic result to a JSON-safe value for the on-disk store."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return {'float': repr(value)}
+    return value
+
+def decode_value(value):
+    if isinstance(value, dict) and 'float' in value:
+        return float(value['float'])
+    return value
+
+class AnalysisCache:
+    """
+    Memoizes `analyze_real_estate_data` results per statistic.
+
+    Entries are keyed by the filters, date range, timeframe, statistic, whether the backend is
+    exact, the database's path and creation nonce and its data version, so every ingest through
+    DataLoader invalidates them and databases sharing `disk_path` never see each other's results.
+    An in-process LRU is always used; `disk_path` adds a SQLite side table that survives restarts.
+    """
+
+    def __init__(self, data_loader, max_entries=1024, disk_path=None):
+        self.data_loader = data_loader
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.entries = OrderedDict()
+        self.data_version = None
+        self.database_id = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if disk_path:
+            self._create_disk_table()
+
+    def _create_disk_table(self):
+        conn = sqlite3.connect(self.disk_path)
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                data_version TEXT,
+                value TEXT
+            )''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def make_key(self, params, stat):
+        filters = [normalize_filter_value(params.get(field)) for field in KEY_FIELDS[:3]]
+        dates_and_timeframe = [str(params.get(field)) for field in KEY_FIELDS[3:]]
+        listing_filters = [str(params.get(field)) for field in LISTING_FILTERS]
+        return json.dumps(filters + dates_and_timeframe + listing_filters + [result_kind(params), stat, self.database_id, self.data_version])
+
+    def data_stamp(self):
+        return f"{self.database_id}@{self.data_version}"
+
+    def check_data_version(self):
+        """Drop every entry when the database or its data version has changed."""
+        data_version = self.data_loader.get_data_version()
+        database_id = self.data_loader.get_database_id()
+        if data_version != self.data_version or database_id != self.database_id:
+            if self.data_version is not None:
+                logging.info(f"Data version changed from {self.data_stamp()} to {database_id}@{data_version}; "
+                             f"clearing analysis cache.")
+                self.invalidations += 1
+            self.entries.clear()
+            self.data_version = data_version
+            self.database_id = database_id
+            if self.disk_path:
+                conn = sqlite3.connect(self.disk_path)
+                try:
+                    # Entries of other databases sharing the file are only dropped, never served
+                    conn.execute("DELETE FROM analysis_cache WHERE data_version IS NOT ?", (self.data_stamp(),))
+                    conn.commit()
+                finally:
+                    conn.close()
+
+    def _get_from_disk(self, keys):
+        if not self.disk_path or not keys:
+            return {}
+        conn = sqlite3.connect(self.disk_path)
+        try:
+            placeholders = ", ".join("?" for _ in keys)
+            rows = conn.execute(
+                f"SELECT cache_key, value FROM analysis_cache WHERE cache_key IN ({placeholders})", keys).fetchall()
+        finally:
+            conn.close()
+        return {key: decode_value(json.loads(value)) for key, value in rows}
+
+    def _put_on_disk(self, items):
+        if not self.disk_path or not items:
+            return
+        conn = sqlite3.connect(self.disk_path)
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis_cache (cache_key, data_version, value) VALUES (?, ?, ?)",
+                [(key, self.data_stamp(), json.dumps(encode_value(value))) for key, value in items.items()])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def is_cached(self, params, stat):
+        """Whether `stat` for `params` can be answered from memory or disk at the current data version."""
+        return stat not in self.lookup(dict(params, stats_to_calculate=[stat]))[1]
+
+    def lookup(self, params, check_version=True):
+        """
+        Return (results, pending): the cached results for params['stats_to_calculate'] and the
+        cache keys of the statistics that still have to be computed.
+
+        Callers looking up many date ranges at once can check the data version themselves first.
+        """
+        if check_version:
+            self.check_data_version()
+        stats_to_calculate = params.get('stats_to_calculate') or []
+        keys = {stat: self.make_key(params, stat) for stat in stats_to_calculate}
+
+        results = {}
+        for stat, key in keys.items():
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                results[stat] = self.entries[key]
+                self.hits += 1
+
+        pending = {stat: key for stat, key in keys.items() if stat not in results}
+        stored = self._get_from_disk(list(pending.values()))
+        for stat, key in list(pending.items()):
+            if key in stored:
+                results[stat] = stored[key]
+                self._remember(key, stored[key])
+                self.disk_hits += 1
+                del pending[stat]
+        return results, pending
+
+    def analyze(self, params, df=None, check_version=True):
+        """
+        Return `analyze_real_estate_data` results, computing only the statistics not cached.
+
+        When `df` is None the filtered listings are fetched from the loader on a miss, unless the
+        backend does not read them; the sql backend queries the cache's loader.
+        """
+        stats_to_calculate = params.get('stats_to_calculate') or []
+        results, pending = self.lookup(params, check_version)
+
+        if pending:
+            self.misses += len(pending)
+            backend = params.get('backend')
+            if df is None and backend not in FRAMELESS_BACKENDS:
+                df = self.data_loader.fetch_filtered_data(params)
+            computed = analyze_real_estate_data(df, dict(params, stats_to_calculate=list(pending),
+                                                         data_loader=self.data_loader))
+            to_store = {}
+            for stat, key in pending.items():
+                value = computed.get(stat)
+                results[stat] = value
+                if not isinstance(value, str):
+                    self._remember(key, value)
+                    to_store[key] = value
+            self._put_on_disk(to_store)
+
+        return {stat: results[stat] for stat in stats_to_calculate}
+
+    def get_stats(self):
+        """Report entry counts and hit rates."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        self.entries.clear()
+        if self.disk_path:
+            conn = sqlite3.connect(self.disk_path)
+            try:
+                conn.execute("DELETE FROM analysis_cache")
+                conn.commit()
+            finally:
+                conn.close()
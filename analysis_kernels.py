@@ -0,0 +1,389 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import instrumentation
+from data_analysis import (DAYS_ON_MARKET_PERCENTILES, SOLD_PRICE_PER_FOOT_PERCENTILES, get_last_day_of_month,
+                           get_last_day_of_quarter, get_last_day_of_year, get_percentile_label)
+from sql_analysis import get_period_windows
+
+# Kernel versions of the data_analysis.py statistics. Every statistic reproduces the pandas
+# function's windows and edge cases (None for empty denominators, NaN for empty means), but runs
+# on contiguous arrays extracted once per frame: dates as int64 days, prices as float64 and the
+# sale terms as a cash boolean. A statistic's consecutive period windows are resolved for all
+# rows in one searchsorted pass, then counted and summed with bincount.
+
+DATE_COLUMNS = ['listing_date', 'sold_date', 'under_contract_date', 'end_of_listing_date']
+NAT = np.iinfo(np.int64).min
+
+PERIOD_END_FUNCTIONS = {
+    'monthly': None,
+    'quarterly': get_last_day_of_quarter,
+    'annually': get_last_day_of_year
+}
+
+SNAPSHOT_FUNCTIONS = {
+    'monthly': lambda dt: dt,
+    'quarterly': get_last_day_of_quarter,
+    'annually': get_last_day_of_year
+}
+
+class SubDayDates(Exception):
+    """A date column has times of day, so it cannot be compared as whole days."""
+
+class ColumnarListings:
+    """
+    The columns of a fetched listings frame as contiguous NumPy arrays, extracted on first use.
+
+    Dates are int64 days since the epoch by default, which is how the cleaning pipeline stores
+    them; frames whose dates carry times of day need unit='ns'. Missing dates are NAT.
+    """
+
+    def __init__(self, df, unit='D'):
+        self.df = df
+        self.unit = unit
+        self._raw_dates = {}
+        self._cache = {}
+
+    def raw_dates(self, column):
+        """`column` as a datetime64 array in its stored resolution."""
+        if column not in self._raw_dates:
+            values = self.df[column]
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.to_datetime(values, errors='coerce')
+            values = values.to_numpy()
+            if values.dtype.kind != 'M':
+                values = values.astype('datetime64[ns]')
+            self._raw_dates[column] = values
+        return self._raw_dates[column]
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def to_int(self, timestamp):
+        return np.datetime64(pd.Timestamp(timestamp).to_datetime64(), self.unit).astype(np.int64)
+
+    def dates(self, column):
+        """
+        Dates of `column` as int64 in the frame's unit; NAT where missing.
+
+        Raises SubDayDates if the unit is days and a date has a time of day.
+        """
+        def build():
+            raw = self.raw_dates(column)
+            dates = raw.astype(f'datetime64[{self.unit}]')
+            # NaT - NaT is NaT, the most negative int64, so only a dropped time of day is positive
+            if self.unit == 'D' and np.any((raw - dates).view(np.int64) > 0):
+                raise SubDayDates(column)
+            return dates.view(np.int64)
+        return self._cached(('dates', column), build)
+
+    def values(self, column):
+        return self._cached(('values', column),
+                            lambda: pd.to_numeric(self.df[column], errors='coerce').to_numpy(dtype=np.float64))
+
+    def ratio(self, numerator, denominator):
+        def build():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return self.values(numerator) / self.values(denominator)
+        return self._cached(('ratio', numerator, denominator), build)
+
+    def cash(self):
+        return self._cached(('cash',), lambda: (self.df['terms_of_sale'] == 'cash').to_numpy(dtype=bool))
+
+    def inventory_intervals(self):
+        """
+        (start, end) bounds of the half-open intervals in which each listing counts, for all and pending.
+
+        A listing is in inventory at `e` when listing_date < e < end_of_listing_date, and pending
+        when additionally under_contract_date <= e. Both are `start <= e < end` on integers.
+        """
+        def build():
+            listed = self.dates('listing_date')
+            ends = self.dates('end_of_listing_date')
+            contract = self.dates('under_contract_date')
+            present = (listed != NAT) & (ends != NAT)
+            starts = np.where(present, listed + 1, 0)
+            in_market = present & (starts < ends)
+            pending_starts = np.maximum(starts, contract)
+            pending = in_market & (contract != NAT) & (pending_starts < ends)
+            return starts[in_market], ends[in_market], pending_starts[pending], ends[pending]
+        return self._cached(('inventory',), build)
+
+    def sorted_inventory_intervals(self):
+        return self._cached(('sorted_inventory',), lambda: tuple(np.sort(bounds) for bounds in self.inventory_intervals()))
+
+def window_ids(dates, windows):
+    """
+    Index of the window containing each date, or -1.
+
+    `windows` are sorted inclusive (lo, hi) integer ranges, as the period loops produce. In
+    days they are consecutive; in nanoseconds the time of day after each hi falls between windows.
+    """
+    if not windows or windows[0][0] > windows[-1][1]:
+        return np.full(len(dates), -1, dtype=np.int64)
+    los = np.array([lo for lo, _ in windows], dtype=np.int64)
+    his = np.array([hi for _, hi in windows], dtype=np.int64)
+    ids = np.searchsorted(los, dates, 'right') - 1
+    ids[(ids >= 0) & (dates > his[np.maximum(ids, 0)])] = -1
+    return ids
+
+def range_counts(ids, num_windows):
+    return np.bincount(ids[ids >= 0], minlength=num_windows)
+
+def range_sums(ids, values, num_windows):
+    """Per-window sums skipping NaN like pandas; returns (sums, non-NaN counts)."""
+    present = (ids >= 0) & ~np.isnan(values)
+    sums = np.bincount(ids[present], weights=values[present], minlength=num_windows)
+    return sums, np.bincount(ids[present], minlength=num_windows)
+
+def range_means(ids, values, num_windows):
+    """Per-window means skipping NaN; infinities propagate and an empty window gives NaN."""
+    sums, counts = range_sums(ids, values, num_windows)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts
+
+def nan_quantiles(values, qs):
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return [np.nan] * len(qs)
+    return list(np.quantile(present, qs))
+
+def overlap_counts(starts, ends, at):
+    """Count half-open [start, end) intervals containing each point of `at`; starts/ends sorted."""
+    return np.searchsorted(starts, at, 'right') - np.searchsorted(ends, at, 'right')
+
+class KernelStatistics:
+    """Statistics of `analyze_real_estate_data` for one timeframe and date range over ColumnarListings."""
+
+    def __init__(self, columns, timeframe, start_date, end_date):
+        self.columns = columns
+        self.timeframe = timeframe
+        self.start_date = start_date
+        self.end_date = end_date
+        self._windows = {}
+        self._ids = {}
+
+    def windows(self, kind):
+        """The (lo, hi) windows a statistic loops over: 'range', 'period', 'month' or 'sold_timeframe'."""
+        if kind not in self._windows:
+            to_int = self.columns.to_int
+            if kind == 'range':
+                windows = [(to_int(self.start_date), to_int(self.end_date))]
+            elif kind == 'sold_timeframe':
+                period_end = SNAPSHOT_FUNCTIONS[self.timeframe](self.end_date)
+                windows = [(to_int(self.start_date), to_int(period_end))] if self.start_date <= self.end_date else []
+            else:
+                last_day_func = PERIOD_END_FUNCTIONS[self.timeframe] if kind == 'period' else get_last_day_of_month
+                windows = [(to_int(start), to_int(end))
+                           for start, end in get_period_windows(self.start_date, self.end_date, last_day_func)]
+            self._windows[kind] = windows
+        return self._windows[kind]
+
+    def timeframe_windows(self):
+        # The monthly functions filter the whole range once, the others loop over periods
+        return 'range' if self.timeframe == 'monthly' else 'period'
+
+    def ids(self, column, kind):
+        key = (column, kind)
+        if key not in self._ids:
+            self._ids[key] = window_ids(self.columns.dates(column), self.windows(kind))
+        return self._ids[key]
+
+    def counts(self, column, kind):
+        return range_counts(self.ids(column, kind), len(self.windows(kind)))
+
+    def sums(self, values, kind):
+        return range_sums(self.ids('sold_date', kind), values, len(self.windows(kind)))[0]
+
+    def means(self, values, kind):
+        return range_means(self.ids('sold_date', kind), values, len(self.windows(kind)))
+
+    def inventory(self, points):
+        """(active, pending) counts at each point, as in the pandas snapshot functions."""
+        points = np.asarray(points, dtype=np.int64)
+        if len(points) > 4:
+            starts, ends, pending_starts, pending_ends = self.columns.sorted_inventory_intervals()
+            pending = overlap_counts(pending_starts, pending_ends, points)
+            return overlap_counts(starts, ends, points) - pending, pending
+        starts, ends, pending_starts, pending_ends = self.columns.inventory_intervals()
+        pending = np.array([np.count_nonzero((pending_starts <= e) & (e < pending_ends)) for e in points], dtype=np.int64)
+        total = np.array([np.count_nonzero((starts <= e) & (e < ends)) for e in points], dtype=np.int64)
+        return total - pending, pending
+
+    def new_listings(self):
+        return int(self.counts('listing_date', self.timeframe_windows()).sum())
+
+    def closed_listings(self):
+        return int(self.counts('sold_date', self.timeframe_windows()).sum())
+
+    def avg_sold_price_per_foot(self):
+        if self.timeframe == 'monthly':
+            return self.means(self.columns.ratio('sold_price', 'sqft_living'), 'range')[0]
+        total_area = self.sums(self.columns.values('sqft_living'), 'period').sum()
+        if total_area == 0:
+            return None
+        return self.sums(self.columns.values('sold_price'), 'period').sum() / total_area
+
+    def avg_days_on_market(self):
+        if self.timeframe == 'monthly':
+            return self.means(self.columns.values('cumulative_dom'), 'range')[0]
+        total_sales = self.counts('sold_date', 'period').sum()
+        if total_sales == 0:
+            return None
+        return self.sums(self.columns.values('cumulative_dom'), 'period').sum() / total_sales
+
+    def total_dollar_volume(self):
+        return self.sums(self.columns.values('sold_price'), self.timeframe_windows()).sum()
+
+    def snapshot(self):
+        return self.columns.to_int(SNAPSHOT_FUNCTIONS[self.timeframe](self.end_date))
+
+    def pending_listings(self):
+        return int(self.inventory([self.snapshot()])[1][0])
+
+    def active_inventory(self):
+        return int(self.inventory([self.snapshot()])[0][0])
+
+    def list_price_to_sold_price_ratio(self):
+        ratios = self.columns.ratio('sold_price', 'list_price')
+        if self.timeframe == 'monthly':
+            return self.means(ratios, 'range')[0]
+        return self.means(ratios, 'month').sum() / (3 if self.timeframe == 'quarterly' else 12)
+
+    def msi(self):
+        kind = 'range' if self.timeframe == 'monthly' else 'month'
+        windows = self.windows(kind)
+        total_active = int(self.inventory([hi for _, hi in windows])[0].sum()) if windows else 0
+        total_closed = int(self.counts('sold_date', kind).sum())
+        if total_closed == 0:
+            return None
+        return total_active / (total_closed / 12)
+
+    def percent_cash_sales(self):
+        kind = 'range' if self.timeframe == 'monthly' else 'month'
+        closed = self.counts('sold_date', kind)
+        cash = self.sums(self.columns.cash().astype(np.float64), kind)
+        if self.timeframe == 'monthly':
+            if closed[0] == 0:
+                return None
+            return (cash[0] / closed[0]) * 100
+
+        sold_months = closed > 0
+        total_sales = int(closed[sold_months].sum())
+        if total_sales == 0:
+            return None
+        return ((cash[sold_months] / closed[sold_months]) * 100 * closed[sold_months]).sum() / total_sales
+
+    def sold_in_timeframe(self, values):
+        return values[self.ids('sold_date', 'sold_timeframe') == 0]
+
+    def median_sold_price(self):
+        return nan_quantiles(self.sold_in_timeframe(self.columns.values('sold_price')), [0.5])[0]
+
+    def sold_price_per_foot_percentiles(self):
+        sqft = self.columns.values('sqft_living')
+        price_per_foot = np.where(sqft > 0, self.columns.ratio('sold_price', 'sqft_living'), np.nan)
+        values = nan_quantiles(self.sold_in_timeframe(price_per_foot), SOLD_PRICE_PER_FOOT_PERCENTILES)
+        return {get_percentile_label(q): value for q, value in zip(SOLD_PRICE_PER_FOOT_PERCENTILES, values)}
+
+    def days_on_market_percentiles(self):
+        values = nan_quantiles(self.sold_in_timeframe(self.columns.values('cumulative_dom')),
+                               DAYS_ON_MARKET_PERCENTILES)
+        return {get_percentile_label(q): value for q, value in zip(DAYS_ON_MARKET_PERCENTILES, values)}
+
+KERNEL_STATISTICS = [
+    'new_listings', 'closed_listings', 'avg_sold_price_per_foot', 'avg_days_on_market', 'total_dollar_volume',
+    'pending_listings', 'list_price_to_sold_price_ratio', 'active_inventory', 'msi', 'percent_cash_sales',
+    'median_sold_price', 'sold_price_per_foot_percentiles', 'days_on_market_percentiles'
+]
+
+def is_midnight(timestamp):
+    return pd.isna(timestamp) or timestamp == timestamp.normalize()
+
+def analyze_real_estate_data_kernels(df, params):
+    """Compute `analyze_real_estate_data` statistics with the NumPy kernels."""
+    results = {}
+    timeframe = params.get('timeframe')
+    start_date = pd.to_datetime(params.get('start_date'))
+    end_date = pd.to_datetime(params.get('end_date'))
+    stats_to_calculate = params.get('stats_to_calculate')
+
+    columns = df if isinstance(df, ColumnarListings) else ColumnarListings(df)
+    if columns.unit == 'D' and not (is_midnight(start_date) and is_midnight(end_date)):
+        columns = ColumnarListings(columns.df, unit='ns')
+    statistics = KernelStatistics(columns, timeframe, start_date, end_date)
+
+    for stat in stats_to_calculate:
+        if stat in KERNEL_STATISTICS:
+            try:
+                if timeframe not in PERIOD_END_FUNCTIONS:
+                    raise KeyError(timeframe)
+                with instrumentation.span(stat, category='statistic', backend='numpy', timeframe=timeframe):
+                    results[stat] = getattr(statistics, stat)()
+            except SubDayDates:
+                # Start over comparing exact timestamps
+                return analyze_real_estate_data_kernels(ColumnarListings(columns.df, unit='ns'), params)
+            except Exception as e:
+                results[stat] = f"Error calculating {stat}: {str(e)}"
+        else:
+            results[stat] = "No calculation function defined for this statistic"
+
+    return results
+
+def benchmark_statistics(df, start_date, end_date, repeat=3):
+    """
+    Time every statistic on the pandas path and the kernel path for each timeframe.
+
+    Kernel timings include extracting the columns, as every call to `analyze_real_estate_data` does.
+    Returns a DataFrame with the best time of `repeat` runs per statistic and whether results agree.
+    """
+    from data_analysis import analyze_real_estate_data
+
+    rows = []
+    for timeframe in PERIOD_END_FUNCTIONS:
+        for stat in KERNEL_STATISTICS:
+            params = {'timeframe': timeframe, 'start_date': start_date, 'end_date': end_date,
+                      'stats_to_calculate': [stat]}
+            timings = {}
+            results = {}
+            for backend in ('pandas', 'numpy'):
+                best = float('inf')
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    results[backend] = analyze_real_estate_data(df, dict(params, backend=backend))[stat]
+                    best = min(best, time.perf_counter() - started)
+                timings[backend] = best
+            rows.append({
+                'timeframe': timeframe,
+                'statistic': stat,
+                'pandas_ms': timings['pandas'] * 1000,
+                'numpy_ms': timings['numpy'] * 1000,
+                'speedup': timings['pandas'] / timings['numpy'] if timings['numpy'] else float('inf'),
+                'match': values_match(results['pandas'], results['numpy'])
+            })
+    return pd.DataFrame(rows)
+
+def values_match(expected, actual):
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return expected.keys() == actual.keys() and all(values_match(expected[key], actual[key]) for key in expected)
+    if expected is None or actual is None or isinstance(expected, str) or isinstance(actual, str):
+        return expected == actual
+    return bool(np.isclose(float(expected), float(actual), rtol=1e-9, atol=1e-9, equal_nan=True))
+
+if __name__ == "__main__":
+    from benchmark_sql_backend import generate_listings
+
+    parser = argparse.ArgumentParser(description="Compare the pandas and NumPy kernel statistic paths.")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of synthetic listings")
+    parser.add_argument("--start_date", default="2016-01-01")
+    parser.add_argument("--end_date", default="2020-12-31")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tables = generate_listings(args.rows)
+    listings = tables['listing_details'].merge(tables['properties'], on='listing_number')
+    report = benchmark_statistics(listings, args.start_date, args.end_date, args.repeat)
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
@@ -0,0 +1,83 @@
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+import instrumentation
+
+# Command-line entry point for the batch report. Only the standard library is imported until the
+# arguments are valid, so --help and usage errors return at once; batch_report, and with it
+# pandas, is imported to run the report. Nothing here imports PyQt.
+
+GROUP_COLUMNS = ['city', 'subdivision', 'type']
+FORMATS = ['csv', 'json', 'jsonl', 'parquet']
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Compute statistics for market segments without the UI. Rows are written as "
+                    "segments complete: one per segment and statistic.")
+    parser.add_argument("db_filename", help="Database file path")
+    parser.add_argument("output", help="Output file, or - for standard output (csv and jsonl only)")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="Output format; by default taken from the output file's extension, else csv")
+    parser.add_argument("--timeframe", default="monthly", choices=["monthly", "quarterly", "annually"])
+    parser.add_argument("--start_date", required=True, type=parse_date, help="First day of the report range (YYYY-MM-DD)")
+    parser.add_argument("--end_date", required=True, type=parse_date, help="Last day of the report range (YYYY-MM-DD)")
+    parser.add_argument("--stats", nargs="+", help="Statistics to calculate (default: all)")
+    parser.add_argument("--city", help="Only listings in this city")
+    parser.add_argument("--subdivision", help="Only listings in this subdivision")
+    parser.add_argument("--building_type", help="Only listings of this building type")
+    parser.add_argument("--group_by", nargs="*", choices=GROUP_COLUMNS, default=GROUP_COLUMNS,
+                        help="Columns whose combinations are the segments (default: all segments); "
+                             "give none to report the filtered listings as one segment")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per CPU)")
+    parser.add_argument("--log_file", help="Log here instead of to standard error")
+    parser.add_argument("--verbose", action='store_true', help="Log progress at info level")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db_filename):
+        parser.error(f"database {args.db_filename} does not exist")
+    if args.start_date > args.end_date:
+        parser.error("--start_date is after --end_date")
+    output_format = args.format or ('csv' if args.output == '-' else None)
+    if args.output == '-' and output_format in ('json', 'parquet'):
+        parser.error(f"{output_format} output cannot be written to standard output")
+    instrumentation.configure_logging(args.log_file, logging.INFO if args.verbose else logging.WARNING)
+
+    from batch_report import STATISTIC_COLUMNS, ReportWriter, iter_batch_report, report_columns
+    unknown = sorted(set(args.stats or []) - set(STATISTIC_COLUMNS))
+    if unknown:
+        parser.error(f"unknown statistics: {', '.join(unknown)}; choose from {', '.join(STATISTIC_COLUMNS)}")
+
+    params = {
+        'city': args.city,
+        'subdivision': args.subdivision,
+        'building_type': args.building_type,
+        'timeframe': args.timeframe,
+        'start_date': args.start_date,
+        'end_date': args.end_date,
+        'stats_to_calculate': args.stats or list(STATISTIC_COLUMNS)
+    }
+    group_by = [column for column in GROUP_COLUMNS if column in args.group_by]
+    started = time.perf_counter()
+    with ReportWriter(args.output, output_format) as writer:
+        for frame in iter_batch_report(args.db_filename, params, args.workers, group_by):
+            writer.write(frame)
+        if writer.rows == 0:
+            import pandas as pd
+            writer.write(pd.DataFrame({column: pd.Series(dtype='float64' if column == 'value' else 'str')
+                                       for column in report_columns(group_by)}))
+    logging.info(f"Batch report finished in {time.perf_counter() - started:.2f}s.")
+
+if __name__ == "__main__":
+    main()
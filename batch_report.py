@@ -0,0 +1,274 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from Data_Loader import DataLoader
+from data_analysis import analyze_real_estate_data
+
+SEGMENT_COLUMNS = ['city', 'subdivision', 'type']
+
+STATISTIC_COLUMNS = {
+    'new_listings': ['listing_date'],
+    'closed_listings': ['sold_date'],
+    'avg_sold_price_per_foot': ['sold_date', 'sold_price', 'sqft_living'],
+    'avg_days_on_market': ['sold_date', 'cumulative_dom'],
+    'total_dollar_volume': ['sold_date', 'sold_price'],
+    'pending_listings': ['listing_date', 'under_contract_date', 'end_of_listing_date'],
+    'list_price_to_sold_price_ratio': ['sold_date', 'sold_price', 'list_price'],
+    'active_inventory': ['listing_date', 'under_contract_date', 'end_of_listing_date'],
+    'msi': ['listing_date', 'sold_date', 'under_contract_date', 'end_of_listing_date'],
+    'percent_cash_sales': ['sold_date', 'terms_of_sale'],
+    'median_sold_price': ['sold_date', 'sold_price'],
+    'sold_price_per_foot_percentiles': ['sold_date', 'sold_price', 'sqft_living'],
+    'days_on_market_percentiles': ['sold_date', 'cumulative_dom']
+}
+
+DATE_COLUMNS = {'listing_date', 'sold_date', 'under_contract_date', 'end_of_listing_date'}
+
+# Column buffers attached by each worker process, keyed by column name
+_worker_columns = {}
+_worker_buffers = []
+
+def get_required_columns(stats_to_calculate):
+    columns = ['listing_date']
+    for stat in stats_to_calculate:
+        for column in STATISTIC_COLUMNS.get(stat, []):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+def fetch_segment_frame(data_loader, params, stats_to_calculate, group_by=SEGMENT_COLUMNS):
+    """
+    Fetch the statistic columns for every segment in one query, sorted by segment.
+
+    Segments are the combinations of the `group_by` columns; with none, every listing matching
+    the filters is one segment.
+    """
+    group_by = list(group_by)
+    columns = get_required_columns(stats_to_calculate)
+    df = data_loader.fetch_filtered_data(params, columns=group_by + columns)
+    if df.empty:
+        return df, pd.DataFrame(columns=group_by + ['start', 'stop'])
+
+    for column in DATE_COLUMNS & set(df.columns):
+        df[column] = pd.to_datetime(df[column], errors='coerce')
+
+    if not group_by:
+        return df, pd.DataFrame({'start': [0], 'stop': [len(df)]})
+
+    segment_ids = df.groupby(group_by, sort=True, dropna=False).ngroup().to_numpy()
+    order = np.argsort(segment_ids, kind='stable')
+    df = df.iloc[order].reset_index(drop=True)
+    segment_ids = segment_ids[order]
+
+    starts = np.flatnonzero(np.r_[True, segment_ids[1:] != segment_ids[:-1]])
+    stops = np.r_[starts[1:], len(df)]
+    segments = df.loc[starts, group_by].reset_index(drop=True)
+    segments['start'] = starts
+    segments['stop'] = stops
+    return df, segments
+
+def to_column_arrays(df):
+    """Convert the analysis columns to flat NumPy arrays that can live in shared memory."""
+    arrays = {}
+    for column in df.columns:
+        if column in SEGMENT_COLUMNS:
+            continue
+        if column in DATE_COLUMNS:
+            arrays[column] = df[column].to_numpy(dtype='datetime64[ns]')
+        elif column == 'terms_of_sale':
+            arrays[column] = (df[column] == 'cash').to_numpy(dtype=bool)
+        else:
+            arrays[column] = df[column].to_numpy(dtype='float64', na_value=np.nan)
+    return arrays
+
+def share_column_arrays(arrays):
+    """Copy each array into its own shared memory block and return the blocks and an attach spec."""
+    blocks = []
+    spec = {}
+    for column, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        spec[column] = (block.name, array.dtype.str, array.shape)
+    return blocks, spec
+
+def attach_column_arrays(spec):
+    """Worker initializer: map the shared column buffers without copying them."""
+    for column, (name, dtype, shape) in spec.items():
+        block = shared_memory.SharedMemory(name=name)
+        _worker_buffers.append(block)
+        _worker_columns[column] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+def build_segment_frame(columns, start, stop):
+    data = {}
+    for column, array in columns.items():
+        values = array[start:stop]
+        if column == 'terms_of_sale':
+            data[column] = np.where(values, 'cash', '')
+        else:
+            data[column] = values
+    return pd.DataFrame(data)
+
+def analyze_segments(tasks, analysis_params, columns=None):
+    """Run `analyze_real_estate_data` for each (segment, start, stop) task."""
+    columns = _worker_columns if columns is None else columns
+    rows = []
+    for segment, start, stop in tasks:
+        results = analyze_real_estate_data(build_segment_frame(columns, start, stop), analysis_params)
+        for stat, value in results.items():
+            # Percentile statistics return {label: value} and become one row per percentile
+            values = {f'{stat}_{label}': item for label, item in value.items()} if isinstance(value, dict) else {stat: value}
+            for name, item in values.items():
+                error = item if isinstance(item, str) else None
+                rows.append(segment + (name, np.nan if item is None or error else float(item), error))
+    return rows
+
+def chunk_tasks(tasks, num_chunks):
+    size = max(1, -(-len(tasks) // max(num_chunks, 1)))
+    return [tasks[i:i + size] for i in range(0, len(tasks), size)]
+
+def iter_batch_report(db_file, params, max_workers=None, group_by=SEGMENT_COLUMNS):
+    """
+    Compute every requested statistic for every segment of the `group_by` columns (city,
+    subdivision and type by default) among the listings matching the filters in `params`.
+
+    Yields tidy DataFrames with one row per segment and statistic as each chunk of segments
+    completes, in segment order, so callers can write them out as they arrive.
+    """
+    group_by = list(group_by)
+    stats_to_calculate = params.get('stats_to_calculate') or list(STATISTIC_COLUMNS)
+    analysis_params = {
+        'timeframe': params.get('timeframe'),
+        'start_date': params.get('start_date'),
+        'end_date': params.get('end_date'),
+        'stats_to_calculate': stats_to_calculate
+    }
+    result_columns = group_by + ['statistic', 'value', 'error']
+
+    def to_frame(rows):
+        return pd.DataFrame(rows, columns=result_columns).rename(columns={'type': 'building_type'})
+
+    data_loader = DataLoader(db_file)
+    df, segments = fetch_segment_frame(data_loader, params, stats_to_calculate, group_by)
+    if segments.empty:
+        return
+
+    tasks = [
+        (tuple(row[:len(group_by)]), int(row.start), int(row.stop))
+        for row in segments.itertuples(index=False)
+    ]
+    arrays = to_column_arrays(df)
+    del df
+
+    max_workers = max_workers or os.cpu_count() or 1
+    logging.info(f"Batch report: {len(tasks)} segments across {max_workers} workers.")
+
+    if max_workers == 1:
+        for chunk in chunk_tasks(tasks, max(len(tasks) // 64, 1)):
+            yield to_frame(analyze_segments(chunk, analysis_params, arrays))
+        return
+
+    blocks, spec = share_column_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=attach_column_arrays,
+                                 initargs=(spec,)) as executor:
+            futures = [
+                executor.submit(analyze_segments, chunk, analysis_params)
+                for chunk in chunk_tasks(tasks, max_workers * 4)
+            ]
+            for future in futures:
+                yield to_frame(future.result())
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def run_batch_report(db_file, params, max_workers=None, group_by=SEGMENT_COLUMNS):
+    """
+    Compute every requested statistic for every city x subdivision x building type segment.
+
+    Returns a tidy DataFrame with one row per segment and statistic.
+    """
+    frames = list(iter_batch_report(db_file, params, max_workers, group_by))
+    if not frames:
+        return pd.DataFrame(columns=report_columns(group_by))
+    return pd.concat(frames, ignore_index=True)
+
+def report_columns(group_by=SEGMENT_COLUMNS):
+    return ['building_type' if column == 'type' else column for column in group_by] + ['statistic', 'value', 'error']
+
+REPORT_FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet'}
+
+def report_format(output_path, output_format=None):
+    """The output format named by `output_format` or, failing that, the file extension; CSV by default."""
+    return output_format or REPORT_FORMATS.get(os.path.splitext(output_path)[1].lower(), 'csv')
+
+class ReportWriter:
+    """
+    Writes report frames to CSV, JSON, JSON lines or Parquet as they are produced.
+
+    CSV and JSON lines can go to standard output with `output_path` '-'. A JSON file holds one
+    array of records. Parquet, through pyarrow, gets one row group per frame.
+    """
+
+    def __init__(self, output_path, output_format=None):
+        self.output_path = output_path
+        self.format = report_format(output_path, output_format)
+        if output_path == '-' and self.format in ('json', 'parquet'):
+            raise ValueError(f"{self.format} output cannot be streamed to standard output.")
+        self.file = None
+        self.parquet_writer = None
+        self.rows = 0
+
+    def __enter__(self):
+        if self.format != 'parquet':
+            self.file = sys.stdout if self.output_path == '-' else open(self.output_path, 'w', newline='')
+            if self.format == 'json':
+                self.file.write('[')
+        return self
+
+    def write(self, frame):
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([(column, pa.float64() if column == 'value' else pa.string()) for column in frame.columns])
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.output_path, schema)
+            self.parquet_writer.write_table(table)
+        elif self.format == 'csv':
+            frame.to_csv(self.file, index=False, header=self.rows == 0)
+        elif self.format == 'jsonl':
+            if len(frame):
+                self.file.write(frame.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n')
+        else:
+            records = frame.to_json(orient='records', date_format='iso')[1:-1]
+            if records:
+                self.file.write((',' if self.rows else '') + records)
+        self.rows += len(frame)
+        if self.file is not None:
+            self.file.flush()
+
+    def __exit__(self, *exc_info):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.file is not None:
+            if self.format == 'json':
+                self.file.write(']\n')
+            if self.file is not sys.stdout:
+                self.file.close()
+        logging.info(f"Batch report with {self.rows} rows written to {self.output_path}.")
+
+def write_batch_report(report, output_path):
+    """Write the tidy report as CSV, JSON or Parquet based on the file extension."""
+    with ReportWriter(output_path) as writer:
+        writer.write(report)
+
+if __name__ == "__main__":
+    from batch_cli import main
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import math
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from Data_Loader import DataLoader
+from data_analysis import analyze_real_estate_data
+
+STATISTICS = [
+    'new_listings', 'closed_listings', 'avg_sold_price_per_foot', 'avg_days_on_market',
+    'total_dollar_volume', 'pending_listings', 'list_price_to_sold_price_ratio',
+    'active_inventory', 'msi', 'percent_cash_sales'
+]
+
+DATE_COLUMNS = ['listing_date', 'sold_date', 'under_contract_date', 'end_of_listing_date']
+
+def generate_listings(num_rows, seed=0):
+    """Generate the listing_details, properties and location rows the statistics read."""
+    rng = np.random.default_rng(seed)
+    listing_number = np.char.add('LN', np.arange(num_rows).astype(str))
+    listing_date = pd.Timestamp('2014-01-01') + pd.to_timedelta(rng.integers(0, 3650, num_rows), unit='D')
+    cumulative_dom = rng.integers(1, 365, num_rows)
+    end_of_listing_date = listing_date + pd.to_timedelta(cumulative_dom, unit='D')
+    sold = rng.random(num_rows) < 0.6
+    under_contract = sold | (rng.random(num_rows) < 0.05)
+    under_contract_date = pd.Series(
+        end_of_listing_date - pd.to_timedelta(rng.integers(0, 45, num_rows), unit='D')).where(under_contract)
+    list_price = np.round(rng.lognormal(13, 0.6, num_rows), -2)
+    sold_price = pd.Series(np.round(list_price * rng.uniform(0.85, 1.02, num_rows), -2)).where(sold)
+
+    listing_details = pd.DataFrame({
+        'listing_number': listing_number,
+        'cumulative_dom': cumulative_dom,
+        'listing_date': listing_date,
+        'list_price': list_price,
+        'sold_price': sold_price,
+        'sold_date': pd.Series(end_of_listing_date).where(sold),
+        'under_contract_date': under_contract_date,
+        'end_of_listing_date': end_of_listing_date,
+        'terms_of_sale': np.where(rng.random(num_rows) < 0.35, 'cash', 'conventional')
+    })
+    properties = pd.DataFrame({
+        'listing_number': listing_number,
+        'type': rng.choice(['single family', 'condo', 'townhouse'], num_rows),
+        'sqft_living': rng.integers(600, 5000, num_rows)
+    })
+    location = pd.DataFrame({
+        'listing_number': listing_number,
+        'city': rng.choice(['naples', 'bonita springs', 'fort myers', 'marco island'], num_rows),
+        'subdivision': rng.choice([f'subdivision {i}' for i in range(200)], num_rows)
+    })
+    return {'listing_details': listing_details, 'properties': properties, 'location': location}
+
+def build_database(db_file, num_rows, seed=0):
+    data_loader = DataLoader(db_file)
+    data_loader.create_database()
+    for table_name, df in generate_listings(num_rows, seed).items():
+        data_loader.batch_insert_data(df, table_name, batch_size=100000)
+    return data_loader
+
+def results_match(expected, actual):
+    for stat, value in expected.items():
+        other = actual.get(stat)
+        if value is None or other is None or isinstance(value, str) or isinstance(other, str):
+            if value != other:
+                return False
+        elif not math.isclose(float(value), float(other), rel_tol=1e-9, abs_tol=1e-9) and \
+                not (math.isnan(float(value)) and math.isnan(float(other))):
+            return False
+    return True
+
+def time_backends(data_loader, filters, timeframe, start_date, end_date, repeat=3):
+    params = dict(filters, start_date=start_date, end_date=end_date, timeframe=timeframe,
+                  stats_to_calculate=STATISTICS, backend='pandas')
+
+    pandas_seconds = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = data_loader.fetch_filtered_data(params)
+        for column in DATE_COLUMNS:
+            df[column] = pd.to_datetime(df[column])
+        pandas_results = analyze_real_estate_data(df, params)
+        pandas_seconds = min(pandas_seconds, time.perf_counter() - started)
+
+    sql_seconds = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sql_results = analyze_real_estate_data(None, dict(params, backend='sql', data_loader=data_loader))
+        sql_seconds = min(sql_seconds, time.perf_counter() - started)
+
+    return pandas_seconds, sql_seconds, results_match(pandas_results, sql_results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pandas and SQL statistic backends.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    segments = {
+        'all listings': {},
+        'one city': {'city': 'naples'},
+        'one subdivision': {'city': 'naples', 'subdivision': 'subdivision 7', 'building_type': 'condo'}
+    }
+
+    print(f"{'rows':>9} {'segment':<16} {'timeframe':<10} {'pandas s':>9} {'sql s':>9} {'winner':<7} match")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_rows in args.sizes:
+            data_loader = build_database(os.path.join(tmp_dir, f'bench_{num_rows}.db'), num_rows)
+            for segment_name, filters in segments.items():
+                for timeframe in ('monthly', 'quarterly', 'annually'):
+                    pandas_seconds, sql_seconds, match = time_backends(
+                        data_loader, filters, timeframe, '2016-01-01', '2020-12-31', args.repeat)
+                    winner = 'sql' if sql_seconds < pandas_seconds else 'pandas'
+                    print(f"{num_rows:>9} {segment_name:<16} {timeframe:<10} {pandas_seconds:>9.4f} "
+                          f"{sql_seconds:>9.4f} {winner:<7} {match}")
+
+if __name__ == "__main__":
+    main()
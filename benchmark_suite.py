@@ -0,0 +1,347 @@
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+from analysis_kernels import KERNEL_STATISTICS
+from batch_report import SEGMENT_COLUMNS, get_required_columns
+from data_analysis import analyze_real_estate_data
+
+SIZES = [10000, 100000, 1000000, 5000000]
+TIMEFRAMES = ['monthly', 'quarterly', 'annually']
+RANGE_YEARS = [1, 5, 10]
+DATA_END = pd.Timestamp('2024-12-31')
+DATA_YEARS = 12
+
+CITIES = {
+    # city: (weight, zip code, latitude, longitude, price per sqft)
+    'naples': (0.35, '34102', 26.142, -81.795, 420.0),
+    'bonita springs': (0.15, '34134', 26.339, -81.778, 310.0),
+    'fort myers': (0.3, '33901', 26.640, -81.872, 230.0),
+    'marco island': (0.1, '34145', 25.941, -81.718, 480.0),
+    'estero': (0.1, '33928', 26.438, -81.807, 290.0)
+}
+BUILDING_TYPES = {'single family': (0.5, 2400), 'condo': (0.35, 1400), 'townhouse': (0.1, 1700), 'villa': (0.05, 1600)}
+TERMS_OF_SALE = {'cash': 0.35, 'conventional': 0.45, 'fha': 0.12, 'va': 0.08}
+# Listings per calendar month relative to the average; spring is the busy season in southwest Florida
+SEASONALITY = np.array([1.15, 1.25, 1.3, 1.2, 1.05, 0.9, 0.85, 0.85, 0.8, 0.85, 0.85, 0.95])
+STREETS = ['gulf shore', 'palm river', 'bayshore', 'vanderbilt', 'pelican bay', 'royal palm', 'mangrove',
+           'cypress woods', 'heron', 'sabal palm', 'egret', 'tarpon', 'manatee', 'osprey', 'coconut']
+STREET_SUFFIXES = ['blvd', 'dr', 'ct', 'ln', 'way', 'cir']
+REMARKS = [
+    'light and bright with water views', 'turnkey furnished, ready for season', 'new roof and impact glass',
+    'walk to the beach', 'heated pool and spa with lake view', 'golf membership available',
+    'priced to sell, bring all offers', 'renovated kitchen with quartz counters', 'gated community with clubhouse',
+    'boater\'s paradise with direct gulf access'
+]
+SUBDIVISIONS_PER_CITY = 60
+HIGH_SCHOOLS = ['naples high', 'barron collier', 'lely', 'estero', 'fort myers high', 'bonita springs high']
+
+def pick(rng, choices, num_rows, weights=None):
+    """Draw `num_rows` values from `choices`, optionally weighted."""
+    choices = np.asarray(choices, dtype=object)
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64) / np.sum(weights)
+    return choices[rng.choice(len(choices), num_rows, p=weights)]
+
+def as_dates(base, days):
+    return base + pd.to_timedelta(days, unit='D')
+
+def generate_listing_frame(num_rows, seed=0, columns=None, end_date=DATA_END, years=DATA_YEARS, first_number=0):
+    """
+    Generate cleaned listings shaped like `fetch_filtered_data` output, one column per
+    `get_data_dictionary` entry.
+
+    Listing dates span `years` years up to `end_date` with a spring peak, prices follow city price
+    levels, building type and a yearly trend, and about 60% of listings sell. Statuses are
+    consistent: sold listings go under contract before closing, and `event_date` and
+    `end_of_listing_date` are derived as the cleaning script derives them. Parcel ids start with a
+    10-digit subdivision prefix and about 30% of listings resell a parcel. `columns` limits the
+    frame to those columns, which keeps multi-million-row frames in memory; `first_number` offsets
+    listing numbers so frames generated in chunks do not collide.
+    """
+    from Clean_And_Process2 import get_data_dictionary
+
+    data_dict = get_data_dictionary()
+    columns = list(data_dict) if columns is None else [column for column in data_dict if column in columns]
+    rng = np.random.default_rng(seed)
+    n = num_rows
+    start = pd.Timestamp(end_date) - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+
+    # Listing dates: pick a month weighted by season, then a day within it
+    months = pd.date_range(start, end_date, freq='MS')
+    month_weights = SEASONALITY[months.month - 1]
+    month_index = rng.choice(len(months), n, p=month_weights / month_weights.sum())
+    listing_date = as_dates(months[month_index], rng.integers(0, 28, n))
+    cumulative_dom = np.clip(rng.lognormal(4.3, 0.8, n), 1, 730).astype(np.int64)
+    end_of_listing_date = as_dates(listing_date, cumulative_dom)
+
+    outcome = rng.choice(['sold', 'expired', 'withdrawn', 'cancelled', 'temp_off'], n,
+                         p=[0.6, 0.18, 0.12, 0.06, 0.04])
+    # Listings that have not ended yet are still active or pending
+    ended = end_of_listing_date <= pd.Timestamp(end_date)
+    sold = (outcome == 'sold') & ended
+    pending = (outcome == 'sold') & ~ended & (rng.random(n) < 0.5)
+    contract_days = np.minimum(rng.integers(15, 60, n), cumulative_dom)
+    under_contract_date = pd.Series(as_dates(end_of_listing_date, -contract_days)).where(sold | pending)
+
+    city_names = list(CITIES)
+    city_index = rng.choice(len(city_names), n, p=[CITIES[city][0] for city in city_names])
+    type_names = list(BUILDING_TYPES)
+    type_index = rng.choice(len(type_names), n, p=[BUILDING_TYPES[kind][0] for kind in type_names])
+    sqft_living = np.clip(np.array([BUILDING_TYPES[kind][1] for kind in type_names])[type_index]
+                          * rng.lognormal(0, 0.3, n), 450, 12000).astype(np.int64)
+    years_in = (listing_date - start).days.to_numpy() / 365.25
+    price_per_sqft = (np.array([CITIES[city][4] for city in city_names])[city_index]
+                      * 1.05 ** (years_in - years) * rng.lognormal(0, 0.2, n))
+    list_price = np.round(price_per_sqft * sqft_living, -3)
+    sold_price = pd.Series(np.round(list_price * rng.uniform(0.88, 1.02, n), -2)).where(sold)
+    sold_date = pd.Series(end_of_listing_date).where(sold)
+
+    def event_date(column):
+        return pd.Series(end_of_listing_date).where(pd.Series(outcome == column) & ended)
+
+    expiration_date = pd.Series(as_dates(listing_date, np.where(outcome == 'expired', cumulative_dom, 180)))
+    subdivision_number = rng.integers(0, SUBDIVISIONS_PER_CITY, n)
+    lots = max(n * 7 // (10 * len(city_names) * SUBDIVISIONS_PER_CITY), 1)
+    parcel_prefix = (city_index + 1) * 10 ** 8 + subdivision_number * 10 ** 4
+    parcel_number = parcel_prefix * 10 ** 7 + rng.integers(0, lots, n)
+    street_number = rng.integers(100, 9999, n)
+
+    generators = {
+        'listing_number': lambda: np.char.add('l', (1000000 + first_number + np.arange(n)).astype(str)),
+        'cumulative_dom': lambda: cumulative_dom,
+        'days_on_market': lambda: np.maximum(cumulative_dom - rng.integers(0, 30, n) * (rng.random(n) < 0.2), 0),
+        'short_address': lambda: (pd.Series(street_number.astype(str)) + ' ' + pick(rng, STREETS, n)
+                                  + ' ' + pick(rng, STREET_SUFFIXES, n)),
+        'baths_full': lambda: np.clip(sqft_living // 900 + rng.integers(0, 2, n), 1, 8),
+        'baths_half': lambda: rng.integers(0, 2, n),
+        'cancel_date': lambda: event_date('cancelled'),
+        'listing_date': lambda: listing_date,
+        'list_price': lambda: list_price,
+        'front_exp': lambda: pick(rng, ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw'], n),
+        'expiration_date': lambda: expiration_date,
+        'parcel_id': lambda: pd.Series(parcel_number.astype(str)).str.zfill(17),
+        'sold_date': lambda: sold_date,
+        'sold_price': lambda: sold_price,
+        'sqft_living': lambda: sqft_living,
+        'sqft_total': lambda: (sqft_living * rng.uniform(1.1, 1.5, n)).astype(np.int64),
+        'under_contract_date': lambda: under_contract_date,
+        'waterfront': lambda: rng.random(n) < 0.2,
+        'withdrawn_date': lambda: event_date('withdrawn'),
+        'year_built': lambda: rng.integers(1955, 2025, n),
+        'year_roof_installed': lambda: rng.integers(1995, 2025, n),
+        'sqft_guest_house': lambda: np.where(rng.random(n) < 0.03, rng.integers(300, 900, n), 0),
+        'construction_cbs': lambda: rng.random(n) < 0.7,
+        'storm_protection_accordion_shutters': lambda: pick(rng, ['yes', 'nan'], n, [0.2, 0.8]),
+        'storm_protection_impact_glass': lambda: pick(rng, ['yes', 'nan'], n, [0.4, 0.6]),
+        'storm_protection_panel_shutters': lambda: pick(rng, ['yes', 'nan'], n, [0.3, 0.7]),
+        'public_remarks': lambda: pick(rng, REMARKS, n),
+        'area': lambda: pick(rng, [str(area) for area in range(10, 50)], n),
+        'temp_off_market_date': lambda: event_date('temp_off'),
+        'garage_spaces': lambda: np.where(type_index == 1, 0, rng.integers(1, 4, n)),
+        'furnished_furnished': lambda: rng.random(n) < 0.3,
+        'subdivision': lambda: np.char.add(np.array(city_names)[city_index].astype(str),
+                                           np.char.add(' subdivision ', subdivision_number.astype(str))),
+        'terms_of_sale': lambda: pick(rng, list(TERMS_OF_SALE), n, list(TERMS_OF_SALE.values())),
+        'zip_code': lambda: np.array([CITIES[city][1] for city in city_names])[city_index],
+        'city': lambda: np.array(city_names)[city_index],
+        'guest_house': lambda: rng.random(n) < 0.03,
+        'high_school': lambda: pick(rng, HIGH_SCHOOLS, n),
+        'homeowners_assoc': lambda: rng.random(n) < 0.6,
+        'lot_sqft': lambda: np.where(type_index == 1, 0, (sqft_living * rng.uniform(2, 6, n)).astype(np.int64)),
+        'private_pool': lambda: rng.random(n) < 0.45,
+        'sold_price_sqft': lambda: sold_price.to_numpy() / sqft_living,
+        'legal_desc': lambda: np.char.add(generators['subdivision'](), np.char.add(' lot ', (parcel_number % 10 ** 7).astype(str))),
+        'spa': lambda: rng.random(n) < 0.15,
+        'state_province': lambda: np.full(n, 'fl'),
+        'street_number': lambda: street_number,
+        'tax_year': lambda: listing_date.year.to_numpy() - 1,
+        'taxes': lambda: np.round(list_price * rng.uniform(0.008, 0.014, n), 2),
+        'total_bedrooms': lambda: np.clip(sqft_living // 600 + rng.integers(0, 2, n), 1, 8),
+        'total_floors_stories': lambda: np.where(type_index == 1, rng.integers(2, 25, n), rng.integers(1, 3, n)),
+        'total_units_in_bldg': lambda: np.where(type_index == 1, rng.integers(10, 200, n), 1),
+        'ttl_units_in_complex': lambda: np.where(type_index == 0, 0, rng.integers(20, 600, n)),
+        'original_list_price': lambda: np.round(list_price * rng.uniform(1.0, 1.1, n), -3),
+        'development_name': lambda: pick(rng, ['pelican bay', 'park shore', 'the quarry', 'fiddlers creek',
+                                               'grey oaks', 'nan'], n),
+        'unit_floor_number': lambda: np.where(type_index == 1, rng.integers(1, 20, n), 0),
+        'unit_number': lambda: np.where(type_index == 1, rng.integers(101, 2099, n).astype(str), 'nan'),
+        'type': lambda: np.array(type_names)[type_index],
+        'geo_area': lambda: pick(rng, ['na01', 'na05', 'na12', 'bn01', 'fm03', 'mi01'], n),
+        'geo_lat': lambda: np.array([CITIES[city][2] for city in city_names])[city_index] + rng.normal(0, 0.03, n),
+        'geo_lon': lambda: np.array([CITIES[city][3] for city in city_names])[city_index] + rng.normal(0, 0.03, n),
+        'hoa_poa_coa_monthly': lambda: np.where(type_index == 0, 0, np.round(rng.uniform(200, 1500, n), 2)),
+        'special_assessment': lambda: rng.random(n) < 0.05,
+        'parcel_subdivision': lambda: generators['parcel_id']().str[:10],
+        'event_date': lambda: (sold_date.fillna(event_date('cancelled')).fillna(event_date('withdrawn'))
+                               .fillna(pd.Series(expiration_date).where(pd.Series(outcome == 'expired') & ended))
+                               .fillna(event_date('temp_off'))),
+        'end_of_listing_date': lambda: end_of_listing_date
+    }
+
+    frame = {}
+    for column in columns:
+        values = pd.Series(generators[column]())
+        if 'datetime' in data_dict[column]:
+            values = values.astype('datetime64[ns]')
+        elif data_dict[column] == 'str':
+            values = values.astype(str)
+        frame[column] = values
+    return pd.DataFrame(frame, columns=columns)
+
+def benchmark_columns():
+    """The columns the statistics read plus the segment columns the UI filters on."""
+    return SEGMENT_COLUMNS + get_required_columns(KERNEL_STATISTICS)
+
+def time_statistic(df, num_rows, timeframe, years, stat, backend='numpy', repeat=3, end_date=DATA_END):
+    """Best-of-`repeat` and median seconds for one statistic, timeframe and range length."""
+    start_date = pd.Timestamp(end_date) - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+    params = {'timeframe': timeframe, 'start_date': start_date.strftime('%Y-%m-%d'),
+              'end_date': pd.Timestamp(end_date).strftime('%Y-%m-%d'),
+              'stats_to_calculate': [stat], 'backend': backend}
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = analyze_real_estate_data(df, params)[stat]
+        timings.append(time.perf_counter() - started)
+    if isinstance(value, str):
+        logging.error(f"{stat} ({timeframe}, {years}y, {num_rows} rows): {value}")
+    return {'rows': num_rows, 'timeframe': timeframe, 'years': years,
+            'statistic': stat, 'seconds': min(timings), 'median_seconds': float(np.median(timings))}
+
+def time_statistics(df, num_rows, backend='numpy', repeat=3, end_date=DATA_END):
+    """Timings of every statistic, timeframe and range length."""
+    return [time_statistic(df, num_rows, timeframe, years, stat, backend, repeat, end_date)
+            for years in RANGE_YEARS for timeframe in TIMEFRAMES for stat in KERNEL_STATISTICS]
+
+def run_suite(sizes=SIZES, backend='numpy', repeat=3, seed=0, all_columns=False):
+    """Generate each dataset size once and time every statistic on it."""
+    results = []
+    for num_rows in sizes:
+        started = time.perf_counter()
+        df = generate_listing_frame(num_rows, seed, columns=None if all_columns else benchmark_columns())
+        logging.info(f"Generated {num_rows} listings in {time.perf_counter() - started:.1f}s.")
+        results.extend(time_statistics(df, num_rows, backend, repeat))
+        del df
+    return {
+        'metadata': {
+            'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'backend': backend,
+            'repeat': repeat,
+            'seed': seed,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.platform()
+        },
+        'results': results
+    }
+
+def save_results(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Reports differing in these settings time different work and cannot be compared
+COMPARABLE_METADATA = ['backend', 'seed']
+
+def compare_to_baseline(report, baseline, max_slowdown_percent=20.0, min_seconds=0.03):
+    """
+    Return the timings more than `max_slowdown_percent` slower than the baseline.
+
+    Timings are matched on (rows, timeframe, years, statistic) and compared by their median over
+    the repeats (best-of for baselines recorded without one). Measurements where both runs are
+    under `min_seconds` are timer noise and never count as regressions. Raises ValueError when
+    the reports differ in a COMPARABLE_METADATA setting.
+    """
+    for name in COMPARABLE_METADATA:
+        if report['metadata'].get(name) != baseline['metadata'].get(name):
+            raise ValueError(f"cannot compare a {name}={report['metadata'].get(name)} run with a "
+                             f"{name}={baseline['metadata'].get(name)} baseline")
+
+    def key(result):
+        return (result['rows'], result['timeframe'], result['years'], result['statistic'])
+
+    def seconds(result):
+        return result.get('median_seconds', result['seconds'])
+
+    baseline_seconds = {key(result): seconds(result) for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        previous = baseline_seconds.get(key(result))
+        current = seconds(result)
+        if previous is None or max(previous, current) < min_seconds:
+            continue
+        slowdown = (current / previous - 1) * 100 if previous else float('inf')
+        if slowdown > max_slowdown_percent:
+            rows.append(dict(result, seconds=current, baseline_seconds=previous, slowdown_percent=slowdown))
+    return pd.DataFrame(rows, columns=['rows', 'timeframe', 'years', 'statistic', 'seconds',
+                                       'baseline_seconds', 'slowdown_percent'])
+
+def confirm_regressions(regressions, baseline, max_slowdown_percent=20.0, backend='numpy', repeat=3, seed=0,
+                        all_columns=False):
+    """
+    Time the regressed statistics again and keep those still slower than the baseline, so a
+    burst of load on a shared machine during one measurement is not reported as a regression.
+    """
+    if regressions.empty:
+        return regressions
+    retimed = []
+    for num_rows, rows in regressions.groupby('rows'):
+        df = generate_listing_frame(int(num_rows), seed, columns=None if all_columns else benchmark_columns())
+        retimed.extend(time_statistic(df, int(num_rows), row.timeframe, int(row.years), row.statistic, backend, repeat)
+                       for row in rows.itertuples())
+        del df
+    confirmed = compare_to_baseline({'metadata': baseline['metadata'], 'results': retimed}, baseline,
+                                    max_slowdown_percent, min_seconds=0)
+    keys = ['rows', 'timeframe', 'years', 'statistic']
+    still_slower = set(confirmed[keys].itertuples(index=False, name=None))
+    return regressions[[key in still_slower for key in regressions[keys].itertuples(index=False, name=None)]]
+
+def summarize(report):
+    table = pd.DataFrame(report['results'])
+    table['ms'] = table['seconds'] * 1000
+    return table.pivot_table(index=['statistic'], columns=['rows', 'timeframe', 'years'], values='ms')
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every statistic across timeframes, ranges and dataset sizes.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "pandas"])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per timing; regressions compare their median")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--all_columns", action='store_true', help="Generate every data dictionary column")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results JSON")
+    parser.add_argument("--baseline", help="Baseline results JSON to check for regressions")
+    parser.add_argument("--max_slowdown", type=float, default=20.0, help="Allowed slowdown in percent")
+    parser.add_argument("--min_ms", type=float, default=30.0, help="Ignore timings below this in both runs")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    if baseline is not None:
+        # Checked before the run so a mismatched baseline fails at once
+        for name in COMPARABLE_METADATA:
+            if baseline['metadata'].get(name) != getattr(args, name):
+                parser.error(f"--{name} {getattr(args, name)} differs from the baseline's {baseline['metadata'].get(name)}")
+    report = run_suite(args.sizes, args.backend, args.repeat, args.seed, args.all_columns)
+    save_results(report, args.output)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(summarize(report).round(2).to_string())
+
+    if args.baseline:
+        regressions = compare_to_baseline(report, baseline, args.max_slowdown, args.min_ms / 1000)
+        regressions = confirm_regressions(regressions, baseline, args.max_slowdown, args.backend, args.repeat,
+                                          args.seed, args.all_columns)
+        if not regressions.empty:
+            print(f"\n{len(regressions)} timings regressed more than {args.max_slowdown}%:")
+            print(regressions.to_string(index=False))
+            sys.exit(1)
+        print(f"\nNo statistic is more than {args.max_slowdown}% slower than {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import instrumentation
+
+# A columnar copy of the joined listing view (listing_details, properties and location) as
+# uncompressed Arrow IPC files, one per listing year and city, each sorted by listing date.
+# Files are memory-mapped, so a read touches only the partitions and rows its filters select and
+# the column buffers are used in place. manifest.json records the partitions and the data
+# version and table rowids the snapshot was built at, so an ingest that only appended listings
+# rewrites just the partitions those listings fall into.
+
+SNAPSHOT_SUFFIX = '.columnar'
+MANIFEST_FILE = 'manifest.json'
+VIEW_TABLES = ['listing_details', 'properties', 'location']
+NULL_PARTITION = '__null__'
+
+ARROW_TYPES = {
+    'DATETIME': pa.timestamp('us'),
+    'INTEGER': pa.int64(),
+    'BOOLEAN': pa.int64(),
+    'REAL': pa.float64()
+}
+
+def snapshot_directory(db_file):
+    return db_file + SNAPSHOT_SUFFIX
+
+def snapshot_exists(db_file):
+    return os.path.exists(os.path.join(snapshot_directory(db_file), MANIFEST_FILE))
+
+def partition_path(year, city):
+    """Relative path of a partition, hive style, with the city escaped for the file system."""
+    year_part = NULL_PARTITION if year is None else str(year)
+    city_part = NULL_PARTITION if city is None else quote(city, safe='')
+    return os.path.join(f'year={year_part}', f'city={city_part}', 'part.arrow')
+
+def view_schema(conn):
+    """Column names and Arrow schema of the joined listing view, from the declared column types."""
+    columns = []
+    fields = []
+    for table in VIEW_TABLES:
+        for _, name, declared, _, _, _ in conn.execute(f"PRAGMA table_info({table})"):
+            if name in columns:
+                continue
+            columns.append(name)
+            fields.append(pa.field(name, ARROW_TYPES.get(declared.upper(), pa.string())))
+    return columns, pa.schema(fields)
+
+def view_query(columns, where_clause="1=1"):
+    select_list = ", ".join(f"listing_details.{column}" if column == 'listing_number' else column for column in columns)
+    return f"""
+    SELECT {select_list}
+    FROM listing_details
+    JOIN properties ON listing_details.listing_number = properties.listing_number
+    JOIN location ON listing_details.listing_number = location.listing_number
+    WHERE {where_clause}
+    """
+
+def to_arrow(df, schema):
+    """Convert a frame read from SQLite to an Arrow table of `schema`, parsing the date text."""
+    arrays = []
+    for field in schema:
+        values = df[field.name]
+        if pa.types.is_timestamp(field.type):
+            values = pd.to_datetime(values, errors='coerce')
+        arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def sort_by_date(table):
+    return table.sort_by([('listing_date', 'ascending')]) if table.num_rows else table
+
+def write_partition(directory, relative_path, table):
+    """Write one partition file atomically; readers holding the old file keep their mapping."""
+    path = os.path.join(directory, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # One record batch, so each column maps as a single contiguous buffer
+    table = table.combine_chunks()
+    temporary = path + '.tmp'
+    with pa.OSFile(temporary, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary, path)
+
+def partition_entry(year, city, table):
+    dates = table['listing_date']
+    return {
+        'year': year,
+        'city': city,
+        'path': partition_path(year, city),
+        'rows': table.num_rows,
+        'min_date': str(pc.min(dates).as_py()) if table.num_rows else None,
+        'max_date': str(pc.max(dates).as_py()) if table.num_rows else None
+    }
+
+def split_partitions(table):
+    """Split a view table into {(year, city): table}, each sorted by listing date."""
+    if not table.num_rows:
+        return {}
+    frame = pd.DataFrame({
+        'year': pc.year(table['listing_date']).to_pandas(),
+        'city': table['city'].to_pandas()
+    })
+    partitions = {}
+    for (year, city), positions in frame.groupby(['year', 'city'], dropna=False, sort=True).indices.items():
+        year = None if pd.isna(year) else int(year)
+        city = None if pd.isna(city) else city
+        partitions[(year, city)] = sort_by_date(table.take(positions))
+    return partitions
+
+class ColumnarSnapshot:
+    """
+    Reads and maintains the columnar snapshot of `db_file` kept in `directory` (by default next
+    to the database). Open partitions are cached, so repeated reads map each file once.
+    """
+
+    def __init__(self, db_file, directory=None):
+        self.db_file = db_file
+        self.directory = directory or snapshot_directory(db_file)
+        self.manifest = None
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.load_manifest()
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = None
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read the columnar snapshot manifest in {self.directory}: {e}")
+            self.manifest = None
+        self.tables = {}
+        return self.manifest
+
+    def save_manifest(self, manifest, directory=None):
+        directory = directory or self.directory
+        temporary = os.path.join(directory, MANIFEST_FILE + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temporary, os.path.join(directory, MANIFEST_FILE))
+
+    @property
+    def data_version(self):
+        return self.manifest['data_version'] if self.manifest else None
+
+    def schema(self):
+        return pa.schema([pa.field(name, pa.type_for_alias(alias)) for name, alias in self.manifest['schema']])
+
+    def build(self, data_loader):
+        """Export the whole view, one listing year at a time, replacing any existing snapshot."""
+        started = time.perf_counter()
+        conn = data_loader.create_connection()
+        if conn is None:
+            return None
+        try:
+            with instrumentation.span('columnar_snapshot_build', category='snapshot'):
+                conn.execute("BEGIN")
+                data_version = conn.execute("PRAGMA user_version").fetchone()[0]
+                max_rowids = {table: conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+                              for table in VIEW_TABLES}
+                columns, schema = view_schema(conn)
+                years = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT substr(listing_date, 1, 4) FROM listing_details ORDER BY 1")]
+
+                building = self.directory + '.building'
+                shutil.rmtree(building, ignore_errors=True)
+                os.makedirs(building)
+                partitions = {}
+                null_year_tables = {}
+                for year in years:
+                    if year is None:
+                        where_clause, values = "listing_date IS NULL", []
+                    else:
+                        where_clause, values = "substr(listing_date, 1, 4) = ?", [year]
+                    df = pd.read_sql_query(view_query(columns, where_clause), conn, params=values)
+                    for key, table in split_partitions(to_arrow(df, schema)).items():
+                        if key[0] is None:
+                            # Missing and unparseable dates of every year share the null-year partitions
+                            if key in null_year_tables:
+                                table = pa.concat_tables([null_year_tables[key], table])
+                            null_year_tables[key] = table
+                        write_partition(building, partition_path(*key), table)
+                        partitions[key] = partition_entry(*key, table)
+                conn.rollback()
+        except Exception as e:
+            logging.error(f"Failed to build the columnar snapshot of {self.db_file}: {e}")
+            return None
+        finally:
+            data_loader.close_connection(conn)
+
+        manifest = {
+            'data_version': data_version,
+            'max_rowids': max_rowids,
+            'schema': [(field.name, str(field.type)) for field in schema],
+            'partitions': list(partitions.values())
+        }
+        self.save_manifest(manifest, building)
+        with self.lock:
+            # Swap directories; open mappings of the old files stay valid until they are dropped
+            previous = self.directory + '.previous'
+            shutil.rmtree(previous, ignore_errors=True)
+            if os.path.exists(self.directory):
+                os.replace(self.directory, previous)
+            os.replace(building, self.directory)
+            shutil.rmtree(previous, ignore_errors=True)
+            self.load_manifest()
+        seconds = time.perf_counter() - started
+        logging.info(f"Columnar snapshot of {self.db_file} built in {seconds:.2f}s: "
+                     f"{sum(part['rows'] for part in partitions.values())} rows in {len(partitions)} partitions.")
+        return manifest
+
+    def update(self, data_loader):
+        """
+        Bring the snapshot up to the database's data version after an ingest.
+
+        If the view's tables only had rows appended since the snapshot, the new listings are
+        read by rowid and only their partitions are rewritten; otherwise it is rebuilt.
+        """
+        if self.manifest is None:
+            return self.build(data_loader)
+        started = time.perf_counter()
+        conn = data_loader.create_connection()
+        if conn is None:
+            return None
+        try:
+            conn.execute("BEGIN")
+            data_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if data_version == self.data_version:
+                return self.manifest
+            has_versions = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name = 'table_versions'").fetchone()[0]
+            rewritten = dict(conn.execute("SELECT name, rewritten_version FROM table_versions")) if has_versions else None
+            if rewritten is None or any(rewritten.get(table, 0) > self.data_version for table in VIEW_TABLES + ['*']):
+                needs_rebuild = True
+            else:
+                needs_rebuild = False
+                max_rowids = {table: conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+                              for table in VIEW_TABLES}
+                schema = self.schema()
+                new_rows = " OR ".join(f"{table}.rowid > ?" for table in VIEW_TABLES)
+                df = pd.read_sql_query(view_query(schema.names, new_rows), conn,
+                                       params=[self.manifest['max_rowids'][table] for table in VIEW_TABLES])
+            conn.rollback()
+        except Exception as e:
+            logging.error(f"Failed to read new listings for the columnar snapshot of {self.db_file}: {e}")
+            return None
+        finally:
+            data_loader.close_connection(conn)
+        if needs_rebuild:
+            logging.info("Listings were changed or deleted since the columnar snapshot; rebuilding it.")
+            return self.build(data_loader)
+
+        with instrumentation.span('columnar_snapshot_update', category='snapshot', rows=len(df)):
+            manifest = dict(self.manifest, data_version=data_version, max_rowids=max_rowids)
+            entries = {(part['year'], part['city']): part for part in self.manifest['partitions']}
+            added = split_partitions(to_arrow(df, schema))
+            for key, table in added.items():
+                if key in entries:
+                    table = sort_by_date(pa.concat_tables([self.open_partition(entries[key]), table]))
+                write_partition(self.directory, partition_path(*key), table)
+                entries[key] = partition_entry(*key, table)
+            manifest['partitions'] = [entries[key] for key in sorted(entries, key=lambda key: (key[0] is None, key[0] or 0,
+                                                                                              key[1] is None, key[1] or ''))]
+            with self.lock:
+                self.save_manifest(manifest)
+                self.load_manifest()
+        logging.info(f"Columnar snapshot of {self.db_file} updated in {time.perf_counter() - started:.2f}s: "
+                     f"{len(df)} new rows in {len(added)} partitions.")
+        return manifest
+
+    def open_partition(self, entry):
+        """The partition's table, memory-mapped on first use."""
+        table = self.tables.get(entry['path'])
+        if table is None:
+            source = pa.memory_map(os.path.join(self.directory, entry['path']), 'r')
+            table = self.tables[entry['path']] = pa.ipc.open_file(source).read_all()
+        return table
+
+    def read(self, params, columns=None, cancel_event=None):
+        """
+        Return the listings matching the city, subdivision, building type and listing date
+        filters of `params`, as fetch_filtered_data does, with dates as datetimes.
+
+        Partitions outside the city and date range are skipped and the date range is located by
+        binary search in each sorted partition. Returns None when a requested column is not in
+        the snapshot.
+        """
+        with self.lock:
+            manifest = self.manifest
+            schema = self.schema()
+        columns = [column.split('.')[-1] for column in columns] if columns else schema.names
+        if any(column not in schema.names for column in columns):
+            return None
+
+        def selected(name):
+            value = params.get(name)
+            return value if value and value != "All" else None
+        city, subdivision, building_type = selected('city'), selected('subdivision'), selected('building_type')
+        start = pd.Timestamp(params['start_date']) if params.get('start_date') else None
+        end = pd.Timestamp(params['end_date']) + pd.Timedelta(days=1) if params.get('end_date') else None
+
+        pieces = []
+        for entry in manifest['partitions']:
+            if city is not None and entry['city'] != city:
+                continue
+            if (start is not None or end is not None) and entry['year'] is None:
+                continue
+            if start is not None and entry['max_date'] < str(start):
+                continue
+            if end is not None and entry['min_date'] >= str(end):
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                return pd.DataFrame(columns=columns)
+            table = self.open_partition(entry)
+            if start is not None or end is not None:
+                dates = table['listing_date'].combine_chunks().cast(pa.int64()).to_numpy(zero_copy_only=False)
+                # Timestamp.value is in nanoseconds, the partitions in microseconds
+                lo = int(np.searchsorted(dates, start.value // 1000)) if start is not None else 0
+                hi = int(np.searchsorted(dates, end.value // 1000)) if end is not None else len(dates)
+                table = table.slice(lo, hi - lo)
+            if subdivision is not None:
+                table = table.filter(pc.equal(table['subdivision'], subdivision))
+            if building_type is not None:
+                table = table.filter(pc.equal(table['type'], building_type))
+            if table.num_rows:
+                pieces.append(table.select(columns))
+        if not pieces:
+            return pa.schema([schema.field(column) for column in columns]).empty_table().to_pandas()
+        return pa.concat_tables(pieces).to_pandas()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the columnar snapshot of a database.")
+    parser.add_argument("db_filename", help="Database file path")
+    parser.add_argument("--rebuild", action='store_true', help="Rebuild from scratch instead of updating")
+    args = parser.parse_args()
+
+    instrumentation.configure_logging('columnar_snapshot.log')
+    from Data_Loader import DataLoader
+    snapshot = ColumnarSnapshot(args.db_filename)
+    data_loader = DataLoader(args.db_filename)
+    manifest = snapshot.build(data_loader) if args.rebuild else snapshot.update(data_loader)
+    if manifest is not None:
+        print(f"{sum(part['rows'] for part in manifest['partitions'])} rows in {len(manifest['partitions'])} "
+              f"partitions at data version {manifest['data_version']}")
@@ -0,0 +1,194 @@
+import logging
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from Data_Loader import EARTH_RADIUS_MILES
+
+# Weights of the feature distance used to rank comparables. Each term is scaled so that 1.0 is
+# roughly "noticeably different": the full search radius, 25% of living area, one bedroom, one
+# bathroom, or a pool/waterfront mismatch.
+FEATURE_WEIGHTS = {
+    'distance': 1.0,
+    'sqft_living': 2.0,
+    'total_bedrooms': 0.5,
+    'baths': 0.5,
+    'private_pool': 0.5,
+    'waterfront': 1.0
+}
+
+SUBJECT_COLUMNS = ['geo_lat', 'geo_lon', 'sqft_living', 'total_bedrooms', 'baths_full', 'baths_half',
+                   'private_pool', 'waterfront']
+
+# Candidate lists of subjects left short of k comparables by the date window grow by this factor
+CANDIDATE_GROWTH = 4
+# Subjects are searched in chunks of at most this many subject x candidate pairs
+QUERY_PAIRS = 2 ** 21
+
+def to_unit_vectors(lat, lon):
+    """Map latitude/longitude in degrees to points on the unit sphere."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def miles_to_chord(miles):
+    return 2 * np.sin(np.asarray(miles) / (2 * EARTH_RADIUS_MILES))
+
+def chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+def as_flag(values):
+    """Booleans stored as 0/1, True/False or 'True'/'False' text become 0.0/1.0, missing as NaN."""
+    mapped = pd.Series(values).map({True: 1.0, False: 0.0, 1: 1.0, 0: 0.0, 'True': 1.0, 'False': 0.0, '1': 1.0, '0': 0.0})
+    return mapped.to_numpy(dtype=np.float64)
+
+class ComparableSalesFinder:
+    """
+    Finds comparable sold listings around subject properties.
+
+    Sold listings are indexed in a KD-tree over 3-D unit vectors, so a chord-distance radius is an
+    exact great-circle radius. The tree is rebuilt only when the loader's data version changes.
+    """
+
+    def __init__(self, data_loader):
+        self.data_loader = data_loader
+        self.data_version = None
+        self.tree = None
+        self.sales = None
+
+    def refresh(self):
+        """Rebuild the index if the database changed since it was built."""
+        data_version = self.data_loader.get_data_version()
+        if self.tree is not None and data_version == self.data_version:
+            return
+        sales = self.data_loader.fetch_sold_listing_features()
+        sales['sold_date'] = pd.to_datetime(sales['sold_date'], errors='coerce')
+        sales = sales[sales['sold_date'].notna()].reset_index(drop=True)
+        self.sales = sales
+        self.arrays = {
+            'listing_number': sales['listing_number'].astype(str).to_numpy(dtype=object),
+            'sold_date': sales['sold_date'].to_numpy(dtype='datetime64[ns]'),
+            'sqft_living': pd.to_numeric(sales['sqft_living'], errors='coerce').to_numpy(dtype=np.float64),
+            'total_bedrooms': pd.to_numeric(sales['total_bedrooms'], errors='coerce').to_numpy(dtype=np.float64),
+            'baths': (pd.to_numeric(sales['baths_full'], errors='coerce').fillna(0)
+                      + 0.5 * pd.to_numeric(sales['baths_half'], errors='coerce').fillna(0)).to_numpy(dtype=np.float64),
+            'private_pool': as_flag(sales['private_pool']),
+            'waterfront': as_flag(sales['waterfront'])
+        }
+        self.tree = cKDTree(to_unit_vectors(sales['geo_lat'], sales['geo_lon']))
+        self.data_version = data_version
+        logging.info(f"Comparable sales index built over {len(sales)} sold listings (data version {data_version}).")
+
+    def find_comps_batch(self, subjects, k=5, radius_miles=1.0, start_date=None, end_date=None,
+                         weights=None, candidates=None):
+        """
+        Find up to `k` comparables for every row of `subjects` in one vectorized pass.
+
+        `subjects` needs the SUBJECT_COLUMNS; a `listing_number` column excludes each subject's own
+        sale. Comparables are sold listings within `radius_miles` that sold between `start_date`
+        and `end_date`, ranked by weighted feature distance among the `candidates` nearest
+        qualifying sales (default max(8k, 32)). Subjects with fewer than `candidates` qualifying
+        sales among their nearest ones are searched again with more, until the radius is used up.
+        Returns a DataFrame with a `subject` column holding the subject's row position.
+        """
+        self.refresh()
+        weights = dict(FEATURE_WEIGHTS, **(weights or {}))
+        candidates = min(candidates or max(8 * k, 32), len(self.sales))
+        if candidates == 0 or len(subjects) == 0:
+            return pd.DataFrame(columns=['subject', 'rank', 'distance_miles', 'score'] + list(self.sales.columns if self.sales is not None else []))
+
+        points = to_unit_vectors(subjects['geo_lat'], subjects['geo_lon'])
+        subject_numbers = (subjects['listing_number'].astype(str).to_numpy(dtype=object)
+                           if 'listing_number' in subjects.columns else None)
+        subject, chord, index, position = self.qualifying_candidates(
+            points, candidates, radius_miles, start_date, end_date, subject_numbers)
+
+        def subject_values(column):
+            return pd.to_numeric(subjects[column], errors='coerce').to_numpy(dtype=np.float64)[subject]
+
+        subject_sqft = subject_values('sqft_living')
+        subject_baths = (np.nan_to_num(subject_values('baths_full')) + 0.5 * np.nan_to_num(subject_values('baths_half')))
+        distance_miles = chord_to_miles(chord)
+
+        terms = {
+            'distance': distance_miles / radius_miles,
+            'sqft_living': np.abs(self.arrays['sqft_living'][index] - subject_sqft) / (0.25 * subject_sqft),
+            'total_bedrooms': np.abs(self.arrays['total_bedrooms'][index] - subject_values('total_bedrooms')),
+            'baths': np.abs(self.arrays['baths'][index] - subject_baths),
+            'private_pool': np.abs(self.arrays['private_pool'][index] - as_flag(subjects['private_pool'])[subject]),
+            'waterfront': np.abs(self.arrays['waterfront'][index] - as_flag(subjects['waterfront'])[subject])
+        }
+        score = np.zeros(len(index))
+        for name, term in terms.items():
+            # A feature missing on either side neither helps nor hurts the comparable
+            score += weights[name] * np.nan_to_num(term, nan=0.0, posinf=0.0)
+
+        # Best score first within each subject, nearer candidates first among equal scores
+        order = np.lexsort((position, score, subject))
+        subject, index, score, distance_miles = subject[order], index[order], score[order], distance_miles[order]
+        starts = np.searchsorted(subject, subject)
+        rank = np.arange(len(subject)) - starts
+        keep = rank < k
+
+        comps = self.sales.iloc[index[keep]].reset_index(drop=True)
+        comps.insert(0, 'score', score[keep])
+        comps.insert(0, 'distance_miles', distance_miles[keep])
+        comps.insert(0, 'rank', rank[keep] + 1)
+        comps.insert(0, 'subject', subject[keep])
+        return comps
+
+    def qualifying_candidates(self, points, candidates, radius_miles, start_date, end_date, subject_numbers):
+        """
+        Search the `candidates` nearest sales of every point and keep the qualifying ones.
+
+        Points left with fewer than `candidates` qualifying sales while all their candidates are
+        inside the radius are searched again with CANDIDATE_GROWTH times more, alone, so memory
+        follows each point's own candidate count, and each search covers at most QUERY_PAIRS
+        point x candidate pairs. Returns flat (subject, chord, index, position) arrays of the
+        qualifying candidates, `position` being the rank by distance.
+        """
+        wanted = candidates
+        pending = np.arange(len(points))
+        found = []
+        while len(pending):
+            short_rows = []
+            chunk_rows = max(QUERY_PAIRS // candidates, 1)
+            for chunk in np.array_split(pending, -(-len(pending) // chunk_rows)):
+                chord, index = self.query_nearest(points[chunk], candidates, radius_miles)
+                numbers = subject_numbers[chunk] if subject_numbers is not None else None
+                valid = self.qualifying(chord, index, start_date, end_date, numbers)
+                # Rows whose every candidate is inside the radius may have qualifying sales further out
+                short = (valid.sum(axis=1) < wanted) & np.isfinite(chord[:, -1])
+                if candidates >= len(self.sales):
+                    short[:] = False
+                rows, columns = np.nonzero(valid & ~short[:, None])
+                found.append((chunk[rows], chord[rows, columns], index[rows, columns], columns))
+                short_rows.append(chunk[short])
+            pending = np.concatenate(short_rows)
+            candidates = min(candidates * CANDIDATE_GROWTH, len(self.sales))
+        return tuple(np.concatenate(parts) for parts in zip(*found))
+
+    def query_nearest(self, points, candidates, radius_miles):
+        """Chord distances and sale positions of the `candidates` nearest sales; beyond the radius is inf and 0."""
+        chord, index = self.tree.query(points, k=candidates, distance_upper_bound=miles_to_chord(radius_miles))
+        chord = chord.reshape(len(points), candidates)
+        index = index.reshape(len(points), candidates)
+        return chord, np.where(np.isfinite(chord), index, 0)
+
+    def qualifying(self, chord, index, start_date, end_date, subject_numbers):
+        """Mask of candidates inside the radius, sold in the date window and not the subject itself."""
+        valid = np.isfinite(chord)
+        sold_date = self.arrays['sold_date'][index]
+        if start_date is not None:
+            valid &= sold_date >= np.datetime64(pd.to_datetime(start_date))
+        if end_date is not None:
+            valid &= sold_date <= np.datetime64(pd.to_datetime(end_date))
+        if subject_numbers is not None:
+            valid &= self.arrays['listing_number'][index] != subject_numbers[:, None]
+        return valid
+
+    def find_comps(self, subject, k=5, radius_miles=1.0, start_date=None, end_date=None, weights=None):
+        """Find comparables for one subject given as a dict of SUBJECT_COLUMNS and optionally its listing_number."""
+        columns = SUBJECT_COLUMNS + (['listing_number'] if subject.get('listing_number') is not None else [])
+        subjects = pd.DataFrame([{column: subject.get(column) for column in columns}])
+        comps = self.find_comps_batch(subjects, k, radius_miles, start_date, end_date, weights)
+        return comps.drop(columns=['subject'])
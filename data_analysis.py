@@ -1,13 +1,14 @@
 
+import calendar
 import pandas as pd
+import instrumentation
 from Data_Loader import DataLoader
 
 def get_first_day_of_month(dt):
     return dt.replace(day=1)
 
 def get_last_day_of_month(dt):
-    next_month = dt.replace(day=28) + pd.Timedelta(days=4)
-    return next_month - pd.Timedelta(days=next_month.day)
+    return dt.replace(day=calendar.monthrange(dt.year, dt.month)[1])
 
 def get_first_day_of_quarter(dt):
     quarter_start_month = ((dt.month - 1) // 3) * 3 + 1
@@ -15,7 +16,7 @@ def get_first_day_of_quarter(dt):
 
 def get_last_day_of_quarter(dt):
     quarter_end_month = get_first_day_of_quarter(dt).month + 2
-    return get_last_day_of_month(dt.replace(month=quarter_end_month))
+    return get_last_day_of_month(dt.replace(month=quarter_end_month, day=1))
 
 def get_first_day_of_year(dt):
     return dt.replace(month=1, day=1)
@@ -47,7 +48,7 @@ def calculate_quarterly_new_listings(df, start_date, end_date):
             (df['listing_date'] <= get_last_day_of_quarter(current_date))
         ]
         total_new_listings += quarterly_df['listing_date'].count()
-        current_date = get_first_day_of_quarter(current_date) + pd.offsets.QuarterEnd()
+        current_date = get_last_day_of_quarter(current_date) + pd.Timedelta(days=1)
     return total_new_listings
 
 def calculate_annual_new_listings(df, start_date, end_date):
@@ -59,7 +60,7 @@ def calculate_annual_new_listings(df, start_date, end_date):
             (df['listing_date'] <= get_last_day_of_year(current_date))
         ]
         total_new_listings += annual_df['listing_date'].count()
-        current_date = get_first_day_of_year(current_date) + pd.offsets.YearEnd()
+        current_date = get_last_day_of_year(current_date) + pd.Timedelta(days=1)
     return total_new_listings
 
 def calculate_closed_listings(df, timeframe, start_date, end_date):
@@ -86,7 +87,7 @@ def calculate_quarterly_closed_listings(df, start_date, end_date):
             (df['sold_date'] <= get_last_day_of_quarter(current_date))
         ]
         total_closed_listings += quarterly_df['sold_date'].count()
-        current_date = get_first_day_of_quarter(current_date) + pd.offsets.QuarterEnd()
+        current_date = get_last_day_of_quarter(current_date) + pd.Timedelta(days=1)
     return total_closed_listings
 
 def calculate_annual_closed_listings(df, start_date, end_date):
@@ -98,7 +99,7 @@ def calculate_annual_closed_listings(df, start_date, end_date):
             (df['sold_date'] <= get_last_day_of_year(current_date))
         ]
         total_closed_listings += annual_df['sold_date'].count()
-        current_date = get_first_day_of_year(current_date) + pd.offsets.YearEnd()
+        current_date = get_last_day_of_year(current_date) + pd.Timedelta(days=1)
     return total_closed_listings
 
 def calculate_avg_days_on_market(df, timeframe, start_date, end_date):
@@ -126,7 +127,7 @@ def calculate_quarterly_avg_days_on_market(df, start_date, end_date):
         ]
         total_dom += filtered_df['cumulative_dom'].sum()
         total_sales += filtered_df['sold_date'].count()
-        current_date = get_first_day_of_quarter(current_date) + pd.offsets.QuarterEnd()
+        current_date = get_last_day_of_quarter(current_date) + pd.Timedelta(days=1)
 
     if total_sales == 0:
         return None
@@ -144,7 +145,7 @@ def calculate_annual_avg_days_on_market(df, start_date, end_date):
         ]
         total_dom += filtered_df['cumulative_dom'].sum()
         total_sales += filtered_df['sold_date'].count()
-        current_date = get_first_day_of_year(current_date) + pd.offsets.YearEnd()
+        current_date = get_last_day_of_year(current_date) + pd.Timedelta(days=1)
 
     if total_sales == 0:
         return None
@@ -174,7 +175,7 @@ def calculate_quarterly_total_dollar_volume(df, start_date, end_date):
             (df['sold_date'] <= get_last_day_of_quarter(current_date))
         ]
         total_volume += filtered_df['sold_price'].sum()
-        current_date = get_first_day_of_quarter(current_date) + pd.offsets.QuarterEnd()
+        current_date = get_last_day_of_quarter(current_date) + pd.Timedelta(days=1)
 
     return total_volume
 
@@ -187,7 +188,7 @@ def calculate_annual_total_dollar_volume(df, start_date, end_date):
             (df['sold_date'] <= get_last_day_of_year(current_date))
         ]
         total_volume += filtered_df['sold_price'].sum()
-        current_date = get_first_day_of_year(current_date) + pd.offsets.YearEnd()
+        current_date = get_last_day_of_year(current_date) + pd.Timedelta(days=1)
 
     return total_volume
 
@@ -243,7 +244,7 @@ def calculate_quarterly_list_price_to_sold_price_ratio(df, start_date, end_date)
     while current_date <= end_date:
         monthly_ratio = calculate_monthly_list_price_to_sold_price_ratio(df, current_date, get_last_day_of_month(current_date))
         ratio += monthly_ratio
-        current_date = get_first_day_of_month(current_date) + pd.offsets.MonthEnd()
+        current_date = get_last_day_of_month(current_date) + pd.Timedelta(days=1)
     return ratio / 3
 
 def calculate_annual_list_price_to_sold_price_ratio(df, start_date, end_date):
@@ -252,7 +253,7 @@ def calculate_annual_list_price_to_sold_price_ratio(df, start_date, end_date):
     while current_date <= end_date:
         monthly_ratio = calculate_monthly_list_price_to_sold_price_ratio(df, current_date, get_last_day_of_month(current_date))
         ratio += monthly_ratio
-        current_date = get_first_day_of_month(current_date) + pd.offsets.MonthEnd()
+        current_date = get_last_day_of_month(current_date) + pd.Timedelta(days=1)
     return ratio / 12
 
 def calculate_active_inventory(df, timeframe, end_date):
@@ -315,7 +316,7 @@ def calculate_quarterly_msi(df, start_date, end_date):
         monthly_closed = calculate_monthly_closed_listings(df, current_date, get_last_day_of_month(current_date))
         total_active += monthly_active
         total_closed += monthly_closed
-        current_date = get_first_day_of_month(current_date) + pd.offsets.MonthEnd()
+        current_date = get_last_day_of_month(current_date) + pd.Timedelta(days=1)
 
     if total_closed == 0:
         return None
@@ -331,7 +332,7 @@ def calculate_annual_msi(df, start_date, end_date):
         monthly_closed = calculate_monthly_closed_listings(df, current_date, get_last_day_of_month(current_date))
         total_active += monthly_active
         total_closed += monthly_closed
-        current_date = get_first_day_of_month(current_date) + pd.offsets.MonthEnd()
+        current_date = get_last_day_of_month(current_date) + pd.Timedelta(days=1)
 
     if total_closed == 0:
         return None
@@ -365,7 +366,7 @@ def calculate_quarterly_percent_cash_sales(df, start_date, end_date):
         if monthly_cash is not None:
             total_cash_sales += monthly_cash * calculate_monthly_closed_listings(df, current_date, get_last_day_of_month(current_date))
             total_sales += calculate_monthly_closed_listings(df, current_date, get_last_day_of_month(current_date))
-        current_date = get_first_day_of_month(current_date) + pd.offsets.MonthEnd()
+        current_date = get_last_day_of_month(current_date) + pd.Timedelta(days=1)
 
     if total_sales == 0:
         return None
@@ -381,7 +382,7 @@ def calculate_annual_percent_cash_sales(df, start_date, end_date):
         if monthly_cash is not None:
             total_cash_sales += monthly_cash * calculate_monthly_closed_listings(df, current_date, get_last_day_of_month(current_date))
             total_sales += calculate_monthly_closed_listings(df, current_date, get_last_day_of_month(current_date))
-        current_date = get_first_day_of_month(current_date) + pd.offsets.MonthEnd()
+        current_date = get_last_day_of_month(current_date) + pd.Timedelta(days=1)
 
     if total_sales == 0:
         return None
@@ -413,7 +414,7 @@ def calculate_quarterly_avg_sold_price_per_foot(df, start_date, end_date):
         ]
         total_sold_price += filtered_df['sold_price'].sum()
         total_area += filtered_df['sqft_living'].sum()
-        current_date = get_first_day_of_quarter(current_date) + pd.offsets.QuarterEnd()
+        current_date = get_last_day_of_quarter(current_date) + pd.Timedelta(days=1)
 
     if total_area == 0:
         return None
@@ -431,14 +432,70 @@ def calculate_annual_avg_sold_price_per_foot(df, start_date, end_date):
         ]
         total_sold_price += filtered_df['sold_price'].sum()
         total_area += filtered_df['sqft_living'].sum()
-        current_date = get_first_day_of_year(current_date) + pd.offsets.YearEnd()
+        current_date = get_last_day_of_year(current_date) + pd.Timedelta(days=1)
 
     if total_area == 0:
         return None
 
     return total_sold_price / total_area
 
+SOLD_PRICE_PER_FOOT_PERCENTILES = [0.25, 0.5, 0.75]
+DAYS_ON_MARKET_PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+def get_percentile_label(q):
+    return f"p{round(q * 100)}"
+
+def get_sold_in_timeframe(df, timeframe, start_date, end_date):
+    """Sold listings in the windows a timeframe covers, which end with the last period's final day."""
+    period_end_func = {
+        'monthly': lambda dt: dt,
+        'quarterly': get_last_day_of_quarter,
+        'annually': get_last_day_of_year
+    }
+    period_end = period_end_func[timeframe](end_date)
+    if start_date > end_date:
+        return df.iloc[0:0]
+    return df[(df['sold_date'] >= start_date) & (df['sold_date'] <= period_end)]
+
+def calculate_median_sold_price(df, timeframe, start_date, end_date):
+    return get_sold_in_timeframe(df, timeframe, start_date, end_date)['sold_price'].median()
+
+def calculate_sold_price_per_foot_percentiles(df, timeframe, start_date, end_date):
+    # Listings without a living area are left out instead of contributing infinite prices per foot
+    sold_df = get_sold_in_timeframe(df, timeframe, start_date, end_date)
+    price_per_foot = sold_df['sold_price'].div(sold_df['sqft_living'].where(sold_df['sqft_living'] > 0))
+    return {get_percentile_label(q): price_per_foot.quantile(q) for q in SOLD_PRICE_PER_FOOT_PERCENTILES}
+
+def calculate_days_on_market_percentiles(df, timeframe, start_date, end_date):
+    sold_df = get_sold_in_timeframe(df, timeframe, start_date, end_date)
+    return {get_percentile_label(q): sold_df['cumulative_dom'].quantile(q) for q in DAYS_ON_MARKET_PERCENTILES}
+
 def analyze_real_estate_data(df, params):
+    # By default `df` is analyzed with the NumPy kernels in analysis_kernels.py; params['backend'] =
+    # 'pandas' runs the functions above instead. 'sql' aggregates inside SQLite through
+    # params['data_loader'] instead of `df`, 'cube' answers whole-month ranges from the precomputed
+    # params['cube'] and 'sketch' answers the quantile statistics from params['sketch_store']
+    backend = params.get('backend') or 'numpy'
+    with instrumentation.span('analyze_real_estate_data', category='analysis', backend=backend,
+                              timeframe=params.get('timeframe'), stats=len(params.get('stats_to_calculate') or [])):
+        return run_analysis_backend(df, params, backend)
+
+ANALYSIS_BACKENDS = ['numpy', 'pandas', 'sql', 'cube', 'sketch']
+
+def run_analysis_backend(df, params, backend):
+    if backend not in ANALYSIS_BACKENDS:
+        raise ValueError(f"Unknown analysis backend '{backend}'; choose from {', '.join(ANALYSIS_BACKENDS)}")
+    if backend == 'numpy':
+        from analysis_kernels import analyze_real_estate_data_kernels
+        return analyze_real_estate_data_kernels(df, params)
+    if backend == 'sql':
+        from sql_analysis import analyze_real_estate_data_sql
+        return analyze_real_estate_data_sql(params['data_loader'], params)
+    if backend == 'cube':
+        return params['cube'].analyze(params)
+    if backend == 'sketch':
+        return params['sketch_store'].analyze(params)
+
     results = {}
 
     timeframe = params.get('timeframe')
@@ -457,13 +514,17 @@ def analyze_real_estate_data(df, params):
         'active_inventory': lambda df: calculate_active_inventory(df, timeframe, end_date),
         'msi': lambda df: calculate_msi(df, timeframe, start_date, end_date),
         'percent_cash_sales': lambda df: calculate_percent_cash_sales(df, timeframe, start_date, end_date),
+        'median_sold_price': lambda df: calculate_median_sold_price(df, timeframe, start_date, end_date),
+        'sold_price_per_foot_percentiles': lambda df: calculate_sold_price_per_foot_percentiles(df, timeframe, start_date, end_date),
+        'days_on_market_percentiles': lambda df: calculate_days_on_market_percentiles(df, timeframe, start_date, end_date),
 }
 
     # Execute functions based on selected statistics
     for stat in stats_to_calculate:
         if stat in function_map:
             try:
-                results[stat] = function_map[stat](df)
+                with instrumentation.span(stat, category='statistic', backend='pandas', timeframe=timeframe):
+                    results[stat] = function_map[stat](df)
             except Exception as e:
                 results[stat] = f"Error calculating {stat}: {str(e)}"
         else:
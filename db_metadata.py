@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+# Kept next to the database so the UI can fill its dropdowns without querying it
+METADATA_SUFFIX = '.meta.json'
+
+# The dimension dictionary: listing counts per city, subdivision and building type combination,
+# stamped with the data version it was built at. It holds a few rows per subdivision however many
+# listings there are, so dropdowns and their cascading choices come from it, not the listing tables.
+DIMENSION_TABLE_SCRIPT = '''
+CREATE TABLE IF NOT EXISTS dimension_dictionary (
+    city TEXT,
+    subdivision TEXT,
+    type TEXT,
+    listings INTEGER,
+    data_version INTEGER
+);
+'''
+
+# Dimension dictionaries already read, by database path: (data version, rows)
+_dimension_cache = {}
+_dimension_lock = threading.Lock()
+
+def metadata_path(db_file):
+    return db_file + METADATA_SUFFIX
+
+def read_data_version(db_file):
+    """Return the database's `user_version`, as DataLoader.get_data_version does, or None."""
+    if not os.path.exists(db_file):
+        return None
+    try:
+        conn = sqlite3.connect(db_file)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to read the data version of {db_file}: {e}")
+        return None
+
+def read_cached_metadata(db_file):
+    """Return the metadata saved next to `db_file`, or None if there is none or it cannot be read."""
+    try:
+        with open(metadata_path(db_file)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to read cached metadata for {db_file}: {e}")
+        return None
+
+def conn_path(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+# Listings per city, subdivision and building type, as the dimension dictionary stores them
+DIMENSION_COUNT_QUERY = """
+SELECT location.city, location.subdivision, properties.type, COUNT(*)
+FROM location
+JOIN properties ON properties.listing_number = location.listing_number
+GROUP BY location.city, location.subdivision, properties.type
+ORDER BY location.city, location.subdivision, properties.type"""
+
+def rebuild_dimensions(conn):
+    """
+    Recount the dimension dictionary from the listing tables on `conn` and return its rows.
+
+    The caller commits. Rows are [city, subdivision, type, listings] lists.
+    """
+    data_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.executescript(DIMENSION_TABLE_SCRIPT)
+    conn.execute("DELETE FROM dimension_dictionary")
+    rows = [list(row) for row in conn.execute(DIMENSION_COUNT_QUERY)]
+    conn.executemany("INSERT INTO dimension_dictionary VALUES (?, ?, ?, ?, ?)",
+                     [row + [data_version] for row in rows])
+    with _dimension_lock:
+        _dimension_cache[os.path.abspath(conn_path(conn))] = (data_version, rows)
+    return rows
+
+def load_dimensions(conn):
+    """
+    Return the data version the dimension dictionary on `conn` was built at and its rows, without writing.
+
+    A dictionary older than the data version is returned as it is; finish_ingest rebuilds it.
+    Without a stored dictionary the listings are counted, and the counts are only kept in memory.
+    Current dictionaries are answered from memory while the data version is unchanged.
+    """
+    data_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    path = os.path.abspath(conn_path(conn))
+    with _dimension_lock:
+        cached = _dimension_cache.get(path)
+    if cached is not None and cached[0] == data_version:
+        return cached
+
+    has_table = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'dimension_dictionary'").fetchone()[0]
+    built_version = conn.execute("SELECT MAX(data_version) FROM dimension_dictionary").fetchone()[0] if has_table else None
+    if built_version is None:
+        logging.info(f"{path} has no dimension dictionary; counting the listings without storing them.")
+        built_version, rows = data_version, [list(row) for row in conn.execute(DIMENSION_COUNT_QUERY)]
+    else:
+        rows = [list(row) for row in conn.execute(
+            "SELECT city, subdivision, type, listings FROM dimension_dictionary ORDER BY city, subdivision, type")]
+        if built_version != data_version:
+            logging.info(f"The dimension dictionary of {path} is from data version {built_version}, "
+                         f"not {data_version}; it is refreshed by the next ingest.")
+    # A stale dictionary may be rebuilt by another process without a version change, so only current ones are kept
+    if built_version == data_version:
+        with _dimension_lock:
+            _dimension_cache[path] = (data_version, rows)
+    return built_version, rows
+
+def read_dimensions(conn):
+    """Return the dimension dictionary rows on `conn` without writing; see load_dimensions."""
+    return load_dimensions(conn)[1]
+
+def dimension_options(dimensions, city=None, subdivision=None):
+    """
+    Dropdown choices consistent with the selected `city` and `subdivision`, from dimension rows.
+
+    Returns {'cities', 'subdivisions', 'building_types'}, each a list of (value, listings) pairs
+    sorted by value: cities are never narrowed, subdivisions are narrowed by the city and building
+    types by both. Missing values are left out.
+    """
+    cities = {}
+    subdivisions = {}
+    building_types = {}
+    for row_city, row_subdivision, row_type, listings in dimensions:
+        cities[row_city] = cities.get(row_city, 0) + listings
+        if city is not None and row_city != city:
+            continue
+        subdivisions[row_subdivision] = subdivisions.get(row_subdivision, 0) + listings
+        if subdivision is not None and row_subdivision != subdivision:
+            continue
+        building_types[row_type] = building_types.get(row_type, 0) + listings
+
+    def choices(counts):
+        return sorted((value, count) for value, count in counts.items() if value is not None)
+    return {'cities': choices(cities), 'subdivisions': choices(subdivisions), 'building_types': choices(building_types)}
+
+def build_metadata(db_file):
+    """
+    Collect the dropdown values, dimension dictionary and listing date bounds of `db_file` and
+    save them next to it.
+
+    Only the standard library is used so the UI can call this before pandas is imported.
+    Returns None if the database does not exist or has no listing tables.
+    """
+    if not os.path.exists(db_file):
+        return None
+    try:
+        conn = sqlite3.connect(db_file)
+        try:
+            # Stamped with the dictionary's version, so metadata with a stale dictionary is rebuilt
+            # once finish_ingest has refreshed it
+            data_version, dimensions = load_dimensions(conn)
+            options = dimension_options(dimensions)
+            min_date, max_date = conn.execute(
+                "SELECT MIN(listing_date), MAX(listing_date) FROM listing_details").fetchone()
+            metadata = {
+                'data_version': data_version,
+                'cities': [value for value, count in options['cities']],
+                'subdivisions': [value for value, count in options['subdivisions']],
+                'building_types': [value for value, count in options['building_types']],
+                'dimensions': dimensions,
+                'min_date': min_date,
+                'max_date': max_date
+            }
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to build metadata for {db_file}: {e}")
+        return None
+
+    try:
+        with open(metadata_path(db_file), 'w') as f:
+            json.dump(metadata, f)
+    except OSError as e:
+        logging.error(f"Failed to save metadata for {db_file}: {e}")
+    return metadata
+
+def load_metadata(db_file):
+    """Return the cached metadata for `db_file` if its data version is current, rebuilding it otherwise."""
+    metadata = read_cached_metadata(db_file)
+    # Metadata saved before the dimension dictionary existed is rebuilt to include it
+    if metadata is not None and 'dimensions' in metadata and metadata.get('data_version') == read_data_version(db_file):
+        return metadata
+    logging.info(f"Rebuilding metadata for {db_file}.")
+    return build_metadata(db_file)
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Level-of-detail reduction for line charts. Both methods return the indices of the points to
+# draw, in x order, so a series of any length costs at most `max_points` segments to render.
+
+def min_max_downsample(x, y, buckets):
+    """
+    Split the points into `buckets` runs of equal length and keep the lowest and highest point
+    of each, so every peak and trough survives.
+    """
+    n = len(x)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    lows = np.minimum.reduceat(y, starts)
+    highs = np.maximum.reduceat(y, starts)
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(edges))
+    # First index in each bucket holding its min and its max
+    is_low = y == lows[bucket_ids]
+    is_high = y == highs[bucket_ids]
+    low_index = np.full(buckets, n, dtype=np.int64)
+    high_index = np.full(buckets, n, dtype=np.int64)
+    np.minimum.at(low_index, bucket_ids[is_low], np.flatnonzero(is_low))
+    np.minimum.at(high_index, bucket_ids[is_high], np.flatnonzero(is_high))
+    return np.unique(np.concatenate([low_index, high_index]))
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last points and, from each of
+    `threshold` - 2 buckets in between, the point forming the largest triangle with the point
+    kept before it and the mean of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Mean of each bucket, the last point standing in for the bucket after the final one
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    previous = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_x, next_y = mean_x[bucket + 1], mean_y[bucket + 1]
+        areas = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                       - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    kept[-1] = n - 1
+    return kept
+
+def downsample(x, y, max_points, method='lttb'):
+    """Indices of at most about `max_points` points of the series, skipping missing values."""
+    present = np.flatnonzero(~np.isnan(y))
+    if len(present) <= max_points:
+        return present
+    if method == 'minmax':
+        selected = min_max_downsample(x[present], y[present], max(max_points // 2, 1))
+    else:
+        selected = lttb(x[present], y[present], max_points)
+    return present[selected]
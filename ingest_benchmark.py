@@ -0,0 +1,238 @@
+import argparse
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from benchmark_suite import generate_listing_frame
+from Clean_And_Process2 import clean_listings, finish_ingest, load_listings
+from Data_Loader import DataLoader
+
+# Column headers as the MLS exports them; normalize_column_names maps each to its key
+RAW_HEADERS = {
+    'listing_number': 'Listing #', 'cumulative_dom': 'Cumulative DOM', 'days_on_market': 'Days on Market',
+    'short_address': 'Short Address', 'baths_full': 'Baths - Full', 'baths_half': 'Baths - Half',
+    'cancel_date': 'Cancel Date', 'listing_date': 'Listing Date', 'list_price': 'List Price',
+    'front_exp': 'Front Exp', 'expiration_date': 'Expiration Date', 'parcel_id': 'Parcel ID',
+    'sold_date': 'Sold Date', 'sold_price': 'Sold Price', 'sqft_living': 'SqFt - Living',
+    'sqft_total': 'SqFt - Total', 'under_contract_date': 'Under Contract Date', 'waterfront': 'Waterfront',
+    'withdrawn_date': 'Withdrawn Date', 'year_built': 'Year Built', 'year_roof_installed': 'Year Roof Installed',
+    'sqft_guest_house': 'SqFt - Guest House', 'construction_cbs': 'Construction: CBS',
+    'storm_protection_accordion_shutters': 'Storm Protection: Accordion Shutters',
+    'storm_protection_impact_glass': 'Storm Protection: Impact Glass',
+    'storm_protection_panel_shutters': 'Storm Protection: Panel Shutters',
+    'public_remarks': 'Public Remarks', 'area': 'Area', 'temp_off_market_date': 'Temp Off Market Date',
+    'garage_spaces': 'Garage Spaces', 'furnished_furnished': 'Furnished: Furnished', 'subdivision': 'Subdivision',
+    'terms_of_sale': 'Terms of Sale', 'zip_code': 'Zip Code', 'city': 'City', 'guest_house': 'Guest House',
+    'high_school': 'High School', 'homeowners_assoc': 'Homeowners Assoc', 'lot_sqft': 'Lot SqFt',
+    'private_pool': 'Private Pool', 'sold_price_sqft': 'Sold Price/SqFt', 'legal_desc': 'Legal Desc',
+    'spa': 'Spa', 'state_province': 'State/Province', 'street_number': 'Street #', 'tax_year': 'Tax Year',
+    'taxes': 'Taxes', 'total_bedrooms': 'Total Bedrooms', 'total_floors_stories': 'Total Floors/Stories',
+    'total_units_in_bldg': 'Total Units in Bldg', 'ttl_units_in_complex': 'Ttl Units in Complex',
+    'original_list_price': 'Original List Price', 'development_name': 'Development Name',
+    'unit_floor_number': 'Unit Floor #', 'unit_number': 'Unit #', 'type': 'Type', 'geo_area': 'Geo Area',
+    'geo_lat': 'Geo Lat', 'geo_lon': 'Geo Lon', 'hoa_poa_coa_monthly': 'HOA/POA/COA Monthly',
+    'special_assessment': 'Special Assessment'
+}
+
+# Share of blank cells per column in a typical export
+NULL_RATES = {
+    'days_on_market': 0.02, 'baths_half': 0.3, 'year_roof_installed': 0.45, 'sqft_guest_house': 0.9,
+    'sqft_total': 0.1, 'lot_sqft': 0.15, 'garage_spaces': 0.2, 'subdivision': 0.08, 'public_remarks': 0.03,
+    'front_exp': 0.35, 'high_school': 0.1, 'development_name': 0.5, 'unit_floor_number': 0.5,
+    'total_floors_stories': 0.2, 'total_units_in_bldg': 0.4, 'ttl_units_in_complex': 0.4, 'taxes': 0.05,
+    'tax_year': 0.05, 'hoa_poa_coa_monthly': 0.3, 'geo_lat': 0.01, 'geo_lon': 0.01, 'original_list_price': 0.02,
+    'waterfront': 0.05, 'private_pool': 0.05, 'spa': 0.1, 'guest_house': 0.2, 'furnished_furnished': 0.15
+}
+
+# Raw codes per boolean column: (true codes, false codes)
+BOOLEAN_CODES = {
+    'waterfront': (['Yes'], ['No']),
+    'construction_cbs': (['Yes'], ['No']),
+    'furnished_furnished': (['Yes'], ['No']),
+    'guest_house': (['Yes'], ['No']),
+    'homeowners_assoc': (['Yes', 'M', 'V'], ['No', 'N']),
+    'private_pool': (['Yes'], ['No']),
+    'spa': (['Yes'], ['No']),
+    'special_assessment': (['Yes', 'Y'], ['No', 'N'])
+}
+
+STORM_PROTECTION_COLUMNS = ['storm_protection_accordion_shutters', 'storm_protection_impact_glass',
+                            'storm_protection_panel_shutters']
+DERIVED_COLUMNS = ['parcel_subdivision', 'event_date', 'end_of_listing_date']
+DATE_FORMAT = '%m/%d/%Y'
+STAGES = ['read', 'clean', 'load']
+
+def to_raw_export(df, rng):
+    """
+    Turn generated cleaned listings back into an MLS export.
+
+    Text is upper or title case, booleans use the Yes/No/M/V/Y/N codes, dates are MM/DD/YYYY,
+    parcel ids lose their leading zeros and are dash-separated, derived columns are dropped and
+    cells are blanked at NULL_RATES.
+    """
+    df = df.drop(columns=[column for column in DERIVED_COLUMNS if column in df.columns])
+    n = len(df)
+    for column, (true_codes, false_codes) in BOOLEAN_CODES.items():
+        if column in df.columns:
+            values = df[column].to_numpy(dtype=bool)
+            true_pick = np.asarray(true_codes, dtype=object)[rng.integers(0, len(true_codes), n)]
+            false_pick = np.asarray(false_codes, dtype=object)[rng.integers(0, len(false_codes), n)]
+            df[column] = np.where(values, true_pick, false_pick)
+    for column in STORM_PROTECTION_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].where(df[column] != 'nan').str.title()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(DATE_FORMAT)
+    for column in ['short_address', 'subdivision', 'legal_desc', 'development_name']:
+        if column in df.columns:
+            df[column] = df[column].where(df[column] != 'nan').str.upper()
+    for column in ['city', 'type', 'terms_of_sale', 'high_school']:
+        if column in df.columns:
+            df[column] = df[column].str.title()
+    for column in ['unit_number']:
+        if column in df.columns:
+            df[column] = df[column].where(df[column] != 'nan')
+    if 'state_province' in df.columns:
+        df['state_province'] = df['state_province'].str.upper()
+    if 'parcel_id' in df.columns:
+        parcel_id = df['parcel_id'].str.lstrip('0')
+        df['parcel_id'] = parcel_id.str[:-7] + '-' + parcel_id.str[-7:-4] + '-' + parcel_id.str[-4:]
+    for column, rate in NULL_RATES.items():
+        if column in df.columns:
+            df[column] = df[column].where(rng.random(n) >= rate)
+    return df.rename(columns=RAW_HEADERS)
+
+def generate_mls_csv(path, num_rows, seed=0, chunk_rows=500000):
+    """Write `num_rows` synthetic listings to `path` as an MLS CSV export, generated in chunks."""
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < num_rows:
+        rows = min(chunk_rows, num_rows - written)
+        chunk = generate_listing_frame(rows, seed + written, first_number=written)
+        to_raw_export(chunk, rng).to_csv(path, mode='w' if written == 0 else 'a', header=written == 0,
+                                         index=False, float_format='%.6g')
+        written += rows
+    logging.info(f"Wrote {num_rows} synthetic listings to {path}.")
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+class StageMeter:
+    """
+    Accumulates time, rows and peak RSS per ingest stage.
+
+    A background thread samples RSS every `interval` seconds and charges it to the running stage.
+    Without /proc the process-wide peak from getrusage is used instead.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stats = {stage: {'rows': 0, 'seconds': 0.0, 'peak_rss': 0} for stage in STAGES}
+        self.stage = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def sample(self):
+        while not self.stop_event.wait(self.interval):
+            self.record_rss()
+
+    def record_rss(self):
+        stage = self.stage
+        if stage is not None:
+            rss = current_rss()
+            if rss is None:
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            self.stats[stage]['peak_rss'] = max(self.stats[stage]['peak_rss'], rss)
+
+    def run(self, stage, func, *args):
+        """Run `func(*args)` as part of `stage` and return its result."""
+        self.stage = stage
+        self.record_rss()
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.stats[stage]['seconds'] += time.perf_counter() - started
+            self.record_rss()
+            self.stage = None
+
+def database_size(db_file):
+    return sum(os.path.getsize(path) for path in (db_file, db_file + '-wal', db_file + '-journal')
+               if os.path.exists(path))
+
+def run_ingest(csv_path, db_file, chunk_rows=500000):
+    """
+    Read, clean and load `csv_path` into a new database at `db_file`, one chunk at a time.
+
+    Returns one row per stage with rows, seconds, rows per second and peak RSS in MB, plus the
+    CSV and database sizes.
+    """
+    data_loader = DataLoader(db_file)
+    data_loader.create_database()
+    with StageMeter() as meter:
+        reader = pd.read_csv(csv_path, chunksize=chunk_rows)
+        while True:
+            df = meter.run('read', next, reader, None)
+            if df is None:
+                break
+            meter.stats['read']['rows'] += len(df)
+            df = meter.run('clean', clean_listings, df)
+            meter.stats['clean']['rows'] += len(df)
+            meter.run('load', load_listings, data_loader, df)
+            meter.stats['load']['rows'] += len(df)
+            del df
+        meter.run('load', finish_ingest, data_loader)
+
+    report = pd.DataFrame([dict(stage=stage, **stats) for stage, stats in meter.stats.items()])
+    report['rows_per_second'] = report['rows'] / report['seconds']
+    report['peak_rss_mb'] = report.pop('peak_rss') / 2 ** 20
+    report['csv_mb'] = os.path.getsize(csv_path) / 2 ** 20
+    report['db_mb'] = database_size(db_file) / 2 ** 20
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reading, cleaning and loading synthetic MLS exports.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100000, 1000000])
+    parser.add_argument("--chunk_rows", type=int, default=500000, help="Rows read, cleaned and loaded at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work_dir", help="Keep generated CSVs and databases here instead of a temporary directory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        reports = []
+        for num_rows in args.sizes:
+            csv_path = os.path.join(work_dir, f'mls_{num_rows}_{args.seed}.csv')
+            if not os.path.exists(csv_path):
+                generate_mls_csv(csv_path, num_rows, args.seed)
+            db_file = os.path.join(work_dir, f'ingest_{num_rows}.db')
+            if os.path.exists(db_file):
+                os.remove(db_file)
+            report = run_ingest(csv_path, db_file, args.chunk_rows)
+            report.insert(0, 'size', num_rows)
+            reports.append(report)
+            print(report.to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+        if len(reports) > 1:
+            print(pd.concat(reports).to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+
+if __name__ == "__main__":
+    main()
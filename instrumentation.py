@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds of the default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MAX_EVENTS = 100000
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+_enabled = bool(os.environ.get('REAL_ESTATE_INSTRUMENTATION'))
+_lock = threading.Lock()
+_events = deque(maxlen=MAX_EVENTS)
+_counters = {}
+_histograms = {}
+_epoch = time.perf_counter_ns()
+
+def configure_logging(filename=None, level=logging.INFO, filemode='a'):
+    """
+    Configure the root logger for a script. Library modules only log; the entry point decides
+    where the text goes, so importing a module never truncates or redirects another module's log.
+    """
+    logging.basicConfig(filename=filename, level=level, filemode=filemode, format=LOG_FORMAT, force=True)
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Drop every recorded span, counter and histogram."""
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _histograms.clear()
+
+def _key(metric, labels):
+    return metric, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+def increment(metric, value=1, **labels):
+    """Add `value` to the counter `metric` with `labels`."""
+    if not _enabled:
+        return
+    key = _key(metric, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(metric, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record `value` in the histogram `metric` with `labels`; buckets are fixed by the first observation."""
+    if not _enabled:
+        return
+    key = _key(metric, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': tuple(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][index] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+class Span:
+    """A timed section recorded as a Chrome trace event and in the `<category>_seconds` histogram."""
+
+    __slots__ = ('name', 'category', 'args', 'started')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.started = None
+
+    def set(self, **args):
+        """Attach more arguments, such as a row count known only at the end."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter_ns() - self.started
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        with _lock:
+            _events.append({
+                'name': self.name, 'cat': self.category, 'ph': 'X',
+                'ts': (self.started - _epoch) / 1000, 'dur': elapsed / 1000,
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+                'args': {key: value if isinstance(value, (int, float, bool)) or value is None else str(value)
+                         for key, value in self.args.items()}
+            })
+        observe(f'{self.category}_seconds', elapsed / 1e9, name=self.name)
+        return False
+
+class _NullSpan:
+    """Returned while instrumentation is disabled, so a span costs one call and one check."""
+
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, category='span', **args):
+    """Context manager timing the enclosed block; arguments show up in the trace viewer."""
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, category, args)
+
+def traced(name=None, category='span'):
+    """Decorator running each call of a function inside a span."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, category, {}):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+def chrome_trace():
+    """Recorded spans in the Chrome trace event format (chrome://tracing, Perfetto)."""
+    with _lock:
+        events = list(_events)
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def write_chrome_trace(path):
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(), f)
+    logging.info(f"Wrote {len(_events)} trace events to {path}.")
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + '}'
+
+def prometheus_text():
+    """Counters and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, counts=list(value['counts'])) for key, value in _histograms.items()}
+
+    lines = []
+    for metric in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {metric} counter')
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    for metric in sorted({name for name, _ in histograms}):
+        lines.append(f'# TYPE {metric} histogram')
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", repr(float(bound)))])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus_text(path):
+    with open(path, 'w') as f:
+        f.write(prometheus_text())
+
+@contextmanager
+def recording(trace_path=None, metrics_path=None):
+    """Enable instrumentation for a block and write the trace and metrics snapshot afterwards."""
+    was_enabled = _enabled
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+        if trace_path:
+            write_chrome_trace(trace_path)
+        if metrics_path:
+            write_prometheus_text(metrics_path)
@@ -0,0 +1,336 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import instrumentation
+
+# A read-only copy of a database held in a shared in-memory SQLite instance, so reads on slow
+# or networked disks do not pay I/O latency. Every DataLoader of the process asking for the same
+# database and tables shares one copy, which is refreshed when the on-disk data version changes.
+
+# Which tables each DataLoader write changed and at what data version. `changed_version` is the
+# last write; `rewritten_version` the last one that was not a plain append. The row named '*'
+# records writes that may have touched any table.
+TABLE_VERSIONS_SCRIPT = '''
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    changed_version INTEGER,
+    rewritten_version INTEGER
+)
+'''
+
+# Tables maintained by triggers on another table change when it does
+TABLE_SOURCES = {'location_rtree': 'location'}
+
+# Bookkeeping tables that reads never need
+EXCLUDED_TABLES = {'table_versions', 'dimension_dictionary'}
+
+# The tables and columns the analyses, aggregates and spatial filters read; None means all columns
+ANALYSIS_TABLES = {
+    'listing_details': None,
+    'properties': None,
+    'location': None,
+    'property_features': None,
+    'location_rtree': None
+}
+
+# Snapshots by (database path, tables)
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+class ReadWriteLock:
+    """Many readers or one writer; a waiting writer holds off new readers."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writing or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writing = True
+
+    def release_write(self):
+        with self.condition:
+            self.writing = False
+            self.condition.notify_all()
+
+def record_table_change(conn, version, table=None, appended=False):
+    """Note in `conn`'s table_versions that `table` (None: any table) changed at `version`."""
+    conn.execute(TABLE_VERSIONS_SCRIPT)
+    conn.execute('''
+    INSERT INTO table_versions VALUES (?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        changed_version = excluded.changed_version,
+        rewritten_version = CASE WHEN ? THEN table_versions.rewritten_version ELSE excluded.changed_version END''',
+                 (table or '*', version, 0 if appended else version, appended))
+
+def table_columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+class MemorySnapshot:
+    """
+    A shared in-memory copy of `db_file` for reads.
+
+    With `tables` None the whole database is copied with the backup API; otherwise `tables` maps
+    table names to the columns to keep (None for all of them), and only those are copied. A
+    refresh copies just the rows appended to tables that only had rows appended since the last
+    one, and recopies tables that had rows changed or deleted. The on-disk data version is checked
+    at most every `check_seconds`.
+    """
+
+    def __init__(self, db_file, tables=None, check_seconds=1.0):
+        self.db_file = os.path.abspath(db_file)
+        self.requested_tables = dict(tables) if tables is not None else None
+        self.check_seconds = check_seconds
+        self.uri = f"file:snapshot_{id(self)}?mode=memory&cache=shared"
+        # Keeps the in-memory database alive; used only under the write lock
+        self.holder = sqlite3.connect(self.uri, uri=True, check_same_thread=False, isolation_level=None)
+        self.lock = ReadWriteLock()
+        self.refresh_lock = threading.Lock()
+        self.tables = {}
+        self.max_rowids = {}
+        self.data_version = None
+        self.checked_at = None
+        self.stats = {'load_seconds': None, 'refreshes': 0, 'last_refresh_seconds': None,
+                      'tables_appended': 0, 'tables_recopied': 0, 'rows_copied': 0}
+        self.load()
+
+    def disk_uri(self):
+        return f"file:{self.db_file}?mode=ro"
+
+    def load(self):
+        """Copy the database, or the requested tables, into memory."""
+        started = time.perf_counter()
+        self.lock.acquire_write()
+        try:
+            with instrumentation.span('snapshot_load', category='snapshot', db=self.db_file):
+                if self.requested_tables is None:
+                    self.load_whole_database()
+                else:
+                    self.load_tables()
+            self.max_rowids = {table: self.max_rowid(table) for table in self.tables}
+        finally:
+            self.lock.release_write()
+        self.checked_at = time.monotonic()
+        self.stats['load_seconds'] = time.perf_counter() - started
+        logging.info(f"Loaded {len(self.tables)} tables of {self.db_file} into memory in "
+                     f"{self.stats['load_seconds']:.2f}s ({self.memory_bytes() / 1e6:,.1f} MB).")
+
+    def load_whole_database(self):
+        disk = sqlite3.connect(self.disk_uri(), uri=True)
+        try:
+            disk.backup(self.holder)
+        finally:
+            disk.close()
+        # Trigger-maintained tables are copied themselves, so the triggers must not fire again on refresh
+        for (name,) in self.holder.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            self.holder.execute(f"DROP TRIGGER {name}")
+        self.data_version = self.holder.execute("PRAGMA user_version").fetchone()[0]
+        entries = self.holder.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall()
+        virtual = [name for name, sql in entries if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+        self.tables = {
+            name: None for name, sql in entries
+            if name not in EXCLUDED_TABLES and not name.startswith('sqlite_')
+            # Shadow tables of FTS5 and R*Tree indexes follow their virtual table
+            and not any(name.startswith(f'{table}_') for table in virtual)
+        }
+
+    def load_tables(self):
+        self.holder.execute("ATTACH DATABASE ? AS disk", (self.disk_uri(),))
+        try:
+            self.holder.execute("BEGIN")
+            self.data_version = self.holder.execute("PRAGMA disk.user_version").fetchone()[0]
+            existing = dict(self.holder.execute("SELECT name, sql FROM disk.sqlite_master WHERE type = 'table'").fetchall())
+            for table, columns in self.requested_tables.items():
+                if table not in existing:
+                    logging.info(f"Table {table} is not in {self.db_file}; it is left out of the snapshot.")
+                    continue
+                sql = existing[table]
+                if columns is None or sql.upper().startswith('CREATE VIRTUAL TABLE'):
+                    self.holder.execute(sql)
+                else:
+                    info = self.holder.execute(f"PRAGMA disk.table_info({table})").fetchall()
+                    keys = [row[1] for row in info if row[5]]
+                    kept = [row for row in info if row[1] in columns or row[5]]
+                    definitions = [f"{row[1]} {row[2]}" for row in kept]
+                    if keys:
+                        definitions.append(f"PRIMARY KEY ({', '.join(keys)})")
+                    self.holder.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+                self.tables[table] = columns
+                self.stats['rows_copied'] += self.copy_rows(table)
+            self.holder.execute("COMMIT")
+        except Exception:
+            if self.holder.in_transaction:
+                self.holder.execute("ROLLBACK")
+            raise
+        finally:
+            self.holder.execute("DETACH DATABASE disk")
+
+    def max_rowid(self, table):
+        rowid = 'id' if self.is_rtree(table) else 'rowid'
+        return self.holder.execute(f"SELECT MAX({rowid}) FROM main.{table}").fetchone()[0] or 0
+
+    def is_rtree(self, table):
+        sql = self.holder.execute("SELECT sql FROM main.sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+        return 'USING RTREE' in ' '.join(sql.upper().split())
+
+    def copy_rows(self, table, after_rowid=None):
+        """Copy `table`'s rows from the attached database, only those past `after_rowid` if given."""
+        columns = ', '.join(table_columns(self.holder, 'main', table))
+        if self.is_rtree(table):
+            # The R*Tree's id column is its rowid
+            select, rowid = columns, 'id'
+            target = f"main.{table}"
+        else:
+            select, rowid = f"rowid, {columns}", 'rowid'
+            target = f"main.{table} (rowid, {columns})"
+        sql = f"INSERT INTO {target} SELECT {select} FROM disk.{table}"
+        if after_rowid is not None:
+            return self.holder.execute(f"{sql} WHERE {rowid} > ?", (after_rowid,)).rowcount
+        return self.holder.execute(sql).rowcount
+
+    def connect(self, factory=sqlite3.Connection):
+        """Open a connection to the snapshot; hold `reading()` while using it."""
+        return sqlite3.connect(self.uri, uri=True, factory=factory)
+
+    def reading(self):
+        return SnapshotRead(self.lock)
+
+    def read_disk_version(self):
+        try:
+            conn = sqlite3.connect(self.disk_uri(), uri=True)
+            try:
+                return conn.execute("PRAGMA user_version").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to read the data version of {self.db_file}: {e}")
+            return None
+
+    def refresh_if_stale(self):
+        """Refresh when the on-disk data version moved, checking at most every `check_seconds`."""
+        if self.checked_at is not None and time.monotonic() - self.checked_at < self.check_seconds:
+            return False
+        with self.refresh_lock:
+            if self.checked_at is not None and time.monotonic() - self.checked_at < self.check_seconds:
+                return False
+            version = self.read_disk_version()
+            refreshed = version is not None and version != self.data_version and self.refresh()
+            self.checked_at = time.monotonic()
+            return refreshed
+
+    def refresh(self):
+        """Bring the snapshot up to the on-disk data version; returns whether anything was copied."""
+        started = time.perf_counter()
+        appended = recopied = rows = 0
+        self.lock.acquire_write()
+        try:
+            self.holder.execute("ATTACH DATABASE ? AS disk", (self.disk_uri(),))
+            try:
+                self.holder.execute("BEGIN")
+                version = self.holder.execute("PRAGMA disk.user_version").fetchone()[0]
+                has_versions = self.holder.execute(
+                    "SELECT COUNT(*) FROM disk.sqlite_master WHERE name = 'table_versions'").fetchone()[0]
+                changes = {}
+                if has_versions:
+                    changes = {name: (changed, rewritten) for name, changed, rewritten in
+                               self.holder.execute("SELECT name, changed_version, rewritten_version FROM disk.table_versions")}
+                any_changed, any_rewritten = changes.get('*', (0, 0))
+                for table in self.tables:
+                    changed, rewritten = changes.get(TABLE_SOURCES.get(table, table), (0, 0))
+                    if max(changed, any_changed) <= self.data_version:
+                        continue
+                    if max(rewritten, any_rewritten) <= self.data_version:
+                        copied = self.copy_rows(table, self.max_rowids[table])
+                        appended += 1
+                    else:
+                        self.holder.execute(f"DELETE FROM main.{table}")
+                        copied = self.copy_rows(table)
+                        recopied += 1
+                    self.max_rowids[table] = self.max_rowid(table)
+                    rows += copied
+                self.holder.execute("COMMIT")
+                previous, self.data_version = self.data_version, version
+            except Exception:
+                if self.holder.in_transaction:
+                    self.holder.execute("ROLLBACK")
+                raise
+            finally:
+                self.holder.execute("DETACH DATABASE disk")
+        finally:
+            self.lock.release_write()
+
+        seconds = time.perf_counter() - started
+        self.stats['refreshes'] += 1
+        self.stats['last_refresh_seconds'] = seconds
+        self.stats['tables_appended'] += appended
+        self.stats['tables_recopied'] += recopied
+        self.stats['rows_copied'] += rows
+        instrumentation.observe('snapshot_refresh_seconds', seconds)
+        logging.info(f"Snapshot of {self.db_file} refreshed from version {previous} to {version} in {seconds:.3f}s: "
+                     f"{appended} tables appended, {recopied} recopied, {rows} rows copied.")
+        return appended + recopied > 0
+
+    def memory_bytes(self):
+        """Size of the in-memory database."""
+        page_count = self.holder.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.holder.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def get_stats(self):
+        return dict(self.stats, data_version=self.data_version, tables=len(self.tables), memory_bytes=self.memory_bytes())
+
+    def close(self):
+        with _snapshots_lock:
+            for key, snapshot in list(_snapshots.items()):
+                if snapshot is self:
+                    del _snapshots[key]
+        self.holder.close()
+
+class SnapshotRead:
+    """Context manager holding a snapshot's read lock."""
+
+    def __init__(self, lock):
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire_read()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release_read()
+
+def get_snapshot(db_file, tables=None, check_seconds=1.0):
+    """Return the process's snapshot of `db_file` with `tables`, loading it on first use, or None if it cannot be loaded."""
+    key = (os.path.abspath(db_file), tuple(sorted((table, tuple(columns) if columns else None)
+                                                  for table, columns in tables.items())) if tables is not None else None)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            if not os.path.exists(db_file):
+                logging.error(f"Cannot load {db_file} into memory: it does not exist.")
+                return None
+            try:
+                snapshot = _snapshots[key] = MemorySnapshot(db_file, tables, check_seconds)
+            except sqlite3.Error as e:
+                logging.error(f"Failed to load {db_file} into memory: {e}")
+                return None
+    return snapshot
@@ -0,0 +1,252 @@
+import argparse
+import calendar
+import itertools
+import logging
+import time
+import numpy as np
+import pandas as pd
+from Data_Loader import DataLoader, LISTING_FILTERS
+from data_analysis import get_last_day_of_month
+from sql_analysis import (LISTED_MEASURES, SOLD_MEASURES, SOLD_STATISTICS, SNAPSHOT_STATISTICS, PERIOD_END_FUNCTIONS,
+                          calculate_statistics, get_period_windows, get_statistic_windows, timeframe_error_results)
+
+DIMENSIONS = ['city', 'subdivision', 'type']
+ALL = "All"
+
+# The listing month is kept as its own axis because the UI date range filters listings by
+# listing_date, while closed sales and inventory are bucketed by their own event month.
+SEGMENT_GROUPS = {
+    'city': "city",
+    'subdivision': "subdivision",
+    'type': "type",
+    'listing_period': "strftime('%Y-%m', listing_date)"
+}
+
+SNAPSHOT_MEASURES = ['active_inventory', 'pending_listings']
+
+CUBE_TABLES = {
+    'listed': list(LISTED_MEASURES),
+    'sold': list(SOLD_MEASURES),
+    'snapshot': SNAPSHOT_MEASURES
+}
+
+def period_to_month_index(periods):
+    """Convert 'YYYY-MM' strings (or 'YYYY-MM-DD') to months since year 0."""
+    periods = pd.Series(periods, dtype=str)
+    return (periods.str[:4].astype(int) * 12 + periods.str[5:7].astype(int) - 1).to_numpy(dtype=np.int32)
+
+def month_index(dt):
+    return dt.year * 12 + dt.month - 1
+
+def month_key(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+def month_end_key(index):
+    year, month = index // 12, index % 12 + 1
+    return f'{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}'
+
+def roll_up(df, measures):
+    """Add every roll-up of the segment dimensions, using ALL for each rolled-up dimension."""
+    frames = []
+    for kept in itertools.product([True, False], repeat=len(DIMENSIONS)):
+        frame = df.copy()
+        for dimension, keep in zip(DIMENSIONS, kept):
+            if not keep:
+                frame[dimension] = ALL
+        frames.append(frame.groupby(DIMENSIONS + ['listing_month', 'month'], as_index=False)[measures].sum())
+    return pd.concat(frames, ignore_index=True)
+
+class MarketCube:
+    """
+    Additive statistic measures over month x city x subdivision x building type.
+
+    Every combination of a dropdown value or "All" is stored pre-aggregated, so answering a
+    filter combination is a contiguous slice of each table plus a sum over listing months.
+    """
+
+    def __init__(self, dimension_values, tables):
+        self.dimension_values = dimension_values
+        self.tables = tables
+        self._codes = {
+            dimension: {value: code for code, value in enumerate(values)}
+            for dimension, values in dimension_values.items()
+        }
+        self._sizes = [len(dimension_values[dimension]) for dimension in DIMENSIONS]
+
+    @classmethod
+    def build(cls, data_loader):
+        """Aggregate the database into a cube."""
+        listed = data_loader.fetch_monthly_aggregates({}, 'listing_date', LISTED_MEASURES, group_by=SEGMENT_GROUPS)
+        sold = data_loader.fetch_monthly_aggregates({}, 'sold_date', SOLD_MEASURES, group_by=SEGMENT_GROUPS)
+
+        bounds = data_loader.execute_read_query(
+            "SELECT MIN(listing_date) AS min_date, MAX(end_of_listing_date) AS max_date FROM listing_details")
+        as_of_dates = []
+        if not bounds.empty and bounds.iloc[0]['min_date'] is not None:
+            month_windows = get_period_windows(pd.to_datetime(bounds.iloc[0]['min_date']),
+                                               pd.to_datetime(bounds.iloc[0]['max_date']), get_last_day_of_month)
+            as_of_dates = [window[1].strftime('%Y-%m-%d') for window in month_windows]
+        snapshot = data_loader.fetch_inventory_snapshots({}, as_of_dates, group_by=SEGMENT_GROUPS)
+        snapshot = snapshot[snapshot['listing_period'].notna()].rename(columns={'as_of': 'period'})
+
+        frames = {'listed': listed, 'sold': sold, 'snapshot': snapshot}
+        for name, df in frames.items():
+            df[DIMENSIONS] = df[DIMENSIONS].fillna('').astype(str)
+            df['listing_month'] = period_to_month_index(df['listing_period'])
+            df['month'] = period_to_month_index(df['period'])
+            frames[name] = roll_up(df, CUBE_TABLES[name])
+
+        dimension_values = {}
+        for dimension in DIMENSIONS:
+            values = set().union(*(df[dimension].unique() for df in frames.values())) - {ALL}
+            dimension_values[dimension] = np.array([ALL] + sorted(values))
+
+        cube = cls(dimension_values, {})
+        for name, df in frames.items():
+            cells = cube._encode_cells(df)
+            order = np.lexsort((df['month'].to_numpy(), df['listing_month'].to_numpy(), cells))
+            table = {
+                'cell': cells[order],
+                'listing_month': df['listing_month'].to_numpy(dtype=np.int32)[order],
+                'month': df['month'].to_numpy(dtype=np.int32)[order]
+            }
+            for measure in CUBE_TABLES[name]:
+                table[measure] = df[measure].to_numpy(dtype=np.float64)[order]
+            cube.tables[name] = table
+
+        logging.info("Market cube built: %s", {name: len(table['cell']) for name, table in cube.tables.items()})
+        return cube
+
+    def _encode_cells(self, df):
+        cells = np.zeros(len(df), dtype=np.int64)
+        for dimension, size in zip(DIMENSIONS, self._sizes):
+            codes = df[dimension].map(self._codes[dimension]).to_numpy(dtype=np.int64)
+            cells = cells * size + codes
+        return cells
+
+    def get_cell(self, params):
+        """Return the cell code for a filter selection, or None if a value is not in the cube."""
+        cell = 0
+        for dimension, key, size in zip(DIMENSIONS, ['city', 'subdivision', 'building_type'], self._sizes):
+            value = params.get(key) or ALL
+            code = self._codes[dimension].get(value)
+            if code is None:
+                return None
+            cell = cell * size + code
+        return cell
+
+    def sum_by_month(self, name, cell, first_listing_month, last_listing_month):
+        """Sum a table's measures by event month for one cell and a range of listing months."""
+        measures = CUBE_TABLES[name]
+        if cell is None:
+            return None, {measure: np.zeros(0) for measure in measures}
+        table = self.tables[name]
+        lo, hi = np.searchsorted(table['cell'], [cell, cell + 1])
+        listing_months = table['listing_month'][lo:hi]
+        mask = (listing_months >= first_listing_month) & (listing_months <= last_listing_month)
+        months = table['month'][lo:hi][mask]
+        if len(months) == 0:
+            return None, {measure: np.zeros(0) for measure in measures}
+        first_month = int(months.min())
+        offsets = months - first_month
+        sums = {
+            measure: np.bincount(offsets, weights=table[measure][lo:hi][mask])
+            for measure in measures
+        }
+        return first_month, sums
+
+    def to_month_dicts(self, first_month, sums, key_func):
+        if first_month is None:
+            return {measure: {} for measure in sums}
+        keys = [key_func(first_month + offset) for offset in range(len(next(iter(sums.values()))))]
+        return {measure: dict(zip(keys, values.tolist())) for measure, values in sums.items()}
+
+    def analyze(self, params):
+        """Answer `analyze_real_estate_data` params for whole-month date ranges from the cube."""
+        timeframe = params.get('timeframe')
+        start_date = pd.to_datetime(params.get('start_date'))
+        end_date = pd.to_datetime(params.get('end_date'))
+        stats_to_calculate = params.get('stats_to_calculate')
+
+        if start_date.day != 1 or end_date != get_last_day_of_month(end_date):
+            raise ValueError("The market cube only answers date ranges of whole months.")
+        if any(params.get(key) for key in LISTING_FILTERS):
+            raise ValueError("The market cube cannot answer spatial or text search filters.")
+        if timeframe not in PERIOD_END_FUNCTIONS:
+            return timeframe_error_results(stats_to_calculate, timeframe)
+
+        period_windows, month_windows = get_statistic_windows(timeframe, start_date, end_date)
+        cell = self.get_cell(params)
+        first_listing_month, last_listing_month = month_index(start_date), month_index(end_date)
+        requested = set(stats_to_calculate)
+
+        listed = sold = snapshots = None
+        if 'new_listings' in requested:
+            listed = self.to_month_dicts(
+                *self.sum_by_month('listed', cell, first_listing_month, last_listing_month), month_key)
+        if requested & SOLD_STATISTICS:
+            sold = self.to_month_dicts(
+                *self.sum_by_month('sold', cell, first_listing_month, last_listing_month), month_key)
+        if requested & SNAPSHOT_STATISTICS:
+            snapshots = self.to_month_dicts(
+                *self.sum_by_month('snapshot', cell, first_listing_month, last_listing_month), month_end_key)
+
+        return calculate_statistics(stats_to_calculate, timeframe, start_date, end_date, period_windows,
+                                    month_windows, listed, sold, snapshots)
+
+    def save(self, path):
+        """Persist the cube as a compressed NumPy archive."""
+        arrays = {f'dimension__{dimension}': values for dimension, values in self.dimension_values.items()}
+        for name, table in self.tables.items():
+            for column, values in table.items():
+                arrays[f'{name}__{column}'] = values
+        np.savez_compressed(path, **arrays)
+        logging.info(f"Market cube saved to {path}.")
+
+    @classmethod
+    def load(cls, path):
+        """Load a cube saved with `save`."""
+        with np.load(path) as archive:
+            dimension_values = {dimension: archive[f'dimension__{dimension}'] for dimension in DIMENSIONS}
+            tables = {
+                name: {column: archive[f'{name}__{column}'] for column in ['cell', 'listing_month', 'month'] + measures}
+                for name, measures in CUBE_TABLES.items()
+            }
+        return cls(dimension_values, tables)
+
+def benchmark_queries(cube, num_queries=200, seed=0):
+    """Time random dropdown combinations and month ranges; returns (median ms, p95 ms, max ms)."""
+    rng = np.random.default_rng(seed)
+    all_months = np.concatenate([table['month'] for table in cube.tables.values()])
+    first_month, last_month = int(all_months.min()), int(all_months.max())
+    stats = ['new_listings'] + sorted(SOLD_STATISTICS | SNAPSHOT_STATISTICS)
+    timings = []
+    for _ in range(num_queries):
+        start, end = sorted(rng.integers(first_month, last_month + 1, 2))
+        params = {
+            key: rng.choice(cube.dimension_values[dimension])
+            for dimension, key in zip(DIMENSIONS, ['city', 'subdivision', 'building_type'])
+        }
+        params.update({
+            'timeframe': rng.choice(['monthly', 'quarterly', 'annually']),
+            'start_date': f'{month_key(start)}-01',
+            'end_date': month_end_key(end),
+            'stats_to_calculate': stats
+        })
+        started = time.perf_counter()
+        cube.analyze(params)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 95)), float(np.max(timings))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a market cube from a database.")
+    parser.add_argument("db_filename", help="Database file path")
+    parser.add_argument("cube_filename", help="Output cube file (.npz)")
+    parser.add_argument("--benchmark", action='store_true', help="Time random filter combinations after building")
+    args = parser.parse_args()
+
+    market_cube = MarketCube.build(DataLoader(args.db_filename))
+    market_cube.save(args.cube_filename)
+    if args.benchmark:
+        median_ms, p95_ms, max_ms = benchmark_queries(MarketCube.load(args.cube_filename))
+        print(f"Cube query latency: median {median_ms:.2f} ms, p95 {p95_ms:.2f} ms, max {max_ms:.2f} ms")
@@ -0,0 +1,143 @@
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Slow queries reach the handlers an entry point sets up with instrumentation.configure_logging;
+# without any, the NullHandler keeps them off standard error
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+# A parenthesized group, allowing one level of nesting, repeated with commas, as in multi-row VALUES
+REPEATED_GROUP = re.compile(r"(\([^()]*(?:\([^()]*\)[^()]*)*\))(?:\s*,\s*\1)+")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def fingerprint(sql):
+    """
+    Normalize `sql` so statements that differ only in literals or list lengths compare equal.
+
+    Literals become ?, placeholder lists and runs of identical VALUES rows collapse to their first
+    item followed by '...', and whitespace collapses to single spaces.
+    """
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = ' '.join(sql.split())
+    sql = PLACEHOLDER_LIST.sub('(?, ...)', sql)
+    return REPEATED_GROUP.sub(r'\1, ...', sql)
+
+def fingerprint_id(fingerprint_text):
+    return f'{zlib.crc32(fingerprint_text.encode()):08x}'
+
+def format_plan(rows):
+    """Render EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as an indented tree."""
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+class QueryLog:
+    """
+    Registry of executed statements.
+
+    The last `capacity` statements are kept in a ring buffer and every fingerprint keeps its
+    count, total time and its last `max_samples` timings for percentiles. Statements taking at
+    least `slow_seconds` also land in the slow-query log with their query plan.
+    """
+
+    def __init__(self, capacity=1000, slow_seconds=0.5, max_samples=1000, slow_capacity=100):
+        self.capacity = capacity
+        self.slow_seconds = slow_seconds
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=capacity)
+        self.slow = deque(maxlen=slow_capacity)
+        self.fingerprints = {}
+
+    def is_slow(self, seconds):
+        return self.slow_seconds is not None and seconds >= self.slow_seconds
+
+    def record(self, operation, sql, num_params, rows, seconds, wait_seconds, plan=None, error=None):
+        text = fingerprint(sql)
+        entry = {
+            'time': time.time(),
+            'operation': operation,
+            'fingerprint': fingerprint_id(text),
+            'params': num_params,
+            'rows': rows,
+            'seconds': seconds,
+            'wait_seconds': wait_seconds,
+            'error': error
+        }
+        with self.lock:
+            self.recent.append(entry)
+            stats = self.fingerprints.get(text)
+            if stats is None:
+                stats = self.fingerprints[text] = {
+                    'fingerprint': entry['fingerprint'], 'operation': operation, 'count': 0, 'errors': 0,
+                    'total_seconds': 0.0, 'max_seconds': 0.0, 'wait_seconds': 0.0, 'rows': 0,
+                    'samples': deque(maxlen=self.max_samples)
+                }
+            stats['count'] += 1
+            stats['errors'] += error is not None
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['wait_seconds'] += wait_seconds
+            stats['rows'] += rows or 0
+            stats['samples'].append(seconds)
+            if self.is_slow(seconds):
+                self.slow.append(dict(entry, sql=' '.join(sql.split()), plan=plan))
+        if self.is_slow(seconds):
+            logger.warning(f"Slow query {entry['fingerprint']} ({seconds:.3f}s, {rows} rows): {text}"
+                           + (f"\n{plan}" if plan else ""))
+
+    def stats(self):
+        """Per-fingerprint aggregates, slowest total first."""
+        with self.lock:
+            items = [(text, dict(stats, samples=np.array(stats['samples']))) for text, stats in self.fingerprints.items()]
+        rows = []
+        for text, stats in items:
+            samples = stats.pop('samples')
+            rows.append(dict(stats, sql=text,
+                             mean_seconds=stats['total_seconds'] / stats['count'],
+                             p50_seconds=float(np.percentile(samples, 50)),
+                             p95_seconds=float(np.percentile(samples, 95))))
+        columns = ['fingerprint', 'operation', 'count', 'errors', 'total_seconds', 'mean_seconds', 'p50_seconds',
+                   'p95_seconds', 'max_seconds', 'wait_seconds', 'rows', 'sql']
+        return pd.DataFrame(rows, columns=columns).sort_values('total_seconds', ascending=False, ignore_index=True)
+
+    def recent_queries(self):
+        with self.lock:
+            return pd.DataFrame(list(self.recent), columns=['time', 'operation', 'fingerprint', 'params', 'rows',
+                                                            'seconds', 'wait_seconds', 'error'])
+
+    def slow_queries(self):
+        with self.lock:
+            return list(self.slow)
+
+    def dump(self, path=None):
+        """Return the registry as a JSON-serializable dict, also writing it to `path` if given."""
+        report = {
+            'slow_seconds': self.slow_seconds,
+            'fingerprints': self.stats().to_dict('records'),
+            'recent': self.recent_queries().to_dict('records'),
+            'slow': self.slow_queries()
+        }
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, default=str)
+        return report
+
+    def reset(self):
+        with self.lock:
+            self.recent.clear()
+            self.slow.clear()
+            self.fingerprints.clear()
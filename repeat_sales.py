@@ -0,0 +1,255 @@
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import lsqr
+from Data_Loader import DataLoader
+
+GROUP_COLUMNS = {None: None, 'city': 'city', 'subdivision': 'subdivision'}
+ALL = "All"
+# Tables fetch_parcel_sales reads
+SALE_TABLES = ['listing_details', 'properties', 'location']
+
+def period_indexes(dates, timeframe):
+    """Months or quarters since year 0 for a datetime Series."""
+    dates = pd.DatetimeIndex(dates)
+    if timeframe == 'monthly':
+        return (dates.year * 12 + dates.month - 1).to_numpy(dtype=np.int64)
+    if timeframe == 'quarterly':
+        return (dates.year * 4 + (dates.month - 1) // 3).to_numpy(dtype=np.int64)
+    raise ValueError(f"Unsupported timeframe: {timeframe}")
+
+def period_label(index, timeframe):
+    if timeframe == 'monthly':
+        return f'{index // 12:04d}-{index % 12 + 1:02d}'
+    return f'{index // 4:04d}Q{index % 4 + 1}'
+
+def is_valid_parcel_id(parcel_ids):
+    """Cleaning zero-pads missing parcel ids to strings like '00000000000000nan'; treat those as missing."""
+    stripped = parcel_ids.astype(str).str.lstrip('0').str.lower()
+    return parcel_ids.notna() & ~stripped.isin(['', 'nan', 'none'])
+
+def prepare_sales(sales, timeframe, group_by):
+    """Clean fetched sales and add `group` and `period` columns."""
+    sales = sales[is_valid_parcel_id(sales['parcel_id'])].copy()
+    sales['sold_date'] = pd.to_datetime(sales['sold_date'], errors='coerce')
+    sales['sold_price'] = pd.to_numeric(sales['sold_price'], errors='coerce')
+    sales = sales[sales['sold_date'].notna() & (sales['sold_price'] > 0)]
+    sales['group'] = sales[group_by].fillna('').astype(str) if group_by else ALL
+    sales['period'] = period_indexes(sales['sold_date'], timeframe)
+    return sales[['parcel_id', 'group', 'sold_date', 'period', 'sold_price']]
+
+def pair_repeat_sales(sales):
+    """
+    Pair each sale with the previous sale of the same parcel.
+
+    Sales are sorted by parcel and date once, so consecutive rows of the same parcel are the
+    pairs. Pairs inside a single period carry no appreciation information and are dropped.
+    """
+    sales = sales.sort_values(['parcel_id', 'sold_date'], kind='stable')
+    parcel = sales['parcel_id'].to_numpy()
+    same_parcel = parcel[1:] == parcel[:-1]
+    first = sales.iloc[:-1][same_parcel]
+    second = sales.iloc[1:][same_parcel]
+    pairs = pd.DataFrame({
+        'parcel_id': second['parcel_id'].to_numpy(),
+        # A pair is attributed to the group of its latest sale
+        'group': second['group'].to_numpy(),
+        'first_period': first['period'].to_numpy(),
+        'second_period': second['period'].to_numpy(),
+        'log_return': np.log(second['sold_price'].to_numpy(dtype=np.float64)
+                             / first['sold_price'].to_numpy(dtype=np.float64))
+    })
+    return pairs[pairs['second_period'] > pairs['first_period']].reset_index(drop=True)
+
+def solve_repeat_sales(first, second, log_return, weighted=True, x0=None):
+    """
+    Solve the repeat-sales regression for log index levels relative to the first period.
+
+    Returns (first_period, log_levels, observed). With `weighted`, the Case-Shiller second stage
+    regresses squared residuals on the time between sales and the model is refit with weights
+    of 1 / predicted standard deviation.
+    """
+    base = int(first.min())
+    num_periods = int(second.max()) - base + 1
+    rows = np.arange(len(first))
+    design = sparse.csr_matrix(
+        (np.r_[-np.ones(len(first)), np.ones(len(first))], (np.r_[rows, rows], np.r_[first - base, second - base])),
+        shape=(len(first), num_periods))[:, 1:]
+
+    if x0 is not None and len(x0) != num_periods - 1:
+        x0 = None
+    beta = lsqr(design, log_return, x0=x0, atol=1e-10, btol=1e-10)[0]
+
+    if weighted and len(first) > 2:
+        residuals = log_return - design @ beta
+        gaps = (second - first).astype(np.float64)
+        if np.ptp(gaps) > 0:
+            slope, intercept = np.polyfit(gaps, residuals ** 2, 1)
+            variance = intercept + slope * gaps
+        else:
+            variance = np.full(len(gaps), np.mean(residuals ** 2))
+        floor = max(np.mean(residuals ** 2), 1e-12) * 1e-3
+        weights = 1 / np.sqrt(np.maximum(variance, floor))
+        beta = lsqr(sparse.diags(weights) @ design, log_return * weights, x0=beta, atol=1e-10, btol=1e-10)[0]
+
+    observed = np.zeros(num_periods, dtype=bool)
+    observed[first - base] = True
+    observed[second - base] = True
+    return base, np.r_[0.0, beta], observed
+
+class RepeatSalesIndex:
+    """
+    Case-Shiller style repeat-sales price index per city, subdivision or for the whole market.
+
+    Every indexed sale is kept, so the parcels of newly inserted sales are re-paired over their
+    whole history, late-reported sales included, and only the groups whose pairs changed are
+    re-solved, starting from their previous solution. Increments are the listings inserted since
+    the last refresh; when sale rows were changed or deleted instead the index is rebuilt.
+    """
+
+    def __init__(self, timeframe='quarterly', group_by='city', weighted=True, min_pairs=10):
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"Unsupported grouping: {group_by}")
+        period_indexes(pd.DatetimeIndex([]), timeframe)
+        self.timeframe = timeframe
+        self.group_by = group_by
+        self.weighted = weighted
+        self.min_pairs = min_pairs
+        self.pairs = pd.DataFrame(columns=['parcel_id', 'group', 'first_period', 'second_period', 'log_return'])
+        self.sales = pd.DataFrame(columns=['parcel_id', 'group', 'sold_date', 'period', 'sold_price'])
+        self.solutions = {}
+        self.last_sold_date = None
+        self.last_sale_id = None
+        self.data_version = None
+
+    @classmethod
+    def build(cls, data_loader, timeframe='quarterly', group_by='city', weighted=True, min_pairs=10):
+        """Build the index from every sale in the database."""
+        index = cls(timeframe, group_by, weighted, min_pairs)
+        index.data_version = data_loader.get_data_version()
+        index.add_sales(data_loader.fetch_parcel_sales())
+        return index
+
+    def reset(self):
+        self.pairs = self.pairs.iloc[0:0]
+        self.sales = self.sales.iloc[0:0]
+        self.solutions = {}
+        self.last_sold_date = None
+        self.last_sale_id = None
+
+    def add_sales(self, sales):
+        """Pair new sales (parcel_id, sold_date, sold_price, city, subdivision) and re-solve the affected groups."""
+        if 'sale_id' in sales and len(sales):
+            self.last_sale_id = max(self.last_sale_id or 0, int(sales['sale_id'].max()))
+        sales = prepare_sales(sales, self.timeframe, self.group_by)
+        if sales.empty:
+            return set()
+
+        if len(self.sales):
+            # A sale may land between sales already paired, so its parcels are paired again in full
+            repaired = self.sales['parcel_id'].isin(set(sales['parcel_id']))
+            history = pd.concat([self.sales[repaired], sales], ignore_index=True)
+            replaced = self.pairs['parcel_id'].isin(set(sales['parcel_id']))
+            groups = set(self.pairs.loc[replaced, 'group'])
+            new_pairs = pair_repeat_sales(history)
+            self.pairs = pd.concat([self.pairs[~replaced], new_pairs], ignore_index=True)
+            self.sales = pd.concat([self.sales, sales], ignore_index=True)
+        else:
+            groups = set()
+            new_pairs = pair_repeat_sales(sales)
+            self.pairs = new_pairs
+            self.sales = sales
+        latest = sales['sold_date'].max()
+        self.last_sold_date = latest if self.last_sold_date is None else max(self.last_sold_date, latest)
+
+        groups |= set(new_pairs['group'])
+        self.solve(groups)
+        logging.info(f"Repeat-sales index: {len(new_pairs)} new pairs, re-solved {len(groups)} groups.")
+        return groups
+
+    def sales_appended_only(self, data_loader):
+        """Whether the sale tables only had rows appended since the index's data version."""
+        if self.data_version is None:
+            return False
+        versions = data_loader.fetch_table_versions()
+        if not versions:
+            # Without the bookkeeping there is no telling an append from a rewrite
+            return False
+        return all(versions.get(table, (0, 0))[1] <= self.data_version for table in SALE_TABLES + ['*'])
+
+    def refresh(self, data_loader):
+        """
+        Bring the index up to the database's data version and return the re-solved groups.
+
+        Sales of listings inserted since the last refresh are added, including late-reported sales
+        closed before the latest one indexed. If sale rows were changed or deleted, or the versions
+        cannot tell, every group is rebuilt from all sales.
+        """
+        data_version = data_loader.get_data_version()
+        if data_version is not None and data_version == self.data_version:
+            return set()
+        if self.sales_appended_only(data_loader):
+            self.data_version = data_version
+            return self.add_sales(data_loader.fetch_parcel_sales(self.last_sale_id))
+
+        logging.info(f"Sales changed other than by appends since data version {self.data_version}; "
+                     f"rebuilding the repeat-sales index.")
+        stale_groups = set(self.solutions)
+        self.reset()
+        self.data_version = data_version
+        groups = self.add_sales(data_loader.fetch_parcel_sales())
+        return groups | stale_groups
+
+    def solve(self, groups=None):
+        groups = set(self.pairs['group']) if groups is None else groups
+        for group in groups - set(self.pairs['group']):
+            self.solutions.pop(group, None)
+        for group, pairs in self.pairs[self.pairs['group'].isin(groups)].groupby('group'):
+            if len(pairs) < self.min_pairs:
+                self.solutions.pop(group, None)
+                continue
+            previous = self.solutions.get(group)
+            x0 = previous[1][1:] if previous is not None else None
+            self.solutions[group] = solve_repeat_sales(
+                pairs['first_period'].to_numpy(dtype=np.int64), pairs['second_period'].to_numpy(dtype=np.int64),
+                pairs['log_return'].to_numpy(dtype=np.float64), self.weighted, x0)
+
+    def get_levels(self, group=None):
+        """
+        Return index levels (first period = 100) for one group or all groups.
+
+        Periods without any sale in a pair are not identified by the regression and are NaN.
+        """
+        groups = [group] if group is not None else sorted(self.solutions)
+        frames = []
+        for name in groups:
+            if name not in self.solutions:
+                continue
+            base, log_levels, observed = self.solutions[name]
+            group_pairs = self.pairs['group'] == name
+            frames.append(pd.DataFrame({
+                'group': name,
+                'period': [period_label(base + offset, self.timeframe) for offset in range(len(log_levels))],
+                'index': np.where(observed, 100 * np.exp(log_levels), np.nan),
+                'num_pairs': int(group_pairs.sum())
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['group', 'period', 'index', 'num_pairs'])
+        return pd.concat(frames, ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a repeat-sales price index from a database.")
+    parser.add_argument("db_filename", help="Database file path")
+    parser.add_argument("output", help="Output CSV file")
+    parser.add_argument("--timeframe", default="quarterly", choices=["monthly", "quarterly"])
+    parser.add_argument("--group_by", default="city", choices=["city", "subdivision", "none"])
+    parser.add_argument("--unweighted", action='store_true', help="Skip the Case-Shiller interval weighting")
+    parser.add_argument("--min_pairs", type=int, default=10, help="Minimum repeat-sale pairs per group")
+    args = parser.parse_args()
+
+    repeat_sales_index = RepeatSalesIndex.build(DataLoader(args.db_filename), args.timeframe,
+                                                None if args.group_by == "none" else args.group_by,
+                                                not args.unweighted, args.min_pairs)
+    repeat_sales_index.get_levels().to_csv(args.output, index=False)
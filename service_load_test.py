@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+# Load test for stats_service: concurrent keep-alive clients issue /statistics requests drawn
+# from a fixed set of distinct queries and the run reports throughput and latency percentiles.
+# With --db the service is started on a free port for the run and stopped afterwards.
+
+TIMEFRAMES = ['monthly', 'quarterly', 'annually']
+
+def build_queries(metadata, distinct, seed=0):
+    """`distinct` query strings over the cities and date range the service reports."""
+    rng = random.Random(seed)
+    cities = metadata.get('cities') or [None]
+    start_year = int((metadata.get('min_date') or '2020')[:4])
+    end_year = int((metadata.get('max_date') or '2020')[:4])
+    queries = set()
+    attempts = 0
+    while len(queries) < distinct and attempts < distinct * 20:
+        attempts += 1
+        year = rng.randint(start_year, end_year)
+        params = {'timeframe': rng.choice(TIMEFRAMES), 'start_date': f'{year}-01-01', 'end_date': f'{year}-12-31'}
+        city = rng.choice(cities)
+        if city is not None:
+            params['city'] = city
+        queries.add('/statistics?' + urlencode(params))
+    return sorted(queries)
+
+async def request(reader, writer, host, path):
+    """Send one GET on an open connection; returns (status, body)."""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    length = 0
+    for line in lines[1:]:
+        if line.lower().startswith('content-length:'):
+            length = int(line.split(':', 1)[1])
+    body = await reader.readexactly(length)
+    return status, body
+
+async def fetch_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        status, body = await request(reader, writer, host, path)
+    finally:
+        writer.close()
+    if status != 200:
+        raise RuntimeError(f"{path} returned {status}: {body.decode(errors='replace')}")
+    return json.loads(body)
+
+async def client(host, port, queries, rng, deadline, remaining, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline and remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            status, _ = await request(reader, writer, host, rng.choice(queries))
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+async def run_load_test(host, port, clients, requests, duration, distinct, seed=0):
+    """Run the load and return a summary dict."""
+    metadata = await fetch_json(host, port, '/metadata')
+    queries = build_queries(metadata, distinct, seed)
+    before = await fetch_json(host, port, '/status')
+
+    latencies = []
+    statuses = {}
+    remaining = [requests if requests else float('inf')]
+    deadline = time.perf_counter() + duration if duration else float('inf')
+    started = time.perf_counter()
+    await asyncio.gather(*[client(host, port, queries, random.Random(seed + index + 1), deadline, remaining,
+                                  latencies, statuses)
+                           for index in range(clients)])
+    elapsed = time.perf_counter() - started
+    after = await fetch_json(host, port, '/status')
+
+    latencies.sort()
+    summary = {
+        'clients': clients,
+        'distinct_queries': len(queries),
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'statuses': statuses,
+        'computed': after['computed'] - before['computed'],
+        'coalesced': after['coalesced'] - before['coalesced'],
+        'cache_hits': after['cache_hits'] - before['cache_hits'],
+        'rejected': after['rejected'] - before['rejected']
+    }
+    for label, fraction in [('p50', 0.50), ('p95', 0.95), ('p99', 0.99)]:
+        summary[f'{label}_ms'] = round(percentile(latencies, fraction) * 1000, 2)
+    summary['max_ms'] = round(latencies[-1] * 1000, 2) if latencies else None
+    return summary
+
+def start_service(db_file, workers):
+    """Start stats_service on a free port; returns the process and its port."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stats_service.py')
+    process = subprocess.Popen([sys.executable, script, db_file, '--port', '0', '--workers', str(workers)],
+                               stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Listening on'):
+        process.kill()
+        raise RuntimeError(f"Service did not start: {line!r}")
+    return process, urlsplit(line.split()[-1]).port
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure stats_service throughput and latency under concurrent clients.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running service, e.g. http://127.0.0.1:8080")
+    target.add_argument("--db", help="Start a service for this database for the run")
+    parser.add_argument("--workers", type=int, default=4, help="Service worker threads when started with --db")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests to send (0 for no limit)")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after this many seconds (0 for no limit)")
+    parser.add_argument("--distinct", type=int, default=20, help="Number of distinct queries the clients choose from")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error("give --requests or --duration")
+
+    process = None
+    if args.db:
+        process, port = start_service(args.db, args.workers)
+        host = '127.0.0.1'
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    try:
+        summary = asyncio.run(run_load_test(host, port, args.clients, args.requests, args.duration,
+                                            args.distinct, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import logging
+import math
+import time
+import numpy as np
+import pandas as pd
+from Data_Loader import DataLoader, EARTH_RADIUS_MILES
+from data_analysis import get_last_day_of_month
+from olap_cube import month_index, month_key
+from sql_analysis import PERIOD_END_FUNCTIONS, get_period_windows
+
+EARTH_RADIUS_METERS = EARTH_RADIUS_MILES * 1609.344
+
+GRID_COLUMNS = ['listing_date', 'sold_date', 'sold_price', 'list_price', 'sqft_living', 'cumulative_dom',
+                'terms_of_sale', 'geo_lat', 'geo_lon']
+
+# Additive measures kept per cell, event month and listing month. The event month is the listing
+# month for new_count and the sold month for everything else; the listing month is kept as its
+# own axis, as in olap_cube, because the analysis only counts listings listed in the date range.
+# Zero living area or list price is left out of the ratio measures, as an infinite ratio cannot
+# be drawn on a heatmap.
+GRID_KEYS = ['month', 'listing_month', 'cell']
+GRID_MEASURES = ['new_count', 'closed_count', 'sold_price_sum', 'dom_sum', 'dom_count', 'ppsf_sum', 'ppsf_count',
+                 'ratio_sum', 'ratio_count', 'cash_count']
+
+class SpatialGrid:
+    """
+    A square or hexagonal grid of `cell_size_m` meters laid over an equirectangular projection.
+
+    For hexagons `cell_size_m` is the distance between neighbouring cell centers. The projection is
+    centered on `origin` (lat, lon), which keeps distortion negligible at county scale.
+    """
+
+    def __init__(self, shape='square', cell_size_m=250.0, origin=(0.0, 0.0)):
+        if shape not in ('square', 'hex'):
+            raise ValueError(f"Unknown grid shape: {shape}")
+        self.shape = shape
+        self.cell_size_m = float(cell_size_m)
+        self.origin = (float(origin[0]), float(origin[1]))
+        self._x_scale = EARTH_RADIUS_METERS * math.cos(math.radians(self.origin[0])) * math.pi / 180
+        self._y_scale = EARTH_RADIUS_METERS * math.pi / 180
+
+    def to_xy(self, lat, lon):
+        x = (np.asarray(lon, dtype=np.float64) - self.origin[1]) * self._x_scale
+        y = (np.asarray(lat, dtype=np.float64) - self.origin[0]) * self._y_scale
+        return x, y
+
+    def to_lat_lon(self, x, y):
+        return y / self._y_scale + self.origin[0], x / self._x_scale + self.origin[1]
+
+    def cell_coordinates(self, lat, lon):
+        """Return integer (i, j) cell coordinates; axial (q, r) coordinates for hexagons."""
+        x, y = self.to_xy(lat, lon)
+        if self.shape == 'square':
+            return (np.floor(x / self.cell_size_m).astype(np.int64),
+                    np.floor(y / self.cell_size_m).astype(np.int64))
+
+        # Pointy-top hexagons: convert to fractional axial coordinates, then round in cube space
+        radius = self.cell_size_m / math.sqrt(3)
+        q = (math.sqrt(3) / 3 * x - y / 3) / radius
+        r = (2 / 3 * y) / radius
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+        return rq.astype(np.int64), rr.astype(np.int64)
+
+    def cell_centers(self, i, j):
+        """Return the (lat, lon) centers of cells given by `cell_coordinates`."""
+        i = np.asarray(i, dtype=np.float64)
+        j = np.asarray(j, dtype=np.float64)
+        if self.shape == 'square':
+            return self.to_lat_lon((i + 0.5) * self.cell_size_m, (j + 0.5) * self.cell_size_m)
+        radius = self.cell_size_m / math.sqrt(3)
+        return self.to_lat_lon(radius * math.sqrt(3) * (i + j / 2), radius * 1.5 * j)
+
+def month_indexes(dates):
+    """Months since year 0 for a datetime array, -1 where the date is missing."""
+    dates = pd.DatetimeIndex(dates)
+    return np.where(dates.isna(), -1, dates.year * 12 + dates.month - 1).astype(np.int64)
+
+def compact_codes(keys, span):
+    """
+    Return the sorted distinct non-negative `keys` and each key's position among them (-1 if negative).
+
+    Keys below `span` are compacted with a presence table in linear time instead of sorting.
+    """
+    valid = keys >= 0
+    if span <= 1 << 26:
+        present = np.bincount(keys[valid], minlength=span) > 0
+        positions = np.cumsum(present) - 1
+        return np.flatnonzero(present), np.where(valid, positions[np.where(valid, keys, 0)], -1)
+    distinct, inverse = np.unique(keys[valid], return_inverse=True)
+    codes = np.full(len(keys), -1, dtype=np.int64)
+    codes[valid] = inverse.ravel()
+    return distinct, codes
+
+class GridAggregate:
+    """
+    Additive market measures per grid cell, event month and listing month, built with vectorized binning.
+
+    Monthly buckets are the precomputed unit: any date range of whole months is answered by summing,
+    by cell, the buckets of a contiguous slice of the month-sorted table whose listing month is in range.
+    """
+
+    def __init__(self, grid, cell_i, cell_j, table):
+        self.grid = grid
+        self.cell_i = cell_i
+        self.cell_j = cell_j
+        self.table = table
+
+    @classmethod
+    def build(cls, data_loader, shape='square', cell_size_m=250.0, params=None):
+        """Bin the geocoded listings matching `params` (city, subdivision, type) into a grid."""
+        params = {key: value for key, value in (params or {}).items() if key not in ('start_date', 'end_date')}
+        df = data_loader.fetch_filtered_data(params, columns=GRID_COLUMNS)
+        # Listings without a listing date are never in a date range, so they are left out
+        listing_dates = pd.to_datetime(df['listing_date'], errors='coerce')
+        df = df[df['geo_lat'].notna() & df['geo_lon'].notna() & listing_dates.notna()]
+        if df.empty:
+            grid = SpatialGrid(shape, cell_size_m)
+            return cls(grid, np.zeros(0, np.int64), np.zeros(0, np.int64),
+                       {name: np.zeros(0) for name in GRID_KEYS + GRID_MEASURES})
+
+        lat = df['geo_lat'].to_numpy(dtype=np.float64)
+        lon = df['geo_lon'].to_numpy(dtype=np.float64)
+        grid = SpatialGrid(shape, cell_size_m, (float(np.mean(lat)), float(np.mean(lon))))
+        i, j = grid.cell_coordinates(lat, lon)
+        i0, j0 = i.min(), j.min()
+        rows = int(j.max() - j0) + 1
+        cell_keys, cells = compact_codes((i - i0) * rows + (j - j0), int(i.max() - i0 + 1) * rows)
+        cell_i, cell_j = cell_keys // rows + i0, cell_keys % rows + j0
+
+        listing_month = month_indexes(pd.to_datetime(df['listing_date'], errors='coerce'))
+        sold_month = month_indexes(pd.to_datetime(df['sold_date'], errors='coerce'))
+        sold_price = pd.to_numeric(df['sold_price'], errors='coerce').to_numpy(dtype=np.float64)
+        list_price = pd.to_numeric(df['list_price'], errors='coerce').to_numpy(dtype=np.float64)
+        sqft = pd.to_numeric(df['sqft_living'], errors='coerce').to_numpy(dtype=np.float64)
+        dom = pd.to_numeric(df['cumulative_dom'], errors='coerce').to_numpy(dtype=np.float64)
+        cash = (df['terms_of_sale'] == 'cash').to_numpy(dtype=np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ppsf = np.where(sqft > 0, sold_price / sqft, np.nan)
+            ratio = np.where(list_price != 0, sold_price / list_price, np.nan)
+
+        # Only occupied (month, listing month, cell) buckets are materialized; keys sort month-major
+        num_cells = len(cell_keys)
+        months = np.concatenate([listing_month, sold_month])
+        first_month = months[months >= 0].min()
+        span = int(months.max() - first_month + 1)
+        listing_offsets = np.tile(listing_month - first_month, 2)
+        month_keys = np.where(months >= 0, ((months - first_month) * span + listing_offsets) * num_cells
+                              + np.tile(cells, 2), -1)
+        bucket_keys, buckets = compact_codes(month_keys, span * span * num_cells)
+        listing_buckets, sold_buckets = buckets[:len(cells)], buckets[len(cells):]
+
+        def bucket(buckets, weights=None):
+            mask = buckets >= 0
+            if weights is not None:
+                mask &= ~np.isnan(weights)
+                weights = weights[mask]
+            return np.bincount(buckets[mask], weights=weights, minlength=len(bucket_keys)).astype(np.float64)
+
+        table = {
+            'month': (bucket_keys // num_cells // span + first_month).astype(np.int32),
+            'listing_month': (bucket_keys // num_cells % span + first_month).astype(np.int32),
+            'cell': (bucket_keys % num_cells).astype(np.int32),
+            'new_count': bucket(listing_buckets),
+            'closed_count': bucket(sold_buckets),
+            'sold_price_sum': bucket(sold_buckets, sold_price),
+            'dom_sum': bucket(sold_buckets, dom),
+            'dom_count': bucket(sold_buckets, np.where(np.isnan(dom), np.nan, 1.0)),
+            'ppsf_sum': bucket(sold_buckets, ppsf),
+            'ppsf_count': bucket(sold_buckets, np.where(np.isnan(ppsf), np.nan, 1.0)),
+            'ratio_sum': bucket(sold_buckets, ratio),
+            'ratio_count': bucket(sold_buckets, np.where(np.isnan(ratio), np.nan, 1.0)),
+            'cash_count': bucket(sold_buckets, cash)
+        }
+
+        logging.info(f"Spatial grid built: {num_cells} {shape} cells of {cell_size_m} m, {len(bucket_keys)} cell-months.")
+        return cls(grid, cell_i, cell_j, table)
+
+    def aggregate(self, start_date, end_date, listing_start=None, listing_end=None):
+        """
+        Sum the measures per cell over the event months from `start_date` to `end_date`, inclusive,
+        of listings listed from `listing_start` to `listing_end` (by default the same months).
+        """
+        first, last = month_index(pd.to_datetime(start_date)), month_index(pd.to_datetime(end_date))
+        first_listing = month_index(pd.to_datetime(listing_start)) if listing_start is not None else first
+        last_listing = month_index(pd.to_datetime(listing_end)) if listing_end is not None else last
+        lo, hi = np.searchsorted(self.table['month'], [first, last + 1])
+        listing_months = self.table['listing_month'][lo:hi]
+        mask = (listing_months >= first_listing) & (listing_months <= last_listing)
+        cells = self.table['cell'][lo:hi][mask]
+        return {
+            name: np.bincount(cells, weights=self.table[name][lo:hi][mask], minlength=len(self.cell_i))
+            for name in GRID_MEASURES
+        }
+
+    def query(self, start_date, end_date, listing_start=None, listing_end=None):
+        """
+        Return one row per occupied cell with its center and derived statistics for a date range.
+
+        Statistics follow data_analysis.py: only listings listed in the range (or from `listing_start`
+        to `listing_end`) count, sold-side values by sold month and new listings by listing month.
+        """
+        sums = self.aggregate(start_date, end_date, listing_start, listing_end)
+        occupied = (sums['new_count'] > 0) | (sums['closed_count'] > 0)
+        lat, lon = self.grid.cell_centers(self.cell_i[occupied], self.cell_j[occupied])
+        sums = {name: values[occupied] for name, values in sums.items()}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({
+                'cell_i': self.cell_i[occupied],
+                'cell_j': self.cell_j[occupied],
+                'lat': lat,
+                'lon': lon,
+                'new_listings': sums['new_count'],
+                'closed_listings': sums['closed_count'],
+                'total_dollar_volume': sums['sold_price_sum'],
+                'avg_sold_price_per_foot': sums['ppsf_sum'] / sums['ppsf_count'],
+                'avg_days_on_market': sums['dom_sum'] / sums['dom_count'],
+                'list_price_to_sold_price_ratio': sums['ratio_sum'] / sums['ratio_count'],
+                'percent_cash_sales': sums['cash_count'] / sums['closed_count'] * 100
+            })
+
+    def query_by_period(self, timeframe, start_date, end_date):
+        """Return `query` results for every month, quarter or year in the range, with a `period` column."""
+        start_date, end_date = pd.to_datetime(start_date), pd.to_datetime(end_date)
+        last_day_func = PERIOD_END_FUNCTIONS[timeframe] or get_last_day_of_month
+        frames = []
+        for window_start, window_end in get_period_windows(start_date, end_date, last_day_func):
+            frame = self.query(window_start, window_end, start_date, end_date)
+            frame.insert(0, 'period', month_key(month_index(window_start)))
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def save(self, path):
+        """Persist the grid aggregate as a compressed NumPy archive."""
+        arrays = {f'table__{name}': values for name, values in self.table.items()}
+        arrays['cell_i'] = self.cell_i
+        arrays['cell_j'] = self.cell_j
+        arrays['meta__shape'] = np.array([self.grid.shape])
+        arrays['meta__grid'] = np.array([self.grid.cell_size_m, *self.grid.origin])
+        np.savez_compressed(path, **arrays)
+        logging.info(f"Spatial grid saved to {path}.")
+
+    @classmethod
+    def load(cls, path):
+        """Load a grid aggregate saved with `save`."""
+        with np.load(path) as archive:
+            cell_size_m, origin_lat, origin_lon = archive['meta__grid']
+            grid = SpatialGrid(str(archive['meta__shape'][0]), cell_size_m, (origin_lat, origin_lon))
+            table = {name: archive[f'table__{name}'] for name in GRID_KEYS + GRID_MEASURES}
+            return cls(grid, archive['cell_i'], archive['cell_j'], table)
+
+def benchmark_queries(grid_aggregate, num_queries=100, seed=0):
+    """Time random month ranges; returns (median ms, max ms)."""
+    rng = np.random.default_rng(seed)
+    months = grid_aggregate.table['month']
+    timings = []
+    for _ in range(num_queries):
+        first, last = sorted(rng.integers(months.min(), months.max() + 1, 2))
+        started = time.perf_counter()
+        grid_aggregate.query(f'{month_key(first)}-01', f'{month_key(last)}-01')
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings)), float(np.max(timings))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute a spatial heatmap grid from a database.")
+    parser.add_argument("db_filename", help="Database file path")
+    parser.add_argument("grid_filename", help="Output grid file (.npz)")
+    parser.add_argument("--shape", default="square", choices=["square", "hex"])
+    parser.add_argument("--cell_size", type=float, default=250.0, help="Cell size in meters")
+    parser.add_argument("--city", help="Only bin listings in this city")
+    parser.add_argument("--benchmark", action='store_true', help="Time random date ranges after building")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    grid_aggregate = GridAggregate.build(DataLoader(args.db_filename), args.shape, args.cell_size, {'city': args.city})
+    print(f"Built in {time.perf_counter() - started:.2f} s")
+    grid_aggregate.save(args.grid_filename)
+    if args.benchmark:
+        median_ms, max_ms = benchmark_queries(grid_aggregate)
+        print(f"Grid query latency: median {median_ms:.2f} ms, max {max_ms:.2f} ms")
@@ -0,0 +1,236 @@
+import math
+from functools import lru_cache
+import pandas as pd
+from data_analysis import get_last_day_of_month, get_last_day_of_quarter, get_last_day_of_year
+
+# Statistics are reproduced from per-month aggregates computed inside SQLite. Dates are
+# compared at day resolution, which is how the cleaning pipeline stores them.
+
+SOLD_MEASURES = {
+    'closed_count': "COUNT(*)",
+    'sold_price_sum': "SUM(sold_price)",
+    'dom_sum': "SUM(cumulative_dom)",
+    'dom_count': "COUNT(cumulative_dom)",
+    'sqft_sum': "SUM(sqft_living)",
+    'ppsf_sum': "SUM(CASE WHEN sqft_living <> 0 THEN CAST(sold_price AS REAL) / sqft_living END)",
+    'ppsf_count': "COUNT(CASE WHEN sqft_living <> 0 THEN CAST(sold_price AS REAL) / sqft_living END)",
+    'ppsf_pos_inf': "SUM(sqft_living = 0 AND sold_price > 0)",
+    'ppsf_neg_inf': "SUM(sqft_living = 0 AND sold_price < 0)",
+    'ratio_sum': "SUM(CASE WHEN list_price <> 0 THEN CAST(sold_price AS REAL) / list_price END)",
+    'ratio_count': "COUNT(CASE WHEN list_price <> 0 THEN CAST(sold_price AS REAL) / list_price END)",
+    'ratio_pos_inf': "SUM(list_price = 0 AND sold_price > 0)",
+    'ratio_neg_inf': "SUM(list_price = 0 AND sold_price < 0)",
+    'cash_count': "SUM(terms_of_sale = 'cash')"
+}
+
+LISTED_MEASURES = {
+    'new_count': "COUNT(*)"
+}
+
+SOLD_STATISTICS = {
+    'closed_listings', 'avg_sold_price_per_foot', 'avg_days_on_market', 'total_dollar_volume',
+    'list_price_to_sold_price_ratio', 'msi', 'percent_cash_sales'
+}
+
+SNAPSHOT_STATISTICS = {'pending_listings', 'active_inventory', 'msi'}
+
+ALL_STATISTICS = {'new_listings'} | SOLD_STATISTICS | SNAPSHOT_STATISTICS
+
+PERIOD_END_FUNCTIONS = {
+    'monthly': None,
+    'quarterly': get_last_day_of_quarter,
+    'annually': get_last_day_of_year
+}
+
+def format_day(dt):
+    return dt.strftime('%Y-%m-%d')
+
+def get_period_windows(start_date, end_date, last_day_func):
+    """Return the (start, end) windows the pandas calculations loop over."""
+    if last_day_func is None:
+        return [(start_date, end_date)] if start_date <= end_date else []
+
+    windows = []
+    current_date = start_date
+    one_day = pd.Timedelta(days=1)
+    while current_date <= end_date:
+        period_end = last_day_func(current_date)
+        windows.append((current_date, period_end))
+        current_date = period_end + one_day
+    return windows
+
+@lru_cache(maxsize=4096)
+def get_month_keys_between(first, last):
+    return tuple(f'{index // 12:04d}-{index % 12 + 1:02d}' for index in range(first, last + 1))
+
+def get_month_keys(window):
+    start, end = window
+    return get_month_keys_between(start.year * 12 + start.month - 1, end.year * 12 + end.month - 1)
+
+def sum_window(aggregates, column, window):
+    """Sum one aggregate column over the monthly buckets covered by a window."""
+    buckets = aggregates[column]
+    return sum(buckets.get(key, 0) for key in get_month_keys(window))
+
+def mean_from_parts(total, count, pos_inf, neg_inf):
+    """Rebuild a pandas `.mean()` of a ratio column from its SQL sum, count and infinite parts."""
+    if pos_inf and neg_inf:
+        return math.nan
+    if pos_inf:
+        return math.inf
+    if neg_inf:
+        return -math.inf
+    if count == 0:
+        return math.nan
+    return total / count
+
+def window_mean(aggregates, prefix, window):
+    return mean_from_parts(
+        sum_window(aggregates, f'{prefix}_sum', window),
+        sum_window(aggregates, f'{prefix}_count', window),
+        sum_window(aggregates, f'{prefix}_pos_inf', window),
+        sum_window(aggregates, f'{prefix}_neg_inf', window)
+    )
+
+def fetch_aggregates(data_loader, params, date_column, measures, windows):
+    """Fetch monthly aggregates as {measure: {period: value}}, with SQL NULL sums read as 0."""
+    if not windows:
+        return {name: {} for name in measures}
+    lower_date = min(window[0] for window in windows)
+    upper_date = max(window[1] for window in windows)
+    aggregates = data_loader.fetch_monthly_aggregates(
+        params, date_column, measures, format_day(lower_date), format_day(upper_date))
+    return aggregates.set_index('period').astype(float).fillna(0).to_dict()
+
+def calculate_statistic_sql(stat, timeframe, start_date, end_date, period_windows, month_windows,
+                            listed, sold, snapshots):
+    if stat == 'new_listings':
+        return sum(sum_window(listed, 'new_count', window) for window in period_windows)
+
+    if stat == 'closed_listings':
+        return sum(sum_window(sold, 'closed_count', window) for window in period_windows)
+
+    if stat == 'total_dollar_volume':
+        return sum(sum_window(sold, 'sold_price_sum', window) for window in period_windows)
+
+    if stat == 'avg_days_on_market':
+        if timeframe == 'monthly':
+            dom_count = sum_window(sold, 'dom_count', period_windows[0]) if period_windows else 0
+            if dom_count == 0:
+                return math.nan
+            return sum_window(sold, 'dom_sum', period_windows[0]) / dom_count
+        total_sales = sum(sum_window(sold, 'closed_count', window) for window in period_windows)
+        if total_sales == 0:
+            return None
+        return sum(sum_window(sold, 'dom_sum', window) for window in period_windows) / total_sales
+
+    if stat == 'avg_sold_price_per_foot':
+        if timeframe == 'monthly':
+            return window_mean(sold, 'ppsf', period_windows[0]) if period_windows else math.nan
+        total_area = sum(sum_window(sold, 'sqft_sum', window) for window in period_windows)
+        if total_area == 0:
+            return None
+        return sum(sum_window(sold, 'sold_price_sum', window) for window in period_windows) / total_area
+
+    if stat == 'list_price_to_sold_price_ratio':
+        if timeframe == 'monthly':
+            return window_mean(sold, 'ratio', period_windows[0]) if period_windows else math.nan
+        ratio = sum(window_mean(sold, 'ratio', window) for window in month_windows)
+        return ratio / (3 if timeframe == 'quarterly' else 12)
+
+    if stat == 'percent_cash_sales':
+        windows = period_windows if timeframe == 'monthly' else month_windows
+        total_cash_sales = 0
+        total_sales = 0
+        for window in windows:
+            month_sales = sum_window(sold, 'closed_count', window)
+            if month_sales == 0:
+                continue
+            monthly_cash = (sum_window(sold, 'cash_count', window) / month_sales) * 100
+            if timeframe == 'monthly':
+                return monthly_cash
+            total_cash_sales += monthly_cash * month_sales
+            total_sales += month_sales
+        if total_sales == 0:
+            return None
+        return total_cash_sales / total_sales
+
+    if stat in ('pending_listings', 'active_inventory'):
+        last_day_func = PERIOD_END_FUNCTIONS[timeframe]
+        as_of = end_date if last_day_func is None else last_day_func(end_date)
+        return snapshots[stat].get(format_day(as_of), 0)
+
+    if stat == 'msi':
+        if timeframe == 'monthly':
+            total_active = snapshots['active_inventory'].get(format_day(end_date), 0)
+            total_closed = sum_window(sold, 'closed_count', period_windows[0]) if period_windows else 0
+        else:
+            total_active = sum(snapshots['active_inventory'].get(format_day(window[1]), 0) for window in month_windows)
+            total_closed = sum(sum_window(sold, 'closed_count', window) for window in month_windows)
+        if total_closed == 0:
+            return None
+        return total_active / (total_closed / 12)
+
+def get_statistic_windows(timeframe, start_date, end_date):
+    """Return the timeframe windows and, for quarterly and annual timeframes, the month windows."""
+    period_windows = get_period_windows(start_date, end_date, PERIOD_END_FUNCTIONS[timeframe])
+    month_windows = [] if timeframe == 'monthly' else get_period_windows(start_date, end_date, get_last_day_of_month)
+    return period_windows, month_windows
+
+def get_snapshot_dates(timeframe, end_date, month_windows):
+    last_day_func = PERIOD_END_FUNCTIONS[timeframe]
+    as_of_dates = {end_date if last_day_func is None else last_day_func(end_date)}
+    as_of_dates.update(window[1] for window in month_windows)
+    return sorted(as_of_dates)
+
+def timeframe_error_results(stats_to_calculate, timeframe):
+    return {stat: f"Error calculating {stat}: {str(KeyError(timeframe))}" for stat in stats_to_calculate}
+
+def calculate_statistics(stats_to_calculate, timeframe, start_date, end_date, period_windows, month_windows,
+                         listed, sold, snapshots):
+    """Assemble the results dictionary from monthly aggregates and inventory snapshots."""
+    results = {}
+    for stat in stats_to_calculate:
+        if stat not in ALL_STATISTICS:
+            results[stat] = "No calculation function defined for this statistic"
+            continue
+        try:
+            results[stat] = calculate_statistic_sql(stat, timeframe, start_date, end_date, period_windows,
+                                                    month_windows, listed, sold, snapshots)
+        except Exception as e:
+            results[stat] = f"Error calculating {stat}: {str(e)}"
+    return results
+
+def analyze_real_estate_data_sql(data_loader, params):
+    """
+    SQL counterpart of `analyze_real_estate_data`.
+
+    Filters are read from `params` the same way `DataLoader.fetch_filtered_data` reads them, and
+    only monthly aggregate rows and inventory snapshot counts leave SQLite.
+    """
+    timeframe = params.get('timeframe')
+    start_date = pd.to_datetime(params.get('start_date'))
+    end_date = pd.to_datetime(params.get('end_date'))
+    stats_to_calculate = params.get('stats_to_calculate')
+
+    if timeframe not in PERIOD_END_FUNCTIONS:
+        return timeframe_error_results(stats_to_calculate, timeframe)
+
+    period_windows, month_windows = get_statistic_windows(timeframe, start_date, end_date)
+    requested = set(stats_to_calculate)
+
+    listed = sold = snapshots = None
+    try:
+        if 'new_listings' in requested:
+            listed = fetch_aggregates(data_loader, params, 'listing_date', LISTED_MEASURES, period_windows)
+        if requested & SOLD_STATISTICS:
+            sold = fetch_aggregates(data_loader, params, 'sold_date', SOLD_MEASURES, period_windows + month_windows)
+        if requested & SNAPSHOT_STATISTICS:
+            as_of_dates = [format_day(as_of) for as_of in get_snapshot_dates(timeframe, end_date, month_windows)]
+            snapshots = data_loader.fetch_inventory_snapshots(
+                params, as_of_dates).set_index('as_of').astype(int).to_dict()
+    except Exception as e:
+        return {stat: f"Error calculating {stat}: {str(e)}" for stat in stats_to_calculate}
+
+    return calculate_statistics(stats_to_calculate, timeframe, start_date, end_date, period_windows,
+                                month_windows, listed, sold, snapshots)
@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import instrumentation
+from analysis_cache import encode_value
+from batch_report import DATE_COLUMNS, STATISTIC_COLUMNS, get_required_columns
+from data_analysis import analyze_real_estate_data
+from Data_Loader import DataLoader
+from db_metadata import load_metadata
+
+# A small HTTP/1.1 service answering statistic queries for many clients from one database.
+# Blocking SQLite and pandas work runs on a bounded thread pool; identical requests in flight
+# share one computation and finished responses are cached per data version.
+
+TIMEFRAMES = ['monthly', 'quarterly', 'annually']
+FILTER_FIELDS = ['city', 'subdivision', 'building_type']
+MAX_HEADER_BYTES = 16384
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class RequestError(Exception):
+    """A client error answered with `status` and `message`."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def to_json_value(value):
+    """Convert a statistic result, including quantile dicts, to a JSON-safe value."""
+    if isinstance(value, dict):
+        return {key: to_json_value(item) for key, item in value.items()}
+    if value is None or isinstance(value, str):
+        return value
+    value = encode_value(value)
+    # Missing means encode as {'float': 'nan'}; JSON clients expect null
+    return None if isinstance(value, dict) else value
+
+def parse_statistics_query(query):
+    """Validate the /statistics query string and return analysis params."""
+    values = parse_qs(query, keep_blank_values=False)
+
+    def single(name, default=None):
+        items = values.get(name)
+        return items[-1] if items else default
+
+    params = {field: single(field) for field in FILTER_FIELDS}
+    params['timeframe'] = single('timeframe', 'monthly')
+    if params['timeframe'] not in TIMEFRAMES:
+        raise RequestError(400, f"timeframe must be one of {', '.join(TIMEFRAMES)}")
+    for field in ['start_date', 'end_date']:
+        value = single(field)
+        if value is None:
+            raise RequestError(400, f"{field} is required")
+        try:
+            params[field] = datetime.date.fromisoformat(value).isoformat()
+        except ValueError:
+            raise RequestError(400, f"{field} must be a YYYY-MM-DD date")
+    if params['start_date'] > params['end_date']:
+        raise RequestError(400, "start_date is after end_date")
+
+    stats = [stat for item in values.get('stats', []) for stat in item.split(',') if stat]
+    unknown = sorted(set(stats) - set(STATISTIC_COLUMNS))
+    if unknown:
+        raise RequestError(400, f"unknown statistics: {', '.join(unknown)}")
+    params['stats_to_calculate'] = sorted(set(stats)) if stats else list(STATISTIC_COLUMNS)
+    return params
+
+class StatisticsService:
+    """
+    Computes statistics for HTTP requests against `db_file`.
+
+    At most `max_workers` computations run at once and at most `max_pending` distinct ones may
+    be waiting or running; beyond that requests are refused with 503. Responses are cached by
+    request and data version, which is re-read at most every `version_check_seconds`.
+    """
+
+    def __init__(self, db_file, max_workers=4, max_pending=64, cache_entries=4096, version_check_seconds=1.0,
+                 in_memory=False, columnar=False):
+        self.data_loader = DataLoader(db_file, in_memory=in_memory, columnar=columnar)
+        self.db_file = db_file
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='statistics')
+        self.max_pending = max_pending
+        self.cache_entries = cache_entries
+        self.version_check_seconds = version_check_seconds
+        self.responses = OrderedDict()
+        self.in_flight = {}
+        self.data_version = None
+        self.version_checked_at = None
+        self.version_task = None
+        self.counters = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'computed': 0, 'rejected': 0, 'errors': 0}
+
+    async def current_data_version(self):
+        """The database's data version, shared by concurrent callers and refreshed periodically."""
+        now = time.monotonic()
+        if self.version_checked_at is not None and now - self.version_checked_at < self.version_check_seconds:
+            return self.data_version
+        if self.version_task is None:
+            loop = asyncio.get_running_loop()
+            self.version_task = loop.run_in_executor(self.executor, self.data_loader.get_data_version)
+        task = self.version_task
+        try:
+            data_version = await task
+        finally:
+            if self.version_task is task:
+                self.version_task = None
+        if data_version != self.data_version:
+            if self.data_version is not None:
+                logging.info(f"Data version changed from {self.data_version} to {data_version}; clearing responses.")
+            self.responses.clear()
+            self.data_version = data_version
+        self.version_checked_at = time.monotonic()
+        return data_version
+
+    def compute(self, params):
+        """Fetch and analyze on a worker thread; returns the encoded response body."""
+        with instrumentation.span('compute_statistics', category='service', stats=len(params['stats_to_calculate'])):
+            df = self.data_loader.fetch_filtered_data(params, columns=get_required_columns(params['stats_to_calculate']))
+            for column in DATE_COLUMNS & set(df.columns):
+                df[column] = pd.to_datetime(df[column], errors='coerce')
+            results = analyze_real_estate_data(df, params)
+        body = {'params': params, 'rows': len(df), 'results': {stat: to_json_value(value) for stat, value in results.items()}}
+        return json.dumps(body).encode()
+
+    async def statistics(self, params):
+        """Return the response body for `params`, from the cache, an identical request in flight or a new computation."""
+        data_version = await self.current_data_version()
+        key = (json.dumps(params, sort_keys=True), data_version)
+        body = self.responses.get(key)
+        if body is not None:
+            self.responses.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return body
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+            # Shielded so one client disconnecting does not cancel the others' result
+            return await asyncio.shield(future)
+
+        if len(self.in_flight) >= self.max_pending:
+            self.counters['rejected'] += 1
+            raise RequestError(503, "too many computations pending, retry later")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.compute, params)
+        self.in_flight[key] = future
+        try:
+            body = await asyncio.shield(future)
+        finally:
+            self.in_flight.pop(key, None)
+        self.counters['computed'] += 1
+        if key[1] == self.data_version:
+            self.responses[key] = body
+            while len(self.responses) > self.cache_entries:
+                self.responses.popitem(last=False)
+        return body
+
+    async def metadata(self):
+        loop = asyncio.get_running_loop()
+        metadata = await loop.run_in_executor(self.executor, load_metadata, self.db_file)
+        if metadata is None:
+            raise RequestError(503, "database has no listings")
+        return json.dumps(metadata).encode()
+
+    def status(self):
+        return json.dumps(dict(self.counters, data_version=self.data_version, in_flight=len(self.in_flight),
+                               cached_responses=len(self.responses),
+                               snapshot=self.data_loader.get_snapshot_stats())).encode()
+
+    async def route(self, method, target):
+        """Return (status, content type, body) for one request."""
+        if method != 'GET':
+            raise RequestError(405, "only GET is supported")
+        url = urlsplit(target)
+        if url.path == '/statistics':
+            return 200, 'application/json', await self.statistics(parse_statistics_query(url.query))
+        if url.path == '/metadata':
+            return 200, 'application/json', await self.metadata()
+        if url.path == '/status':
+            return 200, 'application/json', self.status()
+        if url.path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', instrumentation.prometheus_text().encode()
+        if url.path == '/health':
+            return 200, 'application/json', b'{"status": "ok"}'
+        raise RequestError(404, f"no route for {url.path}")
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it or asks to."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 400, 'application/json', b'{"error": "headers too large"}', False)
+                    return
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self.respond(writer, 400, 'application/json', b'{"error": "malformed request line"}', False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0) or 0):
+                    await reader.readexactly(int(headers['content-length']))
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+                self.counters['requests'] += 1
+                started = time.perf_counter()
+                try:
+                    status, content_type, body = await self.route(method, target)
+                except RequestError as e:
+                    status, content_type, body = e.status, 'application/json', json.dumps({'error': e.message}).encode()
+                except Exception as e:
+                    logging.error(f"Error serving {target}: {e}")
+                    self.counters['errors'] += 1
+                    status, content_type, body = 500, 'application/json', json.dumps({'error': str(e)}).encode()
+                instrumentation.observe('service_request_seconds', time.perf_counter() - started, status=status)
+                await self.respond(writer, status, content_type, body, keep_alive)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, content_type, body, keep_alive):
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8080, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        address = server.sockets[0].getsockname()
+        logging.info(f"Statistics service for {self.db_file} listening on http://{address[0]}:{address[1]}")
+        if ready is not None:
+            ready(address)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve real estate statistics over HTTP.")
+    parser.add_argument("db_filename", help="Database file path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="Threads running queries and analyses")
+    parser.add_argument("--max_pending", type=int, default=64, help="Distinct computations allowed before refusing with 503")
+    parser.add_argument("--cache_entries", type=int, default=4096, help="Responses kept per data version")
+    parser.add_argument("--in_memory", choices=['all', 'analysis'],
+                        help="Serve reads from an in-memory copy of the whole database or of the analysis tables")
+    parser.add_argument("--columnar", action='store_true',
+                        help="Read listings from the database's columnar snapshot while it is current")
+    parser.add_argument("--metrics", action='store_true', help="Record spans and latency histograms for /metrics")
+    args = parser.parse_args()
+
+    instrumentation.configure_logging('stats_service.log')
+    if args.metrics:
+        instrumentation.enable()
+    in_memory = {None: False, 'all': True}.get(args.in_memory, args.in_memory)
+    service = StatisticsService(args.db_filename, args.workers, args.max_pending, args.cache_entries,
+                                in_memory=in_memory, columnar=args.columnar)
+    ready = lambda address: print(f"Listening on http://{address[0]}:{address[1]}", flush=True)
+    try:
+        asyncio.run(service.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
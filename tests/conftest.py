@@ -0,0 +1,27 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_sql_backend import DATE_COLUMNS, build_database
+
+NUM_ROWS = 3000
+
+@pytest.fixture(scope='session')
+def data_loader(tmp_path_factory):
+    """A small synthetic listings database shared by the read-only tests."""
+    return build_database(str(tmp_path_factory.mktemp('db') / 'listings.db'), NUM_ROWS)
+
+@pytest.fixture
+def fresh_loader(tmp_path):
+    """A small synthetic listings database a test may write to."""
+    return build_database(str(tmp_path / 'listings.db'), NUM_ROWS)
+
+def fetch_listings(data_loader, params):
+    """The filtered listing frame the numpy and pandas backends analyze."""
+    df = data_loader.fetch_filtered_data(params)
+    for column in DATE_COLUMNS:
+        df[column] = pd.to_datetime(df[column])
+    return df
@@ -0,0 +1,54 @@
+import os
+import pytest
+from analysis_cache import AnalysisCache
+from benchmark_sql_backend import build_database
+from Data_Loader import DataLoader
+
+PARAMS = {'start_date': '2016-01-01', 'end_date': '2016-12-31', 'timeframe': 'monthly',
+          'stats_to_calculate': ['closed_listings', 'total_dollar_volume']}
+
+def test_sql_backend_miss_uses_the_cache_loader(data_loader):
+    cache = AnalysisCache(data_loader)
+    results = cache.analyze(dict(PARAMS, backend='sql'))
+    assert cache.get_stats()['misses'] == 2
+    assert results == AnalysisCache(data_loader).analyze(dict(PARAMS, backend='numpy'))
+
+def test_frameless_backends_do_not_fetch_listings(data_loader, monkeypatch):
+    def fail(params):
+        raise AssertionError("listings fetched")
+    monkeypatch.setattr(data_loader, 'fetch_filtered_data', fail)
+    monkeypatch.setattr('analysis_cache.analyze_real_estate_data',
+                        lambda df, params: {stat: 1.0 for stat in params['stats_to_calculate']})
+    for backend in ['sql', 'cube', 'sketch']:
+        assert AnalysisCache(data_loader).analyze(dict(PARAMS, backend=backend))['closed_listings'] == 1.0
+
+def test_data_version_change_invalidates(fresh_loader):
+    cache = AnalysisCache(fresh_loader)
+    cache.analyze(PARAMS)
+    key = cache.make_key(PARAMS, 'closed_listings')
+    fresh_loader.execute_query("UPDATE listing_details SET sold_price = sold_price * 2", commit=True)
+    results = cache.analyze(PARAMS)
+    assert cache.get_stats()['invalidations'] == 1
+    assert key not in cache.entries
+    assert results == AnalysisCache(fresh_loader).analyze(PARAMS)
+
+def test_databases_sharing_a_disk_cache_are_kept_apart(tmp_path):
+    disk_path = str(tmp_path / 'cache.db')
+    first = build_database(str(tmp_path / 'first.db'), 500, seed=1)
+    second = build_database(str(tmp_path / 'second.db'), 500, seed=2)
+    assert first.get_data_version() == second.get_data_version()
+    first_results = AnalysisCache(first, disk_path=disk_path).analyze(PARAMS)
+    second_cache = AnalysisCache(second, disk_path=disk_path)
+    assert second_cache.analyze(PARAMS) == AnalysisCache(second).analyze(PARAMS)
+    assert second_cache.get_stats()['disk_hits'] == 0
+    assert first_results != second_cache.analyze(PARAMS)
+
+def test_recreated_database_does_not_reuse_results(tmp_path):
+    disk_path = str(tmp_path / 'cache.db')
+    db_file = str(tmp_path / 'listings.db')
+    AnalysisCache(build_database(db_file, 500, seed=1), disk_path=disk_path).analyze(PARAMS)
+    os.remove(db_file)
+    recreated = build_database(db_file, 500, seed=2)
+    cache = AnalysisCache(recreated, disk_path=disk_path)
+    assert cache.analyze(PARAMS) == AnalysisCache(DataLoader(db_file)).analyze(PARAMS)
+    assert cache.get_stats()['disk_hits'] == 0
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+from benchmark_sql_backend import STATISTICS, results_match
+from conftest import fetch_listings
+from data_analysis import analyze_real_estate_data
+from olap_cube import MarketCube
+
+TIMEFRAMES = ['monthly', 'quarterly', 'annually']
+SEGMENTS = [{}, {'city': 'naples'}, {'city': 'fort myers', 'building_type': 'condo'},
+            {'subdivision': 'subdivision 7'}]
+
+@pytest.fixture(scope='module')
+def cube(data_loader):
+    return MarketCube.build(data_loader)
+
+def analyze_all(data_loader, cube, params, backends=('numpy', 'pandas', 'sql', 'cube')):
+    df = fetch_listings(data_loader, params)
+    return {
+        backend: analyze_real_estate_data(df.copy(), dict(params, backend=backend, data_loader=data_loader, cube=cube))
+        for backend in backends
+    }
+
+def assert_backends_match(results):
+    for backend, result in results.items():
+        assert not any(isinstance(value, str) for value in result.values()), (backend, result)
+        assert results_match(results['pandas'], result), (backend, results['pandas'], result)
+
+@pytest.mark.parametrize('timeframe', TIMEFRAMES)
+@pytest.mark.parametrize('segment', SEGMENTS)
+def test_backends_match_on_segments(data_loader, cube, timeframe, segment):
+    params = dict(segment, start_date='2015-04-01', end_date='2019-09-30', timeframe=timeframe,
+                  stats_to_calculate=STATISTICS)
+    assert_backends_match(analyze_all(data_loader, cube, params))
+
+@pytest.mark.parametrize('timeframe', TIMEFRAMES)
+@pytest.mark.parametrize('dates', [('2016-01-31', '2016-08-31'), ('2016-05-31', '2018-03-15'), ('2017-12-31', '2017-12-31')])
+def test_period_loops_end_for_dates_inside_periods(data_loader, cube, timeframe, dates):
+    # The pandas loops used to step to the period end, never past it, for start dates late in a month
+    params = dict(start_date=dates[0], end_date=dates[1], timeframe=timeframe, stats_to_calculate=STATISTICS)
+    assert_backends_match(analyze_all(data_loader, cube, params, backends=('numpy', 'pandas', 'sql')))
+
+@pytest.mark.parametrize('timeframe', TIMEFRAMES)
+def test_timestamp_dates_match_on_every_backend(data_loader, cube, timeframe):
+    params = dict(start_date=pd.Timestamp('2016-01-01'), end_date=pd.Timestamp('2018-12-31'),
+                  timeframe=timeframe, stats_to_calculate=STATISTICS)
+    assert_backends_match(analyze_all(data_loader, cube, params))
+
+def test_timestamp_and_string_dates_agree(data_loader):
+    params = dict(timeframe='quarterly', stats_to_calculate=STATISTICS, backend='sql', data_loader=data_loader)
+    strings = analyze_real_estate_data(None, dict(params, start_date='2017-01-01', end_date='2017-12-31'))
+    timestamps = analyze_real_estate_data(
+        None, dict(params, start_date=pd.Timestamp('2017-01-01'), end_date=pd.Timestamp('2017-12-31')))
+    assert results_match(strings, timestamps)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+import comps
+from comps import ComparableSalesFinder, chord_to_miles, to_unit_vectors
+from Data_Loader import DataLoader
+
+NUM_SALES = 2000
+
+@pytest.fixture(scope='module')
+def finder(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    listing_number = [f'C{i}' for i in range(NUM_SALES)]
+    # A dense cluster downtown and sparse listings around it
+    dense = rng.random(NUM_SALES) < 0.5
+    spread = np.where(dense, 0.005, 0.2)
+    sold_date = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3000, NUM_SALES), unit='D')
+    frames = {
+        'listing_details': pd.DataFrame({'listing_number': listing_number, 'listing_date': sold_date - pd.Timedelta(days=45),
+                                         'sold_date': sold_date, 'sold_price': rng.integers(100, 900, NUM_SALES) * 1000.0}),
+        'properties': pd.DataFrame({'listing_number': listing_number, 'sqft_living': rng.integers(800, 4000, NUM_SALES),
+                                    'total_bedrooms': rng.integers(1, 6, NUM_SALES)}),
+        'location': pd.DataFrame({'listing_number': listing_number, 'geo_lat': 26.14 + rng.normal(0, spread),
+                                  'geo_lon': -81.79 + rng.normal(0, spread)}),
+        'property_features': pd.DataFrame({'listing_number': listing_number, 'baths_full': rng.integers(1, 4, NUM_SALES),
+                                           'private_pool': rng.random(NUM_SALES) < 0.3,
+                                           'waterfront': rng.random(NUM_SALES) < 0.1})
+    }
+    data_loader = DataLoader(str(tmp_path_factory.mktemp('comps') / 'comps.db'))
+    data_loader.create_database()
+    data_loader.insert_listings(frames)
+    finder = ComparableSalesFinder(data_loader)
+    finder.refresh()
+    return finder
+
+def subjects_of(finder, num_subjects=200):
+    return finder.sales.sample(num_subjects, random_state=1).reset_index(drop=True)
+
+@pytest.mark.parametrize('window', [(None, None), ('2018-01-01', '2018-03-31'), ('2022-06-01', '2022-06-30')])
+def test_comps_respect_the_date_window_and_skip_the_subject(finder, window):
+    start_date, end_date = window
+    subjects = subjects_of(finder)
+    found = finder.find_comps_batch(subjects, k=5, radius_miles=2.0, start_date=start_date, end_date=end_date)
+    assert (found['distance_miles'] <= 2.0 + 1e-9).all()
+    if start_date is not None:
+        assert (found['sold_date'] >= pd.Timestamp(start_date)).all()
+        assert (found['sold_date'] <= pd.Timestamp(end_date)).all()
+    assert (found['listing_number'].to_numpy() != subjects['listing_number'].to_numpy()[found['subject']]).all()
+
+    # Every subject gets as many comparables as qualify, up to k
+    points = to_unit_vectors(subjects['geo_lat'], subjects['geo_lon'])
+    sales_points = to_unit_vectors(finder.sales['geo_lat'], finder.sales['geo_lon'])
+    miles = chord_to_miles(np.linalg.norm(points[:, None, :] - sales_points[None, :, :], axis=2))
+    qualifying = (miles <= 2.0) & (finder.sales['listing_number'].to_numpy() != subjects['listing_number'].to_numpy()[:, None])
+    if start_date is not None:
+        sold = finder.sales['sold_date']
+        qualifying &= ((sold >= pd.Timestamp(start_date)) & (sold <= pd.Timestamp(end_date))).to_numpy()
+    expected = np.minimum(qualifying.sum(axis=1), 5)
+    counts = found.groupby('subject').size().reindex(range(len(subjects)), fill_value=0).to_numpy()
+    np.testing.assert_array_equal(counts, expected)
+
+def test_growing_search_matches_searching_every_sale(finder, monkeypatch):
+    subjects = subjects_of(finder)
+    args = dict(k=5, radius_miles=3.0, start_date='2019-01-01', end_date='2019-02-28')
+    exhaustive = finder.find_comps_batch(subjects, candidates=NUM_SALES, **args)
+    # Tiny chunks and a small first search force several rounds over few subjects at a time
+    monkeypatch.setattr(comps, 'QUERY_PAIRS', 64)
+    grown = finder.find_comps_batch(subjects, **args)
+    qualifying_counts = exhaustive.groupby('subject').size()
+    full = qualifying_counts[qualifying_counts == 5].index
+    assert set(grown['subject']) == set(exhaustive['subject'])
+    # Where a subject had few qualifying sales nearby both searches saw all of them
+    sparse = ~grown['subject'].isin(full)
+    pd.testing.assert_frame_equal(grown[sparse].reset_index(drop=True), exhaustive[~exhaustive['subject'].isin(full)].reset_index(drop=True))
@@ -0,0 +1,37 @@
+import sqlite3
+from Clean_And_Process2 import finish_ingest
+from db_metadata import DIMENSION_COUNT_QUERY, load_metadata, read_dimensions
+
+def count_dimensions(data_loader):
+    conn = sqlite3.connect(data_loader.db_file)
+    try:
+        return [list(row) for row in conn.execute(DIMENSION_COUNT_QUERY)]
+    finally:
+        conn.close()
+
+def read_without_writing(data_loader):
+    conn = sqlite3.connect(data_loader.db_file)
+    try:
+        rows = read_dimensions(conn)
+        assert conn.total_changes == 0 and not conn.in_transaction
+        return rows
+    finally:
+        conn.close()
+
+def test_reads_count_listings_without_storing_a_dictionary(fresh_loader):
+    assert read_without_writing(fresh_loader) == count_dimensions(fresh_loader)
+    assert fresh_loader.execute_read_query("SELECT COUNT(*) AS n FROM dimension_dictionary")['n'][0] == 0
+
+def test_stale_dictionary_is_read_until_finish_ingest_rebuilds_it(fresh_loader):
+    finish_ingest(fresh_loader)
+    built = count_dimensions(fresh_loader)
+    fresh_loader.execute_query("UPDATE location SET city = 'Elsewhere' WHERE rowid % 2 = 0", commit=True)
+    version = fresh_loader.get_data_version()
+    assert read_without_writing(fresh_loader) == built
+    assert fresh_loader.get_dimension_dictionary() == built
+    stale_metadata = load_metadata(fresh_loader.db_file)
+    assert stale_metadata['dimensions'] == built and stale_metadata['data_version'] < version
+
+    finish_ingest(fresh_loader)
+    assert read_without_writing(fresh_loader) == count_dimensions(fresh_loader) != built
+    assert load_metadata(fresh_loader.db_file)['dimensions'] == count_dimensions(fresh_loader)
@@ -0,0 +1,86 @@
+import threading
+import pytest
+import Clean_And_Process2
+from Clean_And_Process2 import CleaningScriptError, IngestCancelled, process_and_load_data
+from Data_Loader import DataLoader
+from ingest_benchmark import generate_mls_csv
+
+NUM_ROWS = 400
+
+@pytest.fixture(scope='module')
+def exports(tmp_path_factory):
+    """Two exports of the same listings with different contents."""
+    directory = tmp_path_factory.mktemp('exports')
+    paths = [str(directory / f'export{seed}.csv') for seed in (0, 1)]
+    for seed, path in enumerate(paths):
+        generate_mls_csv(path, NUM_ROWS, seed=seed)
+    return paths
+
+def test_reingesting_an_overlapping_export_updates_listings(tmp_path, exports):
+    db_file = str(tmp_path / 'listings.db')
+    first = process_and_load_data(exports[:1], db_file, create_new_db=True)
+    events = []
+    second = process_and_load_data(exports[1:], db_file, progress=events.append)
+    assert second == first
+    written = {event['table']: event for event in events if event['event'] == 'rows_written'}
+    assert written['listing_details']['rows'] == written['listing_details']['updated'] == second
+    assert written['listing_search']['updated'] == written['listing_search']['rows']
+
+    data_loader = DataLoader(db_file)
+    assert data_loader.execute_read_query("SELECT COUNT(*) AS n FROM listing_details")['n'][0] == first
+    assert data_loader.execute_read_query("SELECT COUNT(*) AS n FROM listing_search")['n'][0] == first
+    reloaded = str(tmp_path / 'reloaded.db')
+    process_and_load_data(exports[1:], reloaded, create_new_db=True)
+    query = "SELECT * FROM listing_details ORDER BY listing_number"
+    assert data_loader.execute_read_query(query).equals(DataLoader(reloaded).execute_read_query(query))
+
+def test_failed_file_is_not_masked_by_finish_ingest(tmp_path, exports, monkeypatch):
+    calls = []
+    def fail(data_loader):
+        calls.append(data_loader)
+        raise RuntimeError("summaries failed")
+    monkeypatch.setattr(Clean_And_Process2, 'finish_ingest', fail)
+    with pytest.raises(CleaningScriptError, match='missing.csv'):
+        process_and_load_data([exports[0], str(tmp_path / 'missing.csv')], str(tmp_path / 'listings.db'),
+                              create_new_db=True)
+    assert not calls
+
+def test_progress_events_cover_the_run(tmp_path, exports):
+    events = []
+    rows = process_and_load_data(exports, str(tmp_path / 'listings.db'), create_new_db=True,
+                                 progress=events.append, load_chunk_rows=150)
+    assert events[0]['event'] == 'file_started' and events[-1] == dict(events[-1], event='finished', rows=rows)
+    fractions = [event['fraction'] for event in events]
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+    assert [event['file_index'] for event in events if event['event'] == 'file_finished'] == [0, 1]
+    written = [event for event in events if event['event'] == 'rows_written' and event['table'] == 'listing_details']
+    assert sum(event['rows'] for event in written) == rows
+    # The second export rewrites the listings of the first
+    assert sum(event['updated'] for event in written) == rows // 2
+    assert all(event['eta_seconds'] is not None for event in events[1:])
+
+def test_cancel_keeps_written_chunks_and_refreshes_summaries(tmp_path, exports):
+    cancel_event = threading.Event()
+    def cancel_after_first_chunk(event):
+        if event['event'] == 'rows_written':
+            cancel_event.set()
+    db_file = str(tmp_path / 'listings.db')
+    with pytest.raises(IngestCancelled):
+        process_and_load_data(exports, db_file, create_new_db=True, progress=cancel_after_first_chunk,
+                              cancel_event=cancel_event, load_chunk_rows=100)
+    data_loader = DataLoader(db_file)
+    assert data_loader.execute_read_query("SELECT COUNT(*) AS n FROM listing_details")['n'][0] == 100
+    assert sum(row[-1] for row in data_loader.get_dimension_dictionary()) == 100
+    assert data_loader.execute_read_query(
+        "SELECT MAX(data_version) AS version FROM dimension_dictionary")['version'][0] == data_loader.get_data_version()
+
+def test_cancel_before_any_chunk_writes_nothing(tmp_path, exports, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Clean_And_Process2, 'finish_ingest', calls.append)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    db_file = str(tmp_path / 'listings.db')
+    with pytest.raises(IngestCancelled):
+        process_and_load_data(exports, db_file, create_new_db=True, cancel_event=cancel_event)
+    assert DataLoader(db_file).execute_read_query("SELECT COUNT(*) AS n FROM listing_details")['n'][0] == 0
+    assert not calls
@@ -0,0 +1,42 @@
+import pandas as pd
+from olap_cube import SEGMENT_GROUPS
+
+AS_OF_DATES = [day.strftime('%Y-%m-%d') for day in pd.date_range('2013-12-31', '2025-06-30', freq='ME')] + \
+    ['2017-06-15', '2001-01-01']
+
+def expected_snapshots(data_loader, as_of_dates, group_columns):
+    """Count the snapshots listing by listing, as the interval definition reads."""
+    df = data_loader.execute_read_query(
+        "SELECT city, type, listing_date, under_contract_date, end_of_listing_date FROM listing_details "
+        "JOIN properties USING (listing_number) JOIN location USING (listing_number)")
+    rows = []
+    for as_of in as_of_dates:
+        next_day = (pd.Timestamp(as_of) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        listed = df[(df['listing_date'] < as_of) & (df['end_of_listing_date'] >= next_day)]
+        pending = listed['under_contract_date'].notna() & (listed['under_contract_date'] < next_day)
+        counts = listed.assign(active_inventory=~pending, pending_listings=pending)
+        if group_columns:
+            counts = counts.groupby(group_columns, as_index=False)[['active_inventory', 'pending_listings']].sum()
+        else:
+            counts = counts[['active_inventory', 'pending_listings']].sum().to_frame().T
+        rows.append(counts.assign(as_of=as_of))
+    return pd.concat(rows, ignore_index=True)
+
+def compare(actual, expected, keys):
+    actual = actual[actual[['active_inventory', 'pending_listings']].sum(axis=1) > 0]
+    expected = expected[expected[['active_inventory', 'pending_listings']].sum(axis=1) > 0]
+    columns = keys + ['active_inventory', 'pending_listings']
+    actual = actual[columns].astype({'active_inventory': int, 'pending_listings': int})
+    expected = expected[columns].astype({'active_inventory': int, 'pending_listings': int})
+    pd.testing.assert_frame_equal(actual.sort_values(keys).reset_index(drop=True),
+                                  expected.sort_values(keys).reset_index(drop=True))
+
+def test_snapshot_sweep_matches_interval_counts(data_loader):
+    actual = data_loader.fetch_inventory_snapshots({}, AS_OF_DATES)
+    assert sorted(actual['as_of']) == sorted(AS_OF_DATES)
+    compare(actual, expected_snapshots(data_loader, AS_OF_DATES, []), ['as_of'])
+
+def test_grouped_snapshot_sweep_matches_interval_counts(data_loader):
+    group_by = {'city': SEGMENT_GROUPS['city'], 'type': SEGMENT_GROUPS['type']}
+    actual = data_loader.fetch_inventory_snapshots({}, AS_OF_DATES, group_by=group_by)
+    compare(actual, expected_snapshots(data_loader, AS_OF_DATES, ['city', 'type']), ['as_of', 'city', 'type'])
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from olap_cube import DIMENSIONS
+from data_analysis import get_last_day_of_quarter
+from quantile_sketch import DEFAULT_K, KLLSketch, QuantileSketchStore, benchmark_sketches
+
+# The documented normalized rank error of one quantile at the default k
+RANK_ERROR = 0.013
+
+def rank_error(values, estimate, q):
+    return abs(np.searchsorted(np.sort(values), estimate, side='right') / len(values) - q)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merged_sketches_stay_within_the_rank_error_bound(seed):
+    assert benchmark_sketches(100000, num_parts=60, seed=seed)['max_rank_error'] <= RANK_ERROR
+
+def test_merge_order_keeps_the_bound():
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(13, 0.6, 100000)
+    parts = [KLLSketch(seed=i).update(part) for i, part in enumerate(np.array_split(values, 64))]
+    # Merge pairwise, as a tree, rather than one by one
+    while len(parts) > 1:
+        parts = [parts[i].merge(parts[i + 1]) for i in range(0, len(parts), 2)]
+    qs = [i / 20 for i in range(1, 20)]
+    for q, estimate in zip(qs, parts[0].quantiles(qs)):
+        assert rank_error(values, estimate, q) <= RANK_ERROR
+    assert parts[0].n == len(values)
+
+def test_small_sketches_are_exact():
+    values = np.random.default_rng(1).lognormal(13, 0.6, DEFAULT_K)
+    qs = [0.1, 0.5, 0.9]
+    assert KLLSketch(seed=0).update(values).quantiles(qs) == pytest.approx(np.quantile(values, qs).tolist())
+
+@pytest.fixture(scope='module')
+def store(data_loader):
+    return QuantileSketchStore.build(data_loader)
+
+@pytest.fixture(scope='module')
+def sales(data_loader):
+    df = data_loader.fetch_filtered_data({}, columns=DIMENSIONS + ['sold_date', 'sold_price'])
+    df = df[df['sold_date'].notna()]
+    return df.assign(sold_date=pd.to_datetime(df['sold_date']))
+
+@pytest.mark.parametrize('dates', [('2015-01-01', '2015-01-31'), ('2014-07-01', '2021-06-30'), ('2016-01-01', '2023-12-31')])
+@pytest.mark.parametrize('segment', [{}, {'city': 'naples'}, {'building_type': 'condo'}])
+def test_store_median_is_within_the_bound_of_the_exact_median(store, sales, dates, segment):
+    params = dict(segment, start_date=dates[0], end_date=dates[1], timeframe='quarterly',
+                  stats_to_calculate=['median_sold_price'])
+    median = store.analyze(params)['median_sold_price']
+    # The sketches cover sales in the selected windows, whatever their listing date
+    sold = sales[(sales['sold_date'] >= dates[0]) & (sales['sold_date'] <= get_last_day_of_quarter(pd.Timestamp(dates[1])))]
+    if segment.get('city'):
+        sold = sold[sold['city'] == segment['city']]
+    if segment.get('building_type'):
+        sold = sold[sold['type'] == segment['building_type']]
+    values = sold['sold_price'].to_numpy(dtype=float)
+    assert len(values) > 0
+    if len(values) <= DEFAULT_K:
+        assert median == pytest.approx(np.median(values))
+    else:
+        assert rank_error(values, median, 0.5) <= RANK_ERROR + 1 / len(values)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Data_Loader import DataLoader
+from repeat_sales import RepeatSalesIndex
+
+def sale_frames(first_number, parcels, sold_dates, seed):
+    """Listing, property and location rows for one sale of each parcel on each of `sold_dates`."""
+    rng = np.random.default_rng(seed)
+    num_rows = len(parcels)
+    listing_number = [f'RS{first_number + i}' for i in range(num_rows)]
+    sold_dates = pd.to_datetime(pd.Series(sold_dates))
+    years = (sold_dates.dt.year - 2010).to_numpy()
+    return {
+        'listing_details': pd.DataFrame({
+            'listing_number': listing_number,
+            'listing_date': sold_dates - pd.Timedelta(days=60),
+            'sold_date': sold_dates,
+            'sold_price': np.round(200000 * 1.05 ** years * rng.lognormal(0, 0.1, num_rows), -2)
+        }),
+        'properties': pd.DataFrame({'listing_number': listing_number, 'parcel_id': parcels}),
+        'location': pd.DataFrame({'listing_number': listing_number,
+                                  'city': [f'city {int(parcel[1:]) % 3}' for parcel in parcels]})
+    }
+
+def random_sales(first_number, num_rows, seed, first_day='2012-01-01', days=3000):
+    rng = np.random.default_rng(seed)
+    parcels = [f'P{parcel:05d}' for parcel in rng.integers(0, 300, num_rows)]
+    sold_dates = pd.Timestamp(first_day) + pd.to_timedelta(rng.integers(0, days, num_rows), unit='D')
+    return sale_frames(first_number, parcels, sold_dates, seed)
+
+@pytest.fixture
+def sales_loader(tmp_path):
+    data_loader = DataLoader(str(tmp_path / 'sales.db'))
+    data_loader.create_database()
+    data_loader.insert_listings(random_sales(0, 1500, seed=1, first_day='2016-01-01', days=1500))
+    return data_loader
+
+def assert_matches_rebuild(index, data_loader):
+    rebuilt = RepeatSalesIndex.build(data_loader)
+    assert len(index.pairs) == len(rebuilt.pairs)
+    levels, expected = index.get_levels(), rebuilt.get_levels()
+    assert levels[['group', 'period', 'num_pairs']].equals(expected[['group', 'period', 'num_pairs']])
+    np.testing.assert_allclose(levels['index'], expected['index'], rtol=1e-6)
+
+def test_refresh_adds_late_reported_sales(sales_loader):
+    index = RepeatSalesIndex.build(sales_loader)
+    # Sold before the latest indexed sale, and some on that very day
+    late = random_sales(10000, 400, seed=2, first_day='2012-01-01', days=1500)
+    last_day = index.last_sold_date
+    same_day = sale_frames(20000, ['P00001', 'P00002'], [last_day, last_day], seed=3)
+    for frames in (late, same_day):
+        sales_loader.insert_listings(frames)
+    assert index.refresh(sales_loader)
+    assert_matches_rebuild(index, sales_loader)
+
+def test_refresh_without_changes_is_a_no_op(sales_loader):
+    index = RepeatSalesIndex.build(sales_loader)
+    assert index.refresh(sales_loader) == set()
+
+def test_refresh_rebuilds_after_rewrites(sales_loader):
+    index = RepeatSalesIndex.build(sales_loader)
+    sales_loader.execute_query("UPDATE listing_details SET sold_price = sold_price * 1.5 "
+                               "WHERE sold_date < '2017-01-01'", commit=True)
+    index.refresh(sales_loader)
+    assert_matches_rebuild(index, sales_loader)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from analysis_kernels import ColumnarListings
+from batch_report import DATE_COLUMNS, get_required_columns
+from data_analysis import (get_first_day_of_month, get_first_day_of_quarter, get_first_day_of_year,
+                           get_last_day_of_month, get_last_day_of_quarter, get_last_day_of_year)
+from sql_analysis import get_period_windows
+
+# Statistics per period for charts. Each period's value is what analyze_real_estate_data gives
+# for that period's first and last day, so a chart point matches running the analysis for it.
+# Values go through an AnalysisCache, so widening or moving the range only computes the periods
+# that were not shown before.
+
+PERIOD_FUNCTIONS = {
+    'monthly': (get_first_day_of_month, get_last_day_of_month),
+    'quarterly': (get_first_day_of_quarter, get_last_day_of_quarter),
+    'annually': (get_first_day_of_year, get_last_day_of_year)
+}
+
+def period_windows(start_date, end_date, timeframe):
+    """(first day, last day) of every whole period of `timeframe` overlapping start_date..end_date."""
+    first_day_func, last_day_func = PERIOD_FUNCTIONS[timeframe]
+    start_date = pd.Timestamp(start_date).normalize()
+    end_date = pd.Timestamp(end_date).normalize()
+    if start_date > end_date:
+        return []
+    return get_period_windows(first_day_func(start_date), last_day_func(end_date), last_day_func)
+
+def contiguous_runs(indexes):
+    """Split sorted integers into runs of consecutive values."""
+    runs = []
+    for index in indexes:
+        if runs and index == runs[-1][-1] + 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+def period_params(params, window):
+    return dict(params, start_date=window[0].strftime('%Y-%m-%d'), end_date=window[1].strftime('%Y-%m-%d'))
+
+def flatten_results(results):
+    """One numeric value per series; quantile statistics become one series per quantile."""
+    row = {}
+    for stat, value in results.items():
+        if isinstance(value, dict):
+            for label, quantile in value.items():
+                row[f'{stat} {label}'] = quantile
+        else:
+            row[stat] = value
+    return {name: np.nan if value is None or isinstance(value, str) else float(value) for name, value in row.items()}
+
+def compute_series(analysis_cache, params, start_date, end_date, cancel_event=None, progress=None):
+    """
+    Return a frame with one row per period of params['timeframe'] between `start_date` and
+    `end_date`, indexed by the period's first day, and one column per statistic series.
+
+    Periods missing from `analysis_cache` are fetched one query per consecutive run and split by
+    listing date. Returns None when `cancel_event` is set. `progress(done, total)` is called as
+    periods are computed.
+    """
+    windows = period_windows(start_date, end_date, params['timeframe'])
+    analysis_cache.check_data_version()
+    results = []
+    missing = []
+    for index, window in enumerate(windows):
+        cached, pending = analysis_cache.lookup(period_params(params, window), check_version=False)
+        results.append(cached)
+        if pending:
+            missing.append(index)
+
+    columns = get_required_columns(params['stats_to_calculate'])
+    done = len(windows) - len(missing)
+    for run in contiguous_runs(missing):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        run_params = dict(params, start_date=windows[run[0]][0].strftime('%Y-%m-%d'),
+                          end_date=windows[run[-1]][1].strftime('%Y-%m-%d'))
+        df = analysis_cache.data_loader.fetch_filtered_data(run_params, columns=columns, cancel_event=cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        for column in DATE_COLUMNS & set(df.columns):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+        if len(df):
+            df = df.sort_values('listing_date', kind='stable', ignore_index=True)
+
+        # The fetch keeps listing dates from the first day to the end of the last, so each
+        # period's rows are a contiguous slice
+        bounds = [windows[index][0] for index in run] + [windows[run[-1]][1] + pd.Timedelta(days=1)]
+        offsets = np.searchsorted(df['listing_date'].to_numpy(), np.array(bounds, dtype='datetime64[ns]')) \
+            if len(df) else np.zeros(len(bounds), dtype=np.int64)
+        for position, index in enumerate(run):
+            listings = ColumnarListings(df.iloc[offsets[position]:offsets[position + 1]])
+            results[index] = analysis_cache.analyze(period_params(params, windows[index]), listings,
+                                                    check_version=False)
+            done += 1
+            if progress:
+                progress(done, len(windows))
+
+    rows = [flatten_results(result) for result in results]
+    index = pd.DatetimeIndex([window[0] for window in windows], name='period_start')
+    return pd.DataFrame(rows, index=index)
@@ -0,0 +1,138 @@
+from PyQt5.QtCore import QDate, QPointF, QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QWidget
+
+# NumPy is imported once there is a series to plot, keeping it off the UI's startup path
+
+EPOCH = QDate(1970, 1, 1)
+MARGINS = (10, 10, 24)  # top, right, bottom; the left margin fits a y-axis label
+WIDEST_LABEL = '000,000,000'
+ZOOM_STEP = 1.25
+MIN_VIEW_DAYS = 31
+
+def to_days(date):
+    """Days since 1970-01-01 of a QDate."""
+    return EPOCH.daysTo(date)
+
+def from_days(days):
+    return EPOCH.addDays(int(round(days)))
+
+def format_value(value):
+    return f'{value:,.0f}' if abs(value) >= 100 else f'{value:.3g}'
+
+class TimeSeriesChart(QWidget):
+    """
+    Line chart of one series against time, with the mouse wheel zooming and dragging panning.
+
+    Only the points inside the view are drawn, downsampled to about two per horizontal pixel,
+    so long series stay cheap to repaint. `view_changed(start, end)` reports the visible range
+    as QDates after every zoom or pan.
+    """
+    view_changed = pyqtSignal(QDate, QDate)
+
+    def __init__(self, parent=None, method='lttb'):
+        super().__init__(parent)
+        self.method = method
+        self.x = None
+        self.y = None
+        self.view = None
+        self.drag_origin = None
+        self.setMinimumHeight(180)
+
+    def set_series(self, days, values):
+        """Replace the plotted points; `days` are days since 1970-01-01 in increasing order."""
+        import numpy as np
+        self.x = np.asarray(days, dtype=np.float64)
+        self.y = np.asarray(values, dtype=np.float64)
+        self.update()
+
+    def set_view(self, start, end):
+        self.view = (float(to_days(start)), float(to_days(end)))
+        self.update()
+
+    def visible_range(self):
+        return from_days(self.view[0]), from_days(self.view[1])
+
+    def plot_rect(self):
+        top, right, bottom = MARGINS
+        left = self.fontMetrics().horizontalAdvance(WIDEST_LABEL) + 8
+        return QRectF(left, top, max(self.width() - left - right, 1), max(self.height() - top - bottom, 1))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        rect = self.plot_rect()
+        painter.setPen(QPen(Qt.gray))
+        painter.drawRect(rect)
+        if self.view is None or self.x is None:
+            return
+
+        import numpy as np
+        from downsampling import downsample
+        x_min, x_max = self.view
+        visible = np.flatnonzero((self.x >= x_min) & (self.x <= x_max))
+        if len(visible):
+            indices = visible[downsample(self.x[visible], self.y[visible], max(int(rect.width()) * 2, 2), self.method)]
+        else:
+            indices = visible
+        x = self.x[indices]
+        y = self.y[indices]
+
+        y_min, y_max = (float(y.min()), float(y.max())) if len(y) else (0.0, 1.0)
+        if y_min == y_max:
+            y_min, y_max = y_min - 1, y_max + 1
+        painter.setPen(QPen(Qt.darkGray))
+        painter.drawText(QRectF(0, rect.top(), rect.left() - 4, 16), Qt.AlignRight | Qt.AlignTop, format_value(y_max))
+        painter.drawText(QRectF(0, rect.bottom() - 16, rect.left() - 4, 16), Qt.AlignRight | Qt.AlignBottom,
+                         format_value(y_min))
+        painter.drawText(QRectF(rect.left(), rect.bottom() + 4, 100, 16), Qt.AlignLeft,
+                         from_days(x_min).toString('yyyy-MM-dd'))
+        painter.drawText(QRectF(rect.right() - 100, rect.bottom() + 4, 100, 16), Qt.AlignRight,
+                         from_days(x_max).toString('yyyy-MM-dd'))
+        if not len(x):
+            return
+
+        x_scale = rect.width() / max(x_max - x_min, 1)
+        y_scale = rect.height() / (y_max - y_min)
+        points = [QPointF(rect.left() + (px - x_min) * x_scale, rect.bottom() - (py - y_min) * y_scale)
+                  for px, py in zip(x, y)]
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setClipRect(rect)
+        painter.setPen(QPen(QColor(31, 119, 180), 1.5))
+        painter.drawPolyline(QPolygonF(points))
+        if len(points) <= rect.width() / 8:
+            for point in points:
+                painter.drawEllipse(point, 2, 2)
+
+    def change_view(self, x_min, x_max):
+        if x_max - x_min < MIN_VIEW_DAYS:
+            return
+        self.view = (x_min, x_max)
+        self.update()
+        self.view_changed.emit(*self.visible_range())
+
+    def wheelEvent(self, event):
+        if self.view is None:
+            return
+        rect = self.plot_rect()
+        x_min, x_max = self.view
+        anchor = x_min + (event.pos().x() - rect.left()) / rect.width() * (x_max - x_min)
+        factor = 1 / ZOOM_STEP if event.angleDelta().y() > 0 else ZOOM_STEP
+        self.change_view(anchor - (anchor - x_min) * factor, anchor + (x_max - anchor) * factor)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.view is not None:
+            self.drag_origin = (event.pos().x(), self.view)
+
+    def mouseMoveEvent(self, event):
+        if self.drag_origin is None:
+            return
+        origin_x, (x_min, x_max) = self.drag_origin
+        shift = (origin_x - event.pos().x()) / self.plot_rect().width() * (x_max - x_min)
+        self.view = (x_min + shift, x_max + shift)
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self.drag_origin is not None:
+            self.drag_origin = None
+            self.change_view(*self.view)
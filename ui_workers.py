@@ -0,0 +1,179 @@
+import logging
+import threading
+import traceback
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+from db_metadata import load_metadata
+
+# pandas and the modules built on it are imported by the workers that need them, on their
+# first run, so importing this module does not slow down the UI's startup
+
+LOAD_CHUNK_ROWS = 50000
+
+class WorkerCancelled(Exception):
+    """Raised inside a worker when cancellation was requested."""
+    pass
+
+class WorkerSignals(QObject):
+    """
+    Signals emitted by a worker. They are queued to the thread that created the worker, so
+    connected slots run on the GUI thread.
+    """
+    progress = pyqtSignal(dict)
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    finished = pyqtSignal()
+
+class Worker(QRunnable):
+    """
+    Runs `work()` on a QThreadPool thread and reports through `signals`.
+
+    Cancellation is cooperative: `cancel()` sets a flag that `work()` checks between steps.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.signals = WorkerSignals()
+        self.cancel_event = threading.Event()
+        self.running = False
+        # The pool must not delete the runnable while the UI still holds it
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise WorkerCancelled()
+
+    def emit_progress(self, **progress):
+        self.signals.progress.emit(progress)
+
+    def work(self):
+        raise NotImplementedError
+
+    def run(self):
+        self.running = True
+        try:
+            result = self.work()
+        except WorkerCancelled:
+            logging.info(f"{type(self).__name__} cancelled.")
+            self.signals.cancelled.emit()
+        except Exception as e:
+            logging.error(f"{type(self).__name__} failed: {e}\n{traceback.format_exc()}")
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.running = False
+            self.signals.finished.emit()
+
+class IngestWorker(Worker):
+    """
+    Reads, cleans and loads CSV exports into `db_file` through process_and_load_data.
+
+    Files are written LOAD_CHUNK_ROWS rows at a time and progress is emitted as its
+    IngestProgress events. Cancelling stops at the next chunk or cleaning step; chunks already
+    written stay in the database.
+    """
+
+    def __init__(self, filepaths, db_file, create_new_db=False):
+        super().__init__()
+        self.filepaths = filepaths
+        self.db_file = db_file
+        self.create_new_db = create_new_db
+
+    def work(self):
+        from Clean_And_Process2 import IngestCancelled, process_and_load_data
+
+        try:
+            rows_written = process_and_load_data(self.filepaths, self.db_file, self.create_new_db,
+                                                 progress=lambda event: self.emit_progress(**event),
+                                                 cancel_event=self.cancel_event, load_chunk_rows=LOAD_CHUNK_ROWS)
+        except IngestCancelled:
+            raise WorkerCancelled()
+        return {'files': len(self.filepaths), 'rows_written': rows_written}
+
+class AnalysisWorker(Worker):
+    """
+    Computes the selected statistics through an AnalysisCache one statistic at a time.
+
+    Cached statistics are answered without touching the database; otherwise only the columns
+    the statistics need are fetched, once, and shared across them. Cancelling interrupts that
+    fetch inside SQLite.
+    """
+
+    def __init__(self, analysis_cache, params, interactive=True):
+        super().__init__()
+        self.analysis_cache = analysis_cache
+        self.params = params
+        # False for recomputes started by a filter change rather than the Analyze button
+        self.interactive = interactive
+
+    def fetch_listings(self, stats_to_calculate):
+        import pandas as pd
+        from batch_report import DATE_COLUMNS, get_required_columns
+
+        df = self.analysis_cache.data_loader.fetch_filtered_data(
+            self.params, columns=get_required_columns(stats_to_calculate), cancel_event=self.cancel_event)
+        self.check_cancelled()
+        for column in DATE_COLUMNS & set(df.columns):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+        return df
+
+    def work(self):
+        from analysis_kernels import ColumnarListings
+
+        stats_to_calculate = self.params.get('stats_to_calculate') or []
+        backend = self.params.get('backend') or 'numpy'
+        listings = None
+        results = {}
+        for index, stat in enumerate(stats_to_calculate):
+            self.check_cancelled()
+            params = dict(self.params, stats_to_calculate=[stat])
+            if listings is None and backend not in ('sql', 'cube') and not self.analysis_cache.is_cached(params, stat):
+                self.emit_progress(stage='fetch', done=index, total=len(stats_to_calculate))
+                df = self.fetch_listings(stats_to_calculate)
+                if df.empty:
+                    return None
+                # The kernels build their column arrays once for every statistic
+                listings = ColumnarListings(df) if backend == 'numpy' else df
+                self.check_cancelled()
+            results.update(self.analysis_cache.analyze(params, listings))
+            self.emit_progress(stage='statistic', statistic=stat, done=index + 1, total=len(stats_to_calculate))
+        return results
+
+class MetadataWorker(Worker):
+    """Loads the dropdown values and date bounds of `db_file` from its cached metadata file."""
+
+    def __init__(self, db_file):
+        super().__init__()
+        self.db_file = db_file
+
+    def work(self):
+        return load_metadata(self.db_file)
+
+class SeriesWorker(Worker):
+    """
+    Computes the per-period chart series of the selected statistics between `start_date` and
+    `end_date` through an AnalysisCache, so only periods not computed before are fetched.
+    """
+
+    def __init__(self, analysis_cache, params, start_date, end_date):
+        super().__init__()
+        self.analysis_cache = analysis_cache
+        self.params = params
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def work(self):
+        from time_series import compute_series
+
+        series = compute_series(self.analysis_cache, self.params, self.start_date, self.end_date,
+                                cancel_event=self.cancel_event,
+                                progress=lambda done, total: self.emit_progress(stage='series', done=done, total=total))
+        self.check_cancelled()
+        return series